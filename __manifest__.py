@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 {
     "name": "mssql_bridge",
-    "version": "18.0.1.1.5",
+    "version": "18.0.1.5.0",
     "summary": "MSSQL Receivables Dashboard & Charts",
     "license": "LGPL-3",
     "depends": ["base", "web"],
 
     "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "views/menu_action.xml",
         "views/recv_dashboard_templates.xml",
         "views/recv_charts_templates.xml",
@@ -18,6 +20,7 @@
         "web.assets_backend": [
             # styles
             "mssql_bridge/static/src/scss/recv_dashboard.scss",
+            "mssql_bridge/static/src/scss/recv_bucket.scss",
 
             # libs (scoped, not global)
             "mssql_bridge/static/lib/chartjs/chart.umd.js",
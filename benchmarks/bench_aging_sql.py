@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Compare the old per-row date arithmetic with the bridge's sargable bucket SQL.
+
+SQLite stands in for SQL Server: the stand-in schema carries the AROBL/ARCUS
+columns the bridge queries use, indexed on IDCUST and DATEDUE. The new form
+is built from the bridge itself (``bucket_predicate``, ``bucket_case`` and
+``OPEN_ITEM_FILTER`` in models/bridge.py), so what is checked is the SQL the
+module sends. For each bucket the script checks that both forms return the
+same per-bucket sums, and that the grouped ``bucket_case`` agrees with the old
+CASE (documents without a valid DATEDUE included: both age them 90+), then
+reports the query plan and timing of each form as JSON.
+
+Needs Odoo importable (to load the addon), but no database or SQL Server:
+
+    python benchmarks/bench_aging_sql.py -c odoo.conf --rows 200000 --today 2025-06-30
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_sage  # noqa: E402
+
+BUCKETS = ("current", "d0_30", "d31_60", "d61_90", "d90p")
+
+# --- old form: convert DATEDUE to a date and DATEDIFF it, row by row --------
+_DUE_AS_DATE = ("date(printf('%04d-%02d-%02d', bl.DATEDUE / 10000, "
+                "(bl.DATEDUE / 100) % 100, bl.DATEDUE % 100))")
+_AGE = f"CAST(julianday(:today) - julianday({_DUE_AS_DATE}) AS INTEGER)"
+_FORCED = "((bl.IDINVC LIKE 'P%' OR bl.IDINVC LIKE 'C%') AND bl.AMTDUEHC < 0)"
+
+OLD_CASE = f"""
+    CASE
+        WHEN {_FORCED} THEN 'current'
+        WHEN {_AGE} < 0 THEN 'current'
+        WHEN {_AGE} BETWEEN 0 AND 30 THEN 'd0_30'
+        WHEN {_AGE} BETWEEN 31 AND 60 THEN 'd31_60'
+        WHEN {_AGE} BETWEEN 61 AND 90 THEN 'd61_90'
+        ELSE 'd90p'
+    END"""
+
+# --- new form: the bridge's predicates against boundaries computed once ------
+# The bridge's BOUNDS_JOIN derives d_today ... d_90 from GETDATE() and SQL
+# Server folds it into runtime constants; SQLite has no GETDATE(), so the
+# stand-in binds the same values as parameters.
+SQLITE_BOUNDS_JOIN = "CROSS JOIN (SELECT :d_today AS d_today, :d_30 AS d_30, :d_60 AS d_60, :d_90 AS d_90) bd"
+
+
+def bounds(today, boundaries=(30, 60, 90)):
+    """SQLITE_BOUNDS_JOIN parameters; other ``boundaries`` (days) fill the same three slots."""
+    ymd = lambda d: int(d.strftime("%Y%m%d"))  # noqa: E731
+    values = {"d_today": ymd(today)}
+    for key, days in zip(("d_30", "d_60", "d_90"), boundaries):
+        values[key] = ymd(today - timedelta(days=days))
+    return values
+
+
+def new_form():
+    """``(open item filter, {bucket: predicate}, bucket CASE)`` of models/bridge.py, for alias ``bl``."""
+    from odoo.addons.mssql_bridge.models import bridge
+
+    return (
+        bridge.OPEN_ITEM_FILTER.format(a="bl"),
+        {bucket: bridge.bucket_predicate("bl", bucket) for bucket in BUCKETS},
+        bridge.bucket_case("bl"),
+    )
+
+
+SCHEMA = """
+    CREATE TABLE ARCUS (IDCUST TEXT PRIMARY KEY, NAMECUST TEXT);
+    CREATE TABLE AROBL (
+        IDCUST TEXT, IDINVC TEXT, CNTPAYM INTEGER, DATEDUE INTEGER,
+        AMTDUEHC NUMERIC, SWPAID INTEGER, IDORDERNBR TEXT, IDCUSTPO TEXT, DESCINVC TEXT
+    );
+"""
+
+
+def build_fixture(conn, rows, customers, today, seed):
+    rnd = random.Random(seed)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO ARCUS VALUES (?, ?)",
+                     [("C%05d" % i, "Customer %05d" % i) for i in range(customers)])
+    batch = []
+    for n in range(rows):
+        due = today + timedelta(days=rnd.randint(-400, 60))
+        amount = round(rnd.uniform(-500, 5000), 3)
+        prefix = rnd.choice("IIIIIIPC")
+        # A few documents without a usable due date: NULL, 0 or garbage
+        undated = rnd.random()
+        batch.append((
+            "C%05d" % min(int(rnd.paretovariate(1.2)) - 1, customers - 1),
+            "%s%08d" % (prefix, n),
+            1,
+            (None if undated < 0.004 else 0 if undated < 0.008 else 99 if undated < 0.01
+             else int(due.strftime("%Y%m%d"))),
+            amount,
+            1 if rnd.random() < 0.3 else 0,
+            "ORD%06d" % n, "PO%06d" % n, "Invoice %d" % n,
+        ))
+    conn.executemany("INSERT INTO AROBL VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.executescript("""
+        CREATE INDEX arobl_cust ON AROBL (IDCUST);
+        CREATE INDEX arobl_due ON AROBL (DATEDUE);
+        ANALYZE;
+    """)
+
+
+def _plan(conn, sql, params):
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def _timed(conn, sql, params, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(rows, customers, today, repeat, seed):
+    open_items, predicates, case = new_form()
+    conn = sqlite3.connect(":memory:")
+    build_fixture(conn, rows, customers, today, seed)
+    params = dict(bounds(today), today=today.isoformat(), code="C00001")
+    report = {"rows": rows, "customers": customers, "today": today.isoformat(), "buckets": {}}
+
+    for bucket in BUCKETS:
+        old_sql = (f"SELECT COUNT(*), ROUND(SUM(bl.AMTDUEHC), 3) FROM AROBL bl "
+                   f"WHERE {open_items} AND {OLD_CASE} = :bucket")
+        new_sql = (f"SELECT COUNT(*), ROUND(SUM(bl.AMTDUEHC), 3) FROM AROBL bl {SQLITE_BOUNDS_JOIN} "
+                   f"WHERE {open_items} AND {predicates[bucket]}")
+        p = dict(params, bucket=bucket)
+        old_t, old_r = _timed(conn, old_sql, p, repeat)
+        new_t, new_r = _timed(conn, new_sql, p, repeat)
+        if old_r != new_r:
+            raise SystemExit("bucket %s differs: old=%r new=%r" % (bucket, old_r, new_r))
+        report["buckets"][bucket] = {
+            "count": old_r[0][0],
+            "sum": old_r[0][1],
+            "old_ms": round(old_t * 1000, 3),
+            "new_ms": round(new_t * 1000, 3),
+            "old_plan": _plan(conn, old_sql, p),
+            "new_plan": _plan(conn, new_sql, p),
+        }
+
+    # One pass bucketing every open item, as the aging query does
+    old_sql = (f"SELECT {OLD_CASE} AS bucket, COUNT(*), ROUND(SUM(bl.AMTDUEHC), 3) FROM AROBL bl "
+               f"WHERE {open_items} GROUP BY bucket ORDER BY bucket")
+    new_sql = (f"SELECT {case} AS bucket, COUNT(*), ROUND(SUM(bl.AMTDUEHC), 3) FROM AROBL bl {SQLITE_BOUNDS_JOIN} "
+               f"WHERE {open_items} GROUP BY bucket ORDER BY bucket")
+    old_t, old_r = _timed(conn, old_sql, params, repeat)
+    new_t, new_r = _timed(conn, new_sql, params, repeat)
+    if old_r != new_r:
+        raise SystemExit("bucket_case differs: old=%r new=%r" % (old_r, new_r))
+    report["bucket_case"] = {"old_ms": round(old_t * 1000, 3), "new_ms": round(new_t * 1000, 3)}
+
+    # No valid due date (NULL, 0, garbage): 90+ days unless forced current
+    undated = conn.execute(
+        f"SELECT {case}, COUNT(*) FROM AROBL bl {SQLITE_BOUNDS_JOIN} WHERE {open_items} "
+        f"AND (bl.DATEDUE IS NULL OR bl.DATEDUE < 10000101) AND NOT {_FORCED} GROUP BY 1",
+        params,
+    ).fetchall()
+    if {bucket for bucket, _count in undated} - {"d90p"}:
+        raise SystemExit("undated documents outside d90p: %r" % undated)
+    report["undated"] = sum(count for _bucket, count in undated)
+
+    old_sql = (f"SELECT COUNT(*) FROM AROBL bl WHERE {open_items} "
+               f"AND trim(bl.IDCUST) = trim(:code) AND {OLD_CASE} = 'd0_30'")
+    new_sql = (f"SELECT COUNT(*) FROM AROBL bl {SQLITE_BOUNDS_JOIN} WHERE {open_items} "
+               f"AND bl.IDCUST = :code AND {predicates['d0_30']}")
+    old_t, old_r = _timed(conn, old_sql, params, repeat)
+    new_t, new_r = _timed(conn, new_sql, params, repeat)
+    if old_r != new_r:
+        raise SystemExit("customer filter differs: old=%r new=%r" % (old_r, new_r))
+    report["customer_filter"] = {
+        "count": old_r[0][0],
+        "old_ms": round(old_t * 1000, 3),
+        "new_ms": round(new_t * 1000, 3),
+        "old_plan": _plan(conn, old_sql, params),
+        "new_plan": _plan(conn, new_sql, params),
+    }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-c", "--config", help="Odoo configuration file (addons path)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--today", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    # The bridge imports pyodbc at load time; nothing connects to a server here
+    sys.modules.setdefault("pyodbc", fake_sage.FakePyodbc(None, None))
+
+    import odoo
+
+    odoo.tools.config.parse_config(["-c", args.config] if args.config else [])
+    report = run(args.rows, args.customers, args.today, args.repeat, args.seed)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
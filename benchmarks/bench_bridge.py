@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Time the bridge and the page logic against a synthetic Sage 300 ledger.
+
+pyodbc is replaced by benchmarks/fake_sage.py, so no SQL Server is needed;
+what is measured is the Odoo side: row decoding in the ``get_*`` methods,
+``_aggregate_totals`` and the controller code behind the bucket and charts
+pages. The open item store is loaded and re-bucketed for other as-of dates
+(``aging_store[...]`` cases) and its aging for today is checked against the
+query's (``store_consistent``). The same reads are then timed against the
+PostgreSQL mirror (``mirror:`` cases, after a full and an incremental sync),
+and the mirror's aging is checked against the MSSQL path
+(``mirror_consistent``).
+Everything runs in one transaction that is rolled back at the end.
+
+Needs an Odoo database with mssql_bridge installed:
+
+    python benchmarks/bench_bridge.py -c odoo.conf -d bench \\
+        --sizes 1000,10000,100000,1000000 --out bench.json
+
+or, from ``odoo-bin shell``:
+
+    import runpy
+    runpy.run_path("benchmarks/bench_bridge.py")["run"](env, sizes=[1000, 10000])
+
+``--baseline old.json`` compares with a previous report and exits with
+status 1 when a case got slower than ``--tolerance`` (default 20%).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_sage  # noqa: E402
+
+BENCH_PARAMS = {
+    "mssql.server": "fake-sage",
+    "mssql.database": "BENCH",
+    "mssql.username": "bench",
+    "mssql.password": "bench",
+    "mssql.aging_cache_ttl": "0",      # every call goes to the (fake) server
+    "mssql.aging_cache_dir": False,
+    "mssql.aging_incremental": False,
+    "mssql.slow_query_ms": "0",
+    "mssql.source": "mssql",
+}
+
+
+def make_classifier():
+    """Map the bridge's SQL statements to fake_sage.Ledger result sets."""
+    from odoo.addons.mssql_bridge.models import aging_mirror, bridge
+
+    exact = {
+        bridge.OPEN_ITEMS_SQL: ("open_items", 0),
+        bridge.STORE_ITEMS_SQL: ("store_items", 0),
+        bridge.WATERMARK_SQL: ("watermark", 0),
+        bridge.CHANGED_ITEMS_SQL: ("changed_items", 1),
+        aging_mirror.MIRROR_ITEMS_SQL: ("mirror_items", 0),
+        aging_mirror.MIRROR_CHANGED_ITEMS_SQL: ("mirror_changed_items", 1),
+        aging_mirror.MIRROR_CUSTOMERS_SQL: ("mirror_customers", 0),
+        aging_mirror.MIRROR_CHANGED_CUSTOMERS_SQL: ("mirror_changed_customers", 1),
+        aging_mirror.CUSTOMER_WATERMARK_SQL: ("customer_watermark", 0),
+    }
+    by_bucket = {bridge.bucket_invoices_sql(b): b for b in (None,) + bridge.BUCKET_KEYS}
+    predicates = {bridge.bucket_predicate("bl", b): b for b in bridge.BUCKET_KEYS}
+
+    def bucket_in(sql):
+        return next((b for p, b in predicates.items() if p in sql), None)
+
+    def classify(sql, params):
+        if sql in exact:
+            kind, arity = exact[sql]
+            return kind, params[1:] if arity else ()
+        if sql in by_bucket:
+            return "bucket_invoices", (by_bucket[sql],)
+        if "GETDATE(), 112)" in sql and "FROM" not in sql:
+            return "server_date", ()
+        if "total_amt" in sql:
+            return "aging", ()
+        if "bl.IDCUST IN (?" in sql:
+            return "batch_invoices", (params, bucket_in(sql))
+        if "bl.IDCUST = ?" in sql:
+            return "customer_invoices", (params[0], bucket_in(sql))
+        raise fake_sage.Error("fake_sage: unrecognised statement:\n%s" % sql)
+
+    return classify
+
+
+def _timed(fn, repeat):
+    fn()  # warm-up: fills the fake server's result cache
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }, result
+
+
+def _count(result):
+    if isinstance(result, dict):
+        for key in ("rows", "customers"):
+            if key in result:
+                return len(result[key])
+        return len(result)
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def _bucket_page(api, Bridge, bucket):
+    values = api._bucket_page_values(Bridge, bucket, force=True)
+    _snap, _inv_snap, index, _version = api._bucket_index(Bridge, bucket)
+    index.groups(index.full)
+    index.rows_at(index.full, 0)
+    return {"rows": range(values["invoice_count"])}
+
+
+def _reset_pools():
+    from odoo.addons.mssql_bridge.models import mssql_pool
+
+    for pool in list(mssql_pool._pools.values()):
+        pool.close()
+    mssql_pool._pools.clear()
+    mssql_pool._current.clear()
+
+
+def bench_size(env, items, repeat, seed, today):
+    from odoo.addons.mssql_bridge.controllers import api
+    from odoo.addons.mssql_bridge.models import aging_incremental, mssql_pool
+
+    ledger = fake_sage.Ledger(items, today=today, seed=seed)
+    fake = fake_sage.FakePyodbc(ledger, make_classifier())
+    _reset_pools()
+    mssql_pool.pyodbc = fake
+
+    Bridge = env["mssql.bridge"].sudo()
+    Snapshot = env["mssql.aging.snapshot"].sudo()
+    biggest = ledger.customer_sizes()
+    aging_rows = Bridge.get_aging_by_customer()
+
+    cases = {
+        "get_aging_by_customer": Bridge.get_aging_by_customer,
+        "get_invoices_basic_by_customer[top]": lambda: Bridge.get_invoices_basic_by_customer(biggest[0]),
+        "get_invoices_basic_by_customer[median]":
+            lambda: Bridge.get_invoices_basic_by_customer(biggest[len(biggest) // 2]),
+        "get_invoices_basic_by_customers[top100]":
+            lambda: Bridge.get_invoices_basic_by_customers(biggest[:100]),
+        "_aggregate_totals": lambda: api._aggregate_totals(aging_rows),
+        "export_all": lambda: sum(1 for _row in api._export_rows(Bridge.iter_invoices_by_bucket(None))),
+        "get_open_item_store": Bridge.get_open_item_store,
+    }
+    for b in fake_sage.BUCKETS:
+        cases["get_invoices_by_bucket[%s]" % b] = lambda b=b: Bridge.get_invoices_by_bucket(b)
+        # Page shell plus the groups and first window of rows recv_bucket.js asks for
+        cases["recv_bucket_page[%s]" % b] = lambda b=b: _bucket_page(api, Bridge, b)
+
+    report = {"items": items, "customers": ledger.customers, "cases": {}}
+    for name, fn in cases.items():
+        timing, result = _timed(fn, repeat)
+        report["cases"][name] = dict(timing, rows=_count(result))
+
+    # As-of aging, re-bucketed in memory (no query)
+    store = Bridge.get_open_item_store()
+    month_end = today.replace(day=1) - timedelta(days=1)
+    as_of_cases = {
+        "aging_store[today]": lambda: store.aging(today),
+        "aging_store[month_end]": lambda: store.aging(month_end),
+        "aging_store[month_end,15/45/75]": lambda: store.aging(month_end, (15, 45, 75)),
+    }
+    for name, fn in as_of_cases.items():
+        timing, result = _timed(fn, repeat)
+        report["cases"][name] = dict(timing, rows=_count(result))
+    report["store_consistent"] = not aging_incremental.diff_rows(aging_rows, store.aging(today))
+
+    # Same reads from the PostgreSQL mirror (mssql.source = mirror)
+    ICP = env["ir.config_parameter"].sudo()
+    Sync = env["mssql.mirror.sync"].sudo()
+    timing, _result = _timed(lambda: Sync.sync(full=True), repeat)
+    report["cases"]["mirror_sync[full]"] = dict(timing, rows=len(ledger.open_docs()))
+    timing, result = _timed(Sync.sync, repeat)
+    report["cases"]["mirror_sync[incremental]"] = dict(timing, rows=sum(r["changed"] for r in result.values()))
+    report["mirror_consistent"] = Bridge.check_mirror_consistency(sync=False)["ok"]
+    ICP.set_param("mssql.source", "mirror")
+    try:
+        for name, fn in cases.items():
+            if name != "_aggregate_totals":
+                timing, result = _timed(fn, repeat)
+                report["cases"]["mirror:" + name] = dict(timing, rows=_count(result))
+    finally:
+        ICP.set_param("mssql.source", "mssql")
+
+    # Charts: live fallback first, then from a stored daily snapshot
+    env.cr.execute("DELETE FROM mssql_aging_snapshot")
+    Snapshot.invalidate_model()
+    timing, _result = _timed(lambda: api._charts_data(Snapshot, Bridge, force=True), repeat)
+    report["cases"]["recv_charts_page[live]"] = dict(timing, rows=len(aging_rows))
+    Snapshot._cron_take_snapshot()
+    timing, _result = _timed(lambda: api._charts_data(Snapshot, Bridge, force=True), repeat)
+    report["cases"]["recv_charts_page[snapshot]"] = dict(timing, rows=len(aging_rows))
+
+    report["fake_server"] = {"connects": fake.connects, "queries": fake.queries}
+    return report
+
+
+def run(env, sizes=(1000, 10000, 100000), repeat=5, seed=42, today=None):
+    """Benchmark every ledger size inside one transaction, then roll it back."""
+    from odoo.addons.mssql_bridge.models import mssql_pool
+    from odoo.addons.mssql_bridge.models.aging_cache import snapshot_cache
+
+    ICP = env["ir.config_parameter"].sudo()
+    today = today or date.today()
+    manifest = env["ir.module.module"].sudo().search([("name", "=", "mssql_bridge")], limit=1)
+    report = {
+        "module_version": manifest.installed_version or manifest.latest_version,
+        "python": platform.python_version(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "today": today.isoformat(),
+        "repeat": repeat,
+        "seed": seed,
+        "sizes": [],
+    }
+    real_pyodbc = mssql_pool.pyodbc
+    try:
+        for key, value in BENCH_PARAMS.items():
+            ICP.set_param(key, value)
+        for items in sizes:
+            report["sizes"].append(bench_size(env, items, repeat, seed, today))
+    finally:
+        env.cr.rollback()
+        # Leave a shell session talking to the real server again
+        _reset_pools()
+        mssql_pool.pyodbc = real_pyodbc
+        snapshot_cache.invalidate()
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Cases whose median got slower than the baseline by more than ``tolerance``."""
+    old = {(s["items"], name): case["median_ms"]
+           for s in baseline.get("sizes", []) for name, case in s["cases"].items()}
+    regressions = []
+    for s in report["sizes"]:
+        for name, case in s["cases"].items():
+            before = old.get((s["items"], name))
+            if before and case["median_ms"] > before * (1 + tolerance):
+                regressions.append({"items": s["items"], "case": name,
+                                    "before_ms": before, "after_ms": case["median_ms"]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-c", "--config", help="Odoo configuration file")
+    parser.add_argument("-d", "--database", required=True)
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated numbers of open items (1000 to 1000000)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    # The bridge imports pyodbc at load time; the fake is patched in per size
+    sys.modules.setdefault("pyodbc", fake_sage.FakePyodbc(None, None))
+
+    import odoo
+    from odoo.modules.registry import Registry
+
+    odoo.tools.config.parse_config(["-c", args.config] if args.config else [])
+    with Registry(args.database).cursor() as cr:
+        env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        report = run(env, [int(s) for s in args.sizes.split(",") if s.strip()],
+                     repeat=args.repeat, seed=args.seed, today=args.today)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            report["regressions"] = compare(report, json.load(fh), args.tolerance)
+        status = 1 if report["regressions"] else 0
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+            fh.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
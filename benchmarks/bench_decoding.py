@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Compare the former per-row invoice decoding with models/row_decoding.py.
+
+Rows come from the fake_sage ledger in bucket_invoices_sql() layout, served
+by its pyodbc-like cursor. For each variant the script checks that the output
+equals the legacy loop's, then reports time and tracemalloc peak as JSON:
+
+- legacy:        fetchall() then one dict per row with hasattr/str/float calls
+- dicts:         RowSpec, fetchmany batches, date objects (no driver converter)
+- dicts_iso:     same, dates already ISO strings (DATE output converter)
+- tuples_iso:    header + tuples, as the compact JSON payloads use
+
+plus the DATE output converter itself against building ``datetime.date``.
+Runs without Odoo:
+
+    python benchmarks/bench_decoding.py --rows 200000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import struct
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import fake_sage  # noqa: E402
+
+
+def _load_row_decoding():
+    # Loaded by path: importing the addon package would need Odoo
+    path = os.path.join(HERE, os.pardir, "models", "row_decoding.py")
+    spec = importlib.util.spec_from_file_location("row_decoding", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+rd = _load_row_decoding()
+
+# Same columns as bridge.BUCKET_INVOICE_SPEC
+SPEC = rd.RowSpec((
+    ("customer_code", rd.STRIP),
+    ("customer_name", rd.RAW_TEXT),
+    ("IDINV", rd.TEXT),
+    ("DATEINVC", rd.ISO_DATE),
+    ("DUE_DATE", rd.ISO_DATE),
+    ("IDORDERNBR", rd.TEXT),
+    ("IDCUSTPO", rd.TEXT),
+    ("DESCINVC", rd.RAW_TEXT),
+    ("AMTINVCHC", rd.AMOUNT),
+    ("bucket", None),
+))
+
+
+def legacy(cur):
+    """The loop get_invoices_by_bucket used before row_decoding."""
+    rows = []
+    for rec in cur.fetchall():
+        (customer_code, customer_name, IDINV, DATEINVC, DUE_DATE,
+         IDORDERNBR, IDCUSTPO, DESCINVC, AMTINVCHC, _bucket) = rec
+        rows.append({
+            "customer_code": (customer_code or "").strip(),
+            "customer_name": customer_name or "",
+            "IDINV": str(IDINV or ""),
+            "DATEINVC": DATEINVC.isoformat() if hasattr(DATEINVC, "isoformat") else (
+                str(DATEINVC) if DATEINVC else ""),
+            "DUE_DATE": DUE_DATE.isoformat() if hasattr(DUE_DATE, "isoformat") else (
+                str(DUE_DATE) if DUE_DATE else ""),
+            "IDORDERNBR": str(IDORDERNBR or ""),
+            "IDCUSTPO": str(IDCUSTPO or ""),
+            "DESCINVC": DESCINVC or "",
+            "AMTINVCHC": float(AMTINVCHC or 0.0),
+        })
+    return rows
+
+
+class _Server:
+    def __init__(self, result):
+        self.result = result
+
+    def run(self, sql, params):
+        return self.result
+
+
+def _cursor(result):
+    cur = fake_sage.FakeCursor(_Server(result))
+    cur.execute("SELECT")
+    return cur
+
+
+def _measure(fn, result, repeat):
+    samples = []
+    for _ in range(repeat):
+        cur = _cursor(result)
+        start = time.perf_counter()
+        out = fn(cur)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    cur = _cursor(result)
+    tracemalloc.start()
+    fn(cur)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "peak_kb": round(peak / 1024.0, 1),
+    }
+
+
+def run(rows, repeat, batch_size, seed):
+    ledger = fake_sage.Ledger(rows, seed=seed)
+    cols, raw = ledger.bucket_invoices(None)
+    # What the cursor returns once the DATE output converter is installed
+    iso = [r[:3] + (rd._iso(r[3]) if r[3] else None, rd._iso(r[4]) if r[4] else None) + r[5:] for r in raw]
+
+    report = {"rows": len(raw), "batch_size": batch_size, "repeat": repeat, "variants": {}}
+    expected, report["variants"]["legacy"] = _measure(legacy, (cols, raw), repeat)
+    variants = {
+        "dicts": (lambda cur: SPEC.dicts(cur, batch_size), raw),
+        "dicts_iso": (lambda cur: SPEC.dicts(cur, batch_size), iso),
+        "tuples_iso": (lambda cur: SPEC.tuples(cur, batch_size), iso),
+    }
+    for name, (fn, data) in variants.items():
+        out, stats = _measure(fn, (cols, data), repeat)
+        if name.startswith("tuples"):
+            out = [dict(zip(SPEC.header, t)) for t in out]
+        if out != expected:
+            raise SystemExit("%s output differs from the legacy loop" % name)
+        report["variants"][name] = stats
+
+    # DATE column: driver struct -> ISO string, versus date object -> isoformat()
+    packed = [struct.pack("<hHH", d.year, d.month, d.day)
+              for d in (r[3] for r in raw) if d is not None]
+    timings = {}
+    for name, fn in (
+        ("struct_to_iso", rd._date_from_odbc),
+        ("date_then_isoformat", lambda b: date(*struct.unpack("<hHH", b)).isoformat()),
+    ):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            list(map(fn, packed))
+        timings[name + "_ms"] = round((time.perf_counter() - start) * 1000.0 / repeat, 3)
+    report["date_converter"] = dict(timings, values=len(packed))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=rd.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    json.dump(run(args.rows, args.repeat, args.batch_size, args.seed), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
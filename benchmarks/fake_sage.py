@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""Synthetic Sage 300 receivables ledger behind a pyodbc look-alike.
+
+``Ledger`` generates AROBL/ARCUS rows with a skewed customer distribution (a
+few customers own most of the open items, as in real books). ``FakePyodbc``
+answers the bridge's queries from it: a ``classify(sql)`` callable supplied by
+the caller maps each statement to a query kind, the matching result set is
+computed once and then served from memory, so repeated timings measure the
+Odoo side (decoding, aggregation, controllers) and not this stand-in.
+
+Values come back with the types and padding pyodbc returns for Sage 300:
+CHAR keys right-padded, DECIMAL amounts as ``Decimal``, DATEDUE as a
+``Decimal`` yyyymmdd number, converted dates as ``datetime.date``.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+BUCKETS = ("current", "d0_30", "d31_60", "d61_90", "d90p")
+
+# Column widths of the Sage 300 CHAR columns
+IDCUST_WIDTH = 12
+IDINVC_WIDTH = 22
+NAMECUST_WIDTH = 60
+
+MILLI = Decimal("0.001")
+
+
+def _ymd(d):
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def _date(ymd):
+    if not ymd:
+        return None
+    return date(ymd // 10000, (ymd // 100) % 100, ymd % 100)
+
+
+class Ledger:
+    """Open (and some paid) AROBL documents of ``customers`` ARCUS customers.
+
+    Document tuple: ``(idcust, idinvc, cntpaym, datedue, amount, swpaid,
+    idordernbr, idcustpo, descinvc, audtdate, audttime)``.
+    """
+
+    def __init__(self, items, customers=None, today=None, skew=3.0, paid_ratio=0.1, seed=42):
+        rnd = random.Random(seed)
+        self.today = today or date.today()
+        self.customers = customers or max(50, items // 50)
+        self.names = {
+            "C%07d" % i: ("Customer %07d" % i).ljust(NAMECUST_WIDTH)
+            for i in range(self.customers)
+        }
+        codes = sorted(self.names)
+        # ARCUS AUDTDATE / AUDTTIME per customer
+        self.customer_audt = {
+            code: (Decimal(_ymd(self.today - timedelta(days=i * 7 % 700))), Decimal(i))
+            for i, code in enumerate(codes)
+        }
+        self.docs = []
+        total = items + int(items * paid_ratio)
+        for n in range(total):
+            # u ** skew piles the documents onto the first customers
+            code = codes[int(self.customers * rnd.random() ** skew)]
+            prefix = rnd.choice("IIIIIIIIDPC")
+            amount = Decimal(str(round(rnd.uniform(-300, 5000), 3))).quantize(MILLI)
+            if prefix in "PC":
+                amount = -abs(amount)
+            due = self.today + timedelta(days=rnd.randint(-540, 60))
+            audt = self.today - timedelta(days=rnd.randint(0, 700))
+            self.docs.append((
+                code.ljust(IDCUST_WIDTH),
+                ("%s%09d" % (prefix, n)).ljust(IDINVC_WIDTH),
+                1,
+                Decimal(0 if rnd.random() < 0.005 else _ymd(due)),
+                amount,
+                1 if n >= items else 0,
+                "ORD%08d" % n,
+                "PO%08d" % n,
+                "Invoice %d" % n,
+                Decimal(_ymd(audt)),
+                Decimal(rnd.randint(0, 23595999)),
+            ))
+        self.bounds = (_ymd(self.today),) + tuple(
+            _ymd(self.today - timedelta(days=d)) for d in (30, 60, 90)
+        )
+        self._open = None
+
+    # ---------------------------------------------------------------------
+    # "Server side" rules (kept independent from the module's own)
+    # ---------------------------------------------------------------------
+    def bucket(self, doc):
+        idinvc, amount, due = doc[1], doc[4], int(doc[3])
+        if amount < 0 and idinvc[:1] in ("P", "C"):
+            return "current"
+        d_today, d_30, d_60, d_90 = self.bounds
+        if due > d_today:
+            return "current"
+        if due >= d_30:
+            return "d0_30"
+        if due >= d_60:
+            return "d31_60"
+        if due >= d_90:
+            return "d61_90"
+        return "d90p"
+
+    def open_docs(self):
+        """Open, non-zero documents with their bucket: ``[(doc, bucket)]``."""
+        if self._open is None:
+            self._open = [(d, self.bucket(d)) for d in self.docs if not d[5] and d[4] != 0]
+        return self._open
+
+    def allowed_customers(self):
+        net = {}
+        for doc, _b in self.open_docs():
+            net[doc[0]] = net.get(doc[0], Decimal(0)) + doc[4]
+        return {code for code, amount in net.items() if amount != 0}
+
+    def customer_sizes(self):
+        """Customer codes (stripped) by descending number of open documents."""
+        counts = {}
+        for doc, _b in self.open_docs():
+            counts[doc[0].strip()] = counts.get(doc[0].strip(), 0) + 1
+        return sorted(counts, key=lambda c: (-counts[c], c))
+
+    # ---------------------------------------------------------------------
+    # Result sets, one per query kind: (column names, rows)
+    # ---------------------------------------------------------------------
+    def aging(self):
+        sums = {}
+        for doc, bucket in self.open_docs():
+            s = sums.setdefault(doc[0], dict.fromkeys(BUCKETS, Decimal(0)))
+            s[bucket] += doc[4]
+        rows = []
+        for code in sorted(sums):
+            s = sums[code]
+            total = sum(s.values(), Decimal(0))
+            if total:
+                rows.append((code, self.names[code.strip()]) + tuple(s[b] for b in BUCKETS) + (total,))
+        cols = ("customer_code", "customer_name", "current_amt", "d0_30", "d31_60", "d61_90", "d90p", "total_amt")
+        return cols, rows
+
+    def _invoice_line(self, doc):
+        due = _date(int(doc[3]))
+        return doc[1], due, due, doc[6], doc[7], doc[8], doc[4]
+
+    def customer_invoices(self, code, bucket=None):
+        code = code.strip()
+        picked = [(d, b) for d, b in self.open_docs()
+                  if d[0].strip() == code and (bucket is None or b == bucket)]
+        picked.sort(key=lambda db: (-int(db[0][3]), db[0][6]))
+        cols = ("IDINV", "DATEINVC", "DUE_DATE", "IDORDERNBR", "IDCUSTPO", "DESCINVC", "AMTINVCHC", "bucket")
+        return cols, [self._invoice_line(d) + (b,) for d, b in picked]
+
+    def batch_invoices(self, codes, bucket=None):
+        wanted = {c.strip() for c in codes}
+        picked = [(d, b) for d, b in self.open_docs()
+                  if d[0].strip() in wanted and (bucket is None or b == bucket)]
+        picked.sort(key=lambda db: (db[0][0], -int(db[0][3]), db[0][6]))
+        cols = ("customer_code", "IDINV", "DATEINVC", "IDORDERNBR", "IDCUSTPO", "DESCINVC", "AMTINVCHC", "bucket")
+        rows = []
+        for d, b in picked:
+            line = self._invoice_line(d)
+            rows.append((d[0].strip(), line[0], line[1], line[3], line[4], line[5], line[6], b))
+        return cols, rows
+
+    def bucket_invoices(self, bucket=None):
+        allowed = self.allowed_customers()
+        picked = [(d, b) for d, b in self.open_docs()
+                  if d[0] in allowed and (bucket is None or b == bucket)]
+        picked.sort(key=lambda db: (self.names[db[0][0].strip()], db[0][0], -int(db[0][3]), db[0][1]))
+        cols = ("customer_code", "customer_name", "IDINV", "DATEINVC", "DUE_DATE", "IDORDERNBR",
+                "IDCUSTPO", "DESCINVC", "AMTINVCHC", "bucket")
+        return cols, [(d[0].strip(), self.names[d[0].strip()]) + self._invoice_line(d) + (b,) for d, b in picked]
+
+    def open_items(self):
+        cols = ("IDCUST", "IDINVC", "CNTPAYM", "DATEDUE", "AMTDUEHC", "NAMECUST", "is_open")
+        return cols, [(d[0], d[1], d[2], d[3], d[4], self.names[d[0].strip()], 1) for d, _b in self.open_docs()]
+
+    def store_items(self):
+        cols = ("IDCUST", "NAMECUST", "DATEDUE", "AMTDUEHC", "prefix")
+        return cols, [(d[0], self.names[d[0].strip()], d[3], d[4], d[1][:1]) for d, _b in self.open_docs()]
+
+    def watermark(self):
+        top = max(((d[9], d[10]) for d in self.docs), default=(Decimal(0), Decimal(0)))
+        return ("AUDTDATE", "AUDTTIME"), [top]
+
+    def changed_items(self, audtdate, audttime):
+        cols = ("IDCUST", "IDINVC", "CNTPAYM", "DATEDUE", "AMTDUEHC", "NAMECUST", "is_open", "AUDTDATE", "AUDTTIME")
+        rows = []
+        for d in self.docs:
+            if d[9] > audtdate or (d[9] == audtdate and d[10] >= audttime):
+                is_open = 1 if not d[5] and d[4] != 0 else 0
+                rows.append((d[0], d[1], d[2], d[3], d[4], self.names[d[0].strip()], is_open, d[9], d[10]))
+        return cols, rows
+
+    # PostgreSQL mirror sync (aging_mirror)
+    def _mirror_item(self, d):
+        return d[0], d[1], d[2], d[3], d[6], d[7], d[8], d[4]
+
+    def mirror_items(self):
+        cols = ("IDCUST", "IDINVC", "CNTPAYM", "DATEDUE", "IDORDERNBR", "IDCUSTPO", "DESCINVC", "AMTDUEHC")
+        return cols, [self._mirror_item(d) for d, _b in self.open_docs()]
+
+    def mirror_changed_items(self, audtdate, audttime):
+        cols = ("IDCUST", "IDINVC", "CNTPAYM", "DATEDUE", "IDORDERNBR", "IDCUSTPO", "DESCINVC", "AMTDUEHC",
+                "is_open", "AUDTDATE", "AUDTTIME")
+        rows = []
+        for d in self.docs:
+            if d[9] > audtdate or (d[9] == audtdate and d[10] >= audttime):
+                is_open = 1 if not d[5] and d[4] != 0 else 0
+                rows.append(self._mirror_item(d) + (is_open, d[9], d[10]))
+        return cols, rows
+
+    def mirror_customers(self):
+        return ("IDCUST", "NAMECUST"), [(code.ljust(IDCUST_WIDTH), name) for code, name in self.names.items()]
+
+    def mirror_changed_customers(self, audtdate, audttime):
+        rows = [(code.ljust(IDCUST_WIDTH), self.names[code]) + audt
+                for code, audt in self.customer_audt.items()
+                if audt[0] > audtdate or (audt[0] == audtdate and audt[1] >= audttime)]
+        return ("IDCUST", "NAMECUST", "AUDTDATE", "AUDTTIME"), rows
+
+    def customer_watermark(self):
+        return ("AUDTDATE", "AUDTTIME"), [max(self.customer_audt.values(), default=(Decimal(0), Decimal(0)))]
+
+    def server_date(self):
+        return ("today",), [(self.today.strftime("%Y%m%d"),)]
+
+
+# -------------------------------------------------------------------------
+# pyodbc look-alike
+# -------------------------------------------------------------------------
+class Error(Exception):
+    pass
+
+
+class FakeCursor:
+    def __init__(self, server):
+        self._server = server
+        self._rows = []
+        self._pos = 0
+        self.description = None
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        cols, self._rows = self._server.run(sql, params)
+        self.description = [(c, None, None, None, None, None, True) for c in cols]
+        self._pos = 0
+        return self
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchmany(self, size=1):
+        chunk = self._rows[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+    def fetchall(self):
+        chunk = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return chunk
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self._rows = []
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self._server = server
+        self.timeout = 0
+
+    def cursor(self):
+        return FakeCursor(self._server)
+
+    def add_output_converter(self, sqltype, func):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePyodbc:
+    """Module stand-in: ``connect()`` hands out connections to one Ledger."""
+
+    Error = Error
+    # ODBC type codes used by output converters
+    SQL_DECIMAL = 3
+    SQL_NUMERIC = 2
+    SQL_TYPE_DATE = 91
+
+    def __init__(self, ledger, classify):
+        self.ledger = ledger
+        self.classify = classify
+        self.connects = 0
+        self.queries = 0
+        self._results = {}
+
+    def connect(self, conn_str, timeout=0, autocommit=False, **kw):
+        self.connects += 1
+        return FakeConnection(self)
+
+    def run(self, sql, params):
+        self.queries += 1
+        if sql.strip() == "SELECT 1":
+            return ("1",), [(1,)]
+        key = (sql, params)
+        result = self._results.get(key)
+        if result is None:
+            kind, args = self.classify(sql, params)
+            result = self._results[key] = getattr(self.ledger, kind)(*args)
+        return result
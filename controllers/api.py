@@ -1,10 +1,25 @@
 # -*- coding: utf-8 -*-
+import csv
+import hashlib
+import io
 import json
 import logging
+import tempfile
+from collections import defaultdict
 from datetime import datetime
 
 from odoo import http
-from odoo.http import request
+from odoo.http import content_disposition, request
+
+from odoo.addons.mssql_bridge.models import bucket_index
+from odoo.addons.mssql_bridge.models.aging_result import AMOUNT_COLUMNS, AgingResult
+from odoo.addons.mssql_bridge.models.bridge import EXPORT_COLUMNS
+from odoo.addons.mssql_bridge.models.query_metrics import timed_endpoint
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
 
 _logger = logging.getLogger(__name__)
 
@@ -17,6 +32,9 @@ BUCKETS = {
     "d90p": "90+ Days",
 }
 
+# Upper bound for one "expand all" request
+MAX_BATCH_CUSTOMERS = 500
+
 
 def _read_json_payload():
     """Support both JSON-RPC and raw fetch() bodies."""
@@ -32,139 +50,604 @@ def _read_json_payload():
         return {}
 
 
+def _wants_refresh(kw):
+    """The Refresh button asks for a rebuilt snapshot with ``?refresh=1``."""
+    return (kw.get("refresh") or "").strip().lower() in ("1", "true", "yes")
+
+
+def _age_label(taken_at):
+    """Human age of a snapshot, e.g. ``"4 min ago"``."""
+    seconds = max(0, int((datetime.now() - taken_at).total_seconds()))
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return "%d min ago" % (seconds // 60)
+    if seconds < 86400:
+        return "%d h ago" % (seconds // 3600)
+    return "%d days ago" % (seconds // 86400)
+
+
+def _refresh_kind(kind):
+    """Validate a background refresh kind: ``aging``, ``store`` (as-of aging) or ``bucket:<bucket>``."""
+    kind = (kind or "aging").strip().lower()
+    if kind in ("aging", "store"):
+        return kind
+    if kind.startswith("bucket:") and kind.split(":", 1)[1] in BUCKETS:
+        return kind
+    return None
+
+
+def _etag(*parts):
+    """Opaque entity tag for a response built from ``parts`` (versions, parameters)."""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _conditional_json(etag, build):
+    """JSON response for the GET data endpoints, honouring ``If-None-Match``.
+
+    ``build()`` is only called when the client does not already hold ``etag``;
+    otherwise an empty 304 goes back. ``no-cache`` makes the browser revalidate
+    on every use, so a new snapshot shows up at once. Without an etag (data not
+    versioned right now) the body is always sent and never stored.
+    """
+    if not etag:
+        return request.make_json_response(build(), headers=[("Cache-Control", "no-store")])
+    headers = [("Cache-Control", "private, no-cache"), ("ETag", '"%s"' % etag)]
+    # Weak comparison: a compressing proxy may have turned our tag into W/"..."
+    if request.httprequest.if_none_match.contains_weak(etag):
+        return request.make_response(b"", headers=headers, status=304)
+    return request.make_json_response(build(), headers=headers)
+
+
+def _columnar(header, rows):
+    """Compact payload: the header once, then one value array per column."""
+    values = [list(col) for col in zip(*rows)] if rows else [[] for _h in header]
+    return {"columns": list(header), "values": values}
+
+
 def _aggregate_totals(rows):
-    t = {"current": 0.0, "d0_30": 0.0, "d31_60": 0.0, "d61_90": 0.0, "d90p": 0.0, "total": 0.0}
-    for r in rows or []:
-        t["current"] += float(r.get("current", 0) or 0)
-        t["d0_30"] += float(r.get("d0_30", 0) or 0)
-        t["d31_60"] += float(r.get("d31_60", 0) or 0)
-        t["d61_90"] += float(r.get("d61_90", 0) or 0)
-        t["d90p"] += float(r.get("d90p", 0) or 0)
-        t["total"] += float(r.get("total", 0) or 0)
-    return t
+    # Column sums of the AgingResult (row dicts are accepted too)
+    return AgingResult.coerce(rows).totals()
+
+
+def _build_bucket_rows(dash_rows, invoices, bucket):
+    """Group bucket invoices by customer, keeping only the dashboard's customers.
+
+    A customer is skipped when its dashboard bucket amount nets to zero, or when
+    its fetched lines net to ~0 (offsetting invoice/credit not applied yet), so
+    the page total matches the card.
+    """
+    # Customers with a non-zero dashboard amount in this bucket, keyed by
+    # (company, code): codes are only unique within one Sage 300 company
+    dash = AgingResult.coerce(dash_rows)
+    companies = dash.companies
+    customers = {
+        (companies[i] if companies else "", dash.codes[i]): dash.names[i]
+        for i in dash.nonzero(bucket) if dash.codes[i]
+    }
+
+    by_customer = defaultdict(list)
+    for inv in invoices or []:
+        key = (inv.get("company") or "", (inv.get("customer_code") or "").strip())
+        if key in customers:
+            by_customer[key].append(inv)
+
+    rows = []
+    for key, invs in by_customer.items():
+        # Lines subtotal for this customer in this bucket
+        subtotal = round(sum(float(inv.get("AMTINVCHC") or 0.0) for inv in invs), 3)
+        if abs(subtotal) < 0.0005:
+            continue
+
+        company, code = key
+        name = customers[key]
+        for inv in invs:
+            row = {
+                "customer_code": code,
+                "customer_name": name,
+                "IDINV": inv.get("IDINV"),
+                "DATEINVC": inv.get("DATEINVC"),
+                "DUE_DATE": inv.get("DUE_DATE"),
+                "IDORDERNBR": inv.get("IDORDERNBR"),
+                "IDCUSTPO": inv.get("IDCUSTPO"),
+                "DESCINVC": inv.get("DESCINVC"),
+                "AMTINVCHC": float(inv.get("AMTINVCHC") or 0.0),
+            }
+            if companies:
+                row["company"] = company
+            rows.append(row)
+    return rows
+
+
+def _missing_companies(*sources):
+    """Companies that did not answer in any of the per-company ``sources`` lists."""
+    missing = {}
+    for source in sources:
+        for status in source or ():
+            if status.get("state") != "ok":
+                missing.setdefault(status["company"], status)
+    return list(missing.values())
+
+
+def _charts_version(Snapshot, Bridge, force=False):
+    """Version of the charts dataset, known before building it."""
+    marker = Snapshot.version()
+    if marker[1]:
+        return _etag("charts", marker)
+    # No daily snapshot yet: the charts follow the live aging
+    snap = Bridge.get_aging_snapshot(force=force, stale_ok=not force)
+    return _etag("charts-live", snap["version"])
+
+
+def _charts_data(Snapshot, Bridge, force=False):
+    """Compact dataset of the charts page (no request needed, see benchmarks/)."""
+    # Daily snapshots (cron) feed the charts; live data only until the first one exists
+    rows = Snapshot.latest_rows()
+    if rows:
+        as_of = Snapshot.latest_date().strftime("%Y-%m-%d")
+    else:
+        snap = Bridge.get_aging_snapshot(force=force, stale_ok=not force)
+        rows = snap["rows"]
+        as_of = snap["taken_at"].strftime("%Y-%m-%d %H:%M")
+
+    top10 = rows.top(10)
+    trend = Snapshot.trend()
+    trend_columns = ("labels",) + AMOUNT_COLUMNS
+    return {
+        "as_of": as_of,
+        "totals": rows.totals(),
+        "top10": {
+            "columns": ["customer_code", "customer_name", "total"],
+            "values": [
+                [rows.codes[i] for i in top10],
+                [rows.names[i] for i in top10],
+                [rows.columns["total"][i] for i in top10],
+            ],
+        },
+        "trend": {"columns": list(trend_columns), "values": [trend[key] for key in trend_columns]},
+    }
+
+
+def _bucket_index(Bridge, b, force=False):
+    """``(aging snapshot, bucket snapshot, BucketIndex, version)`` of a validated bucket key.
+
+    The index (sorted rows, customer groups, subtotals) is built once per pair
+    of snapshots and shared by the page and its row windows; ``version`` names
+    that pair, so the browser notices when its group layout is outdated.
+    """
+    # 1) Exact customer universe + bucket amounts from the dashboard
+    snap = Bridge.get_aging_snapshot(force=force, stale_ok=not force)
+    # 2) Every invoice of the bucket in ONE set-based query (cached like the aging)
+    inv_snap = Bridge.get_bucket_snapshot(b, force=force, stale_ok=not force)
+    stamp = (snap["version"], snap["taken_at"], inv_snap["taken_at"])
+    index = bucket_index.index_for(
+        (Bridge.env.cr.dbname, b), stamp,
+        lambda: _build_bucket_rows(snap["rows"], inv_snap["rows"] or [], b),
+    )
+    return snap, inv_snap, index, _etag("bucket", b, stamp)
+
+
+def _bucket_page_values(Bridge, b, force=False):
+    """QWeb values of the bucket page (header and totals; rows are loaded by recv_bucket.js)."""
+    snap, inv_snap, index, version = _bucket_index(Bridge, b, force=force)
+    return {
+        "bucket": b,
+        "bucket_label": BUCKETS[b],
+        "total": index.full.total,
+        "invoice_count": len(index),
+        "customer_count": len(index.full.groups),
+        "version": version,
+        "updated_at": snap["taken_at"].strftime("%Y-%m-%d %H:%M"),
+        "updated_age": _age_label(min(snap["taken_at"], inv_snap["taken_at"])),
+        "stale": snap["stale"] or inv_snap["stale"],
+        "consolidated": snap["rows"].companies is not None,
+        "missing_companies": _missing_companies(snap["rows"].sources, inv_snap["sources"]),
+    }
+
+
+# -------------------------------------------------------------------------
+# Streaming export helpers (rows are EXPORT_COLUMNS tuples, plus a trailing
+# company column in a consolidated export)
+# -------------------------------------------------------------------------
+_AMT = EXPORT_COLUMNS.index("AMTINVCHC")
+_BKT = EXPORT_COLUMNS.index("bucket")
+XLSX_MAX_ROWS = 1048575  # per sheet, header excluded
+
+
+def _flush_customer(lines):
+    # Same rule as the bucket page: a customer's bucket whose lines net to ~0 is skipped
+    subtotals = defaultdict(float)
+    for line in lines:
+        subtotals[line[_BKT]] += line[_AMT]
+    skip = {b for b, amt in subtotals.items() if abs(round(amt, 3)) < 0.0005}
+    for line in lines:
+        if line[_BKT] not in skip:
+            yield line
+
+
+def _export_rows(stream):
+    """Apply the bucket-page rules while buffering at most one customer's lines."""
+    current, lines = None, []
+    for row in stream:
+        # customer code, and company when present (codes repeat across companies)
+        key = (row[0], row[_AMT + 1:])
+        if key != current:
+            yield from _flush_customer(lines)
+            current, lines = key, []
+        lines.append(row)
+    yield from _flush_customer(lines)
+
+
+def _csv_chunks(rows, columns=EXPORT_COLUMNS, chunk_rows=2000):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")  # BOM so Excel opens the file as UTF-8
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow(row[:_AMT] + ("%.3f" % row[_AMT],) + row[_AMT + 1:])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    yield buf.getvalue().encode("utf-8")
+
+
+def _xlsx_chunks(rows, columns=EXPORT_COLUMNS, read_size=64 * 1024):
+    # constant_memory flushes every finished row to disk; the workbook is
+    # assembled in a temp file and streamed back from there.
+    with tempfile.TemporaryFile() as fh:
+        wb = xlsxwriter.Workbook(fh, {"constant_memory": True})
+        amount_fmt = wb.add_format({"num_format": "#,##0.000"})
+        ws, r = None, XLSX_MAX_ROWS
+        for row in rows:
+            if r >= XLSX_MAX_ROWS:
+                ws = wb.add_worksheet()
+                ws.write_row(0, 0, columns)
+                r = 0
+            r += 1
+            ws.write_row(r, 0, row[:_AMT])
+            ws.write_number(r, _AMT, row[_AMT], amount_fmt)
+            if len(row) > _AMT + 1:
+                ws.write_row(r, _AMT + 1, row[_AMT + 1:])
+        if ws is None:
+            wb.add_worksheet().write_row(0, 0, columns)
+        wb.close()
+        fh.seek(0)
+        while True:
+            data = fh.read(read_size)
+            if not data:
+                break
+            yield data
 
 
 class RecvAPI(http.Controller):
     # ---------- JSON endpoints (optional) ----------
     @http.route("/recv/aging", type="json", auth="user")
-    def recv_aging(self):
-        rows = request.env["mssql.bridge"].sudo().get_aging_by_customer()
-        return {"rows": rows, "totals": _aggregate_totals(rows)}
+    @timed_endpoint("/recv/aging")
+    def recv_aging(self, refresh=False, **kw):
+        snap = request.env["mssql.bridge"].sudo().get_aging_snapshot(force=bool(refresh))
+        rows = snap["rows"]
+        return {
+            "rows": rows.to_dicts(),
+            "totals": rows.totals(),
+            "updated_at": snap["taken_at"].strftime("%Y-%m-%d %H:%M:%S"),
+            "version": snap["version"],
+        }
+
+    @http.route("/recv/aging/page", type="json", auth="user")
+    @timed_endpoint("/recv/aging/page")
+    def recv_aging_page(self, page=1, page_size=50, sort="customer_name", order="asc",
+                        search="", hide_zero=False, bucket=None, as_of=None, boundaries=None, **kw):
+        # as_of / boundaries: re-bucketed from the open item store (date picker)
+        Bridge = request.env["mssql.bridge"].sudo()
+        try:
+            res = Bridge.get_aging_page(
+                page=page,
+                page_size=page_size,
+                sort=sort,
+                descending=(order or "").lower() == "desc",
+                search=search,
+                hide_zero=bool(hide_zero),
+                bucket=bucket or None,
+                as_of=as_of or None,
+                boundaries=boundaries or None,
+            )
+        except Exception as e:
+            _logger.exception("recv_aging_page failed")
+            return {"rows": [], "count": 0, "error": str(e)}
+        return {
+            "rows": res["rows"],
+            "count": res["count"],
+            "page": page,
+            "page_size": page_size,
+            "totals": res["totals"],
+            "updated_at": res["taken_at"].strftime("%Y-%m-%d %H:%M:%S"),
+            "as_of": res["as_of"] and res["as_of"].isoformat(),
+            "boundaries": res["boundaries"],
+        }
+
+    @http.route("/recv/search", type="http", auth="user", methods=["GET"])
+    @timed_endpoint("/recv/search")
+    def recv_search(self, q="", limit=20, **kw):
+        """Typeahead: best matching customers with their bucket amounts."""
+        query = (q or "").strip()
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 20
+        if not query:
+            return request.make_json_response({"rows": [], "count": 0})
+        Bridge = request.env["mssql.bridge"].sudo()
+        try:
+            res = Bridge.search_customers(query, limit=limit)
+        except Exception as e:
+            _logger.exception("recv_search failed")
+            return request.make_json_response({"rows": [], "count": 0, "error": str(e)})
+        return _conditional_json(
+            _etag("search", res["version"], query, limit),
+            lambda: {"rows": res["rows"], "count": res["count"], "query": query},
+        )
 
     @http.route("/recv/invoices", type="json", auth="user")
+    @timed_endpoint("/recv/invoices")
     def recv_invoices(self, **kw):
         payload = _read_json_payload()
         params = payload.get("params", payload) if isinstance(payload, dict) else {}
         code = (params.get("customer_code") or "").strip()
         name = (params.get("customer_name") or "").strip()
         bucket = (params.get("bucket") or "").strip().lower()
+        company = (params.get("company") or "").strip() or None
 
         if not (code or name):
             return {"rows": []}
 
         Bridge = request.env["mssql.bridge"].sudo()
         try:
+            if params.get("compact"):
+                return _columnar(*Bridge.get_invoices_basic_by_customer(
+                    customer_code=code, customer_name=name, bucket=bucket, as_tuples=True, company=company
+                ))
             rows = Bridge.get_invoices_basic_by_customer(
-                customer_code=code, customer_name=name, bucket=bucket
+                customer_code=code, customer_name=name, bucket=bucket, company=company
             ) or []
             return {"rows": rows}
         except Exception as e:
             _logger.exception("recv_invoices failed")
             return {"rows": [], "error": str(e)}
 
+    @http.route("/recv/invoices/batch", type="json", auth="user")
+    @timed_endpoint("/recv/invoices/batch")
+    def recv_invoices_batch(self, **kw):
+        payload = _read_json_payload()
+        params = payload.get("params", payload) if isinstance(payload, dict) else {}
+        codes = params.get("customer_codes") or []
+        bucket = (params.get("bucket") or "").strip().lower()
+
+        if not isinstance(codes, list) or not codes:
+            return {"customers": {}}
+        if len(codes) > MAX_BATCH_CUSTOMERS:
+            return {"customers": {}, "error": "Too many customers (max %s)" % MAX_BATCH_CUSTOMERS}
+
+        Bridge = request.env["mssql.bridge"].sudo()
+        try:
+            customers, sources = Bridge.get_invoices_basic_by_customers(
+                [str(c) for c in codes], bucket=bucket, with_sources=True
+            )
+            # Consolidated: rows carry their company; "missing" lists who did not answer
+            return {"customers": customers, "missing": _missing_companies(sources)}
+        except Exception as e:
+            _logger.exception("recv_invoices_batch failed")
+            return {"customers": {}, "error": str(e)}
+
+    # ---------- GET data endpoints (ETag / If-None-Match) ----------
+    # Same data as the JSON-RPC routes above, but cacheable by the browser: the
+    # ETag comes from the snapshot version, so an unchanged snapshot costs a
+    # bodiless 304 and no JSON is built. ``format=compact`` (the default) sends
+    # one value array per column instead of one object per row.
+    @http.route("/recv/aging/data", type="http", auth="user", methods=["GET"])
+    @timed_endpoint("/recv/aging/data")
+    def recv_aging_data(self, format="compact", **kw):
+        compact = format != "rows"
+        snap = request.env["mssql.bridge"].sudo().get_aging_snapshot(stale_ok=True)
+        rows = snap["rows"]
+
+        def build():
+            return dict(
+                rows.to_columnar() if compact else {"rows": rows.to_dicts()},
+                totals=rows.totals(),
+                updated_at=snap["taken_at"].strftime("%Y-%m-%d %H:%M:%S"),
+                stale=snap["stale"],
+                version=snap["version"],
+            )
+
+        return _conditional_json(_etag("aging", snap["version"], snap["stale"], compact), build)
+
+    @http.route("/recv/invoices/data", type="http", auth="user", methods=["GET"])
+    @timed_endpoint("/recv/invoices/data")
+    def recv_invoices_data(self, customer_code="", customer_name="", bucket="", company="", format="compact",
+                           **kw):
+        code = (customer_code or "").strip()
+        name = (customer_name or "").strip()
+        bucket = (bucket or "").strip().lower()
+        company = (company or "").strip() or None
+        compact = format != "rows"
+        if not (code or name):
+            return request.make_json_response({"columns": [], "values": []} if compact else {"rows": []})
+
+        Bridge = request.env["mssql.bridge"].sudo()
+        # Invoices are read live; their version is the aging snapshot they are
+        # shown against, so a client copy is reused until that snapshot is
+        # replaced. While the snapshot is expired nothing is versioned.
+        snap = Bridge.get_aging_snapshot(stale_ok=True)
+        etag = None
+        if not snap["stale"]:
+            etag = _etag("invoices", snap["version"], snap["taken_at"],
+                         company, code, "" if code else name, bucket, compact)
+
+        def build():
+            if compact:
+                return _columnar(*Bridge.get_invoices_basic_by_customer(
+                    customer_code=code, customer_name=name, bucket=bucket, as_tuples=True, company=company
+                ))
+            return {"rows": Bridge.get_invoices_basic_by_customer(
+                customer_code=code, customer_name=name, bucket=bucket, company=company
+            ) or []}
+
+        try:
+            return _conditional_json(etag, build)
+        except Exception as e:
+            _logger.exception("recv_invoices_data failed")
+            return request.make_json_response({"rows": [], "error": str(e)},
+                                              headers=[("Cache-Control", "no-store")])
+
+    @http.route("/recv/charts/data", type="http", auth="user", methods=["GET"])
+    @timed_endpoint("/recv/charts/data")
+    def recv_charts_data(self, **kw):
+        Snapshot = request.env["mssql.aging.snapshot"].sudo()
+        Bridge = request.env["mssql.bridge"].sudo()
+        force = _wants_refresh(kw)
+        return _conditional_json(_charts_version(Snapshot, Bridge, force=force),
+                                 lambda: _charts_data(Snapshot, Bridge))
+
+    @http.route("/recv/refresh/start", type="json", auth="user")
+    def recv_refresh_start(self, kind="aging", **kw):
+        """Start a background rebuild; the page polls /recv/refresh/status."""
+        kind = _refresh_kind(kind)
+        if not kind:
+            return {"error": "Unknown refresh kind"}
+        Job = request.env["mssql.refresh.job"].sudo()
+        started = Job.start(kind)
+        return dict(Job.status(kind), started=started)
+
+    @http.route("/recv/refresh/status", type="json", auth="user")
+    def recv_refresh_status(self, kind="aging", **kw):
+        kind = _refresh_kind(kind)
+        if not kind:
+            return {"error": "Unknown refresh kind"}
+        return request.env["mssql.refresh.job"].sudo().status(kind)
+
+    @http.route("/recv/metrics", type="http", auth="user")
+    def recv_metrics(self, **kw):
+        """Latency percentiles, row counts and error rates of this worker (administrators only)."""
+        if not request.env.user.has_group("base.group_system"):
+            return request.make_json_response({"error": "forbidden"}, status=403)
+        metrics = request.env["mssql.bridge"].sudo().get_query_metrics()
+        return request.make_json_response(metrics, headers=[("Cache-Control", "no-store")])
+
     # ---------- Pages ----------
+    # Pages render the newest cached snapshot even when it has expired (a
+    # background refresh is started for it) so they never wait on MSSQL once a
+    # snapshot exists; ?refresh=1 still forces a synchronous rebuild.
     @http.route("/recv/dashboard", type="http", auth="user")
+    @timed_endpoint("/recv/dashboard")
     def recv_dashboard_page(self, **kw):
         Bridge = request.env["mssql.bridge"].sudo()
-        rows = Bridge.get_aging_by_customer()
+        force = _wants_refresh(kw)
+        snap = Bridge.get_aging_snapshot(force=force, stale_ok=not force)
+        rows = snap["rows"]
+        # Table rows are fetched page by page from /recv/aging/page
         qcontext = {
-            "rows": rows,
-            "totals": _aggregate_totals(rows),
-            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "row_count": len(rows),
+            "totals": rows.totals(),
+            "updated_at": snap["taken_at"].strftime("%Y-%m-%d %H:%M"),
+            "updated_age": _age_label(snap["taken_at"]),
+            "stale": snap["stale"],
+            # Consolidated view: one status per company (None with a single company)
+            "sources": rows.sources,
+            # Companies whose queries are paused after repeated timeouts
+            "breakers": [b for b in Bridge.get_breaker_status() if b["state"] != "closed"],
         }
         return request.render("mssql_bridge.recv_dashboard_page", qcontext)
 
     @http.route("/recv/charts", type="http", auth="user")
+    @timed_endpoint("/recv/charts")
     def recv_charts_page(self, **kw):
-        Bridge = request.env["mssql.bridge"].sudo()
-        rows = Bridge.get_aging_by_customer()
-        totals = _aggregate_totals(rows)
-
-        top10 = sorted(rows, key=lambda r: float(r.get("total") or 0), reverse=True)[:10]
-        top10_labels = [(r.get("customer_name") or r.get("customer_code") or "-") for r in top10]
-        top10_values = [float(r.get("total") or 0) for r in top10]
-
-        return request.render(
-            "mssql_bridge.recv_charts_page",
-            {
-                "totals_json": json.dumps(totals, ensure_ascii=False),
-                "top10_labels_json": json.dumps(top10_labels, ensure_ascii=False),
-                "top10_values_json": json.dumps(top10_values, ensure_ascii=False),
-            },
-        )
+        # Only the shell: recv_charts_render.js loads /recv/charts/data
+        return request.render("mssql_bridge.recv_charts_page", {"refresh": _wants_refresh(kw)})
 
     @http.route("/recv/bucket/<string:bucket>", type="http", auth="user")
+    @timed_endpoint("/recv/bucket")
     def recv_bucket_page(self, bucket, **kw):
         b = (bucket or "").lower()
         if b not in BUCKETS:
             b = "d0_30"
+        Bridge = request.env["mssql.bridge"].sudo()
+        return request.render("mssql_bridge.recv_bucket_page",
+                              _bucket_page_values(Bridge, b, force=_wants_refresh(kw)))
 
+    @http.route("/recv/bucket/<string:bucket>/groups", type="http", auth="user", methods=["GET"])
+    @timed_endpoint("/recv/bucket/groups")
+    def recv_bucket_groups(self, bucket, q="", **kw):
+        """Customer groups of the bucket page (optionally searched), with their subtotals."""
+        b = (bucket or "").lower()
+        if b not in BUCKETS:
+            return request.make_json_response({"error": "unknown bucket"}, status=404)
         Bridge = request.env["mssql.bridge"].sudo()
+        try:
+            snap, inv_snap, index, version = _bucket_index(Bridge, b)
+        except Exception as e:
+            _logger.exception("recv_bucket_groups failed")
+            return request.make_json_response({"columns": [], "values": [], "error": str(e)},
+                                              headers=[("Cache-Control", "no-store")])
+        stale = snap["stale"] or inv_snap["stale"]
 
-        # 1) Exact customer universe + bucket amounts from the dashboard
-        dash_rows = Bridge.get_aging_by_customer() or []
+        def build():
+            view = index.view(q)
+            return dict(_columnar(bucket_index.GROUP_COLUMNS, index.groups(view)),
+                        count=len(view), total=view.total, version=version)
 
-        rows = []
-        for r in dash_rows:
-            code = (r.get("customer_code") or "").strip()
-            name = (r.get("customer_name") or "").strip()
-            if not code and not name:
-                continue
+        return _conditional_json(None if stale else _etag(version, "groups", q), build)
 
-            # Bucket amount the dashboard used for THIS customer
-            # (keys on your dashboard rows are already: current, d0_30, d31_60, d61_90, d90p)
-            cust_bucket_amt = float(r.get(b) or 0.0)
+    @http.route("/recv/bucket/<string:bucket>/rows", type="http", auth="user", methods=["GET"])
+    @timed_endpoint("/recv/bucket/rows")
+    def recv_bucket_rows(self, bucket, q="", offset=0, limit=bucket_index.DEFAULT_PAGE_SIZE, **kw):
+        """A window of the bucket page's sorted invoice lines (positions as in the groups)."""
+        b = (bucket or "").lower()
+        if b not in BUCKETS:
+            return request.make_json_response({"error": "unknown bucket"}, status=404)
+        try:
+            offset, limit = int(offset), int(limit)
+        except (TypeError, ValueError):
+            return request.make_json_response({"error": "invalid offset or limit"}, status=400)
+        Bridge = request.env["mssql.bridge"].sudo()
+        try:
+            snap, inv_snap, index, version = _bucket_index(Bridge, b)
+        except Exception as e:
+            _logger.exception("recv_bucket_rows failed")
+            return request.make_json_response({"columns": [], "values": [], "error": str(e)},
+                                              headers=[("Cache-Control", "no-store")])
+        stale = snap["stale"] or inv_snap["stale"]
 
-            # If the customer's bucket nets to zero on the dashboard, skip them completely
-            if abs(round(cust_bucket_amt, 3)) < 0.0005:
-                continue
+        def build():
+            rows = index.rows_at(index.view(q), offset, limit)
+            return dict(_columnar(bucket_index.ROW_COLUMNS, rows), offset=offset, version=version)
 
-            invs = Bridge.get_invoices_basic_by_customer(
-                customer_code=code,
-                customer_name=name,
-                bucket=b,
-            ) or []
+        return _conditional_json(None if stale else _etag(version, "rows", q, offset, limit), build)
 
-            # Lines subtotal for this customer in this bucket
-            subtotal = round(sum(float(inv.get("AMTINVCHC") or 0.0) for inv in invs), 3)
-
-            # If the fetched lines net to ~0, skip (offsetting invoice/credit not applied yet)
-            if abs(subtotal) < 0.0005:
-                continue
-
-            for inv in invs:
-                rows.append({
-                    "customer_code": code,
-                    "customer_name": name,
-                    "IDINV": inv.get("IDINV"),
-                    "DATEINVC": inv.get("DATEINVC"),
-                    "DUE_DATE": inv.get("DUE_DATE"),
-                    "IDORDERNBR": inv.get("IDORDERNBR"),
-                    "IDCUSTPO": inv.get("IDCUSTPO"),
-                    "DESCINVC": inv.get("DESCINVC"),
-                    "AMTINVCHC": float(inv.get("AMTINVCHC") or 0.0),
-                })
-
-        # Sort and total (unchanged)
-        rows.sort(key=lambda x: (x.get("customer_name") or "", x.get("DATEINVC") or "", x.get("IDINV") or ""),
-                  reverse=True)
-        total = round(sum(float(r.get("AMTINVCHC") or 0.0) for r in rows), 3)
+    @http.route("/recv/export/<string:bucket>", type="http", auth="user")
+    def recv_export(self, bucket, fmt="csv", **kw):
+        """Stream a bucket (or ``all``) as CSV/XLSX without materialising the rows."""
+        b = (bucket or "").lower()
+        if b != "all" and b not in BUCKETS:
+            b = "d0_30"
+        fmt = "xlsx" if (fmt or "").lower() == "xlsx" and xlsxwriter is not None else "csv"
 
-        qcontext = {
-            "bucket": b,
-            "bucket_label": BUCKETS[b],
-            "rows": rows,
-            "total": total,
-            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        }
-        return request.render("mssql_bridge.recv_bucket_page", qcontext)
+        Bridge = request.env["mssql.bridge"].sudo()
+        columns = Bridge.get_export_columns()
+        rows = _export_rows(Bridge.iter_invoices_by_bucket(None if b == "all" else b))
+
+        filename = "receivables_%s_%s.%s" % (b, datetime.now().strftime("%Y%m%d_%H%M"), fmt)
+        if fmt == "xlsx":
+            body = _xlsx_chunks(rows, columns)
+            ctype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        else:
+            body = _csv_chunks(rows, columns)
+            ctype = "text/csv; charset=utf-8"
+        return request.make_response(body, headers=[
+            ("Content-Type", ctype),
+            ("Content-Disposition", content_disposition(filename)),
+            ("Cache-Control", "no-store"),
+        ])
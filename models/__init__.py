@@ -1 +1,4 @@
-from . import bridge
\ No newline at end of file
+from . import bridge
+from . import aging_snapshot
+from . import aging_refresh
+from . import aging_mirror
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Shared, TTL-bound snapshot cache for expensive MSSQL aggregations.
+
+Entries live in memory per worker and, when a file path is configured, in a
+local JSON file so that every worker of the same server reuses the snapshot.
+Concurrent misses for the same key collapse into a single in-flight load:
+within a process through an Event, across processes through a file lock.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+_logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    if hasattr(value, "to_json"):
+        return value.to_json()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SnapshotCache:
+    """key -> (taken_at, value), where taken_at is an epoch timestamp."""
+
+    def __init__(self):
+        self._entries = {}
+        self._file_mtimes = {}      # key -> mtime of the file version already seen
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------------
+    # File backend
+    # ---------------------------------------------------------------------
+    @staticmethod
+    def _read_file(path, key, decode=None):
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if data.get("key") != key:
+            return None
+        value = data.get("value")
+        return data.get("taken_at") or 0.0, decode(value) if decode else value
+
+    @staticmethod
+    def _write_file(path, key, entry):
+        directory = os.path.dirname(path) or "."
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".recv-cache-", dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump({"key": key, "taken_at": entry[0], "value": entry[1]}, fh,
+                          default=_json_default)
+            os.replace(tmp, path)
+        except (OSError, TypeError):
+            _logger.warning("recv cache: could not write %s", path, exc_info=True)
+
+    def _file_lock(self, path):
+        if not path or fcntl is None:
+            return None
+        try:
+            fh = open(path + ".lock", "a")
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            return fh
+        except OSError:
+            return None
+
+    # ---------------------------------------------------------------------
+    # Public API
+    # ---------------------------------------------------------------------
+    def peek(self, key, path=None, decode=None):
+        """Newest known entry (memory or shared file) regardless of age, or None."""
+        return self._newest(key, path, decode)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get(self, key, loader, ttl, force=False, path=None, decode=None):
+        """Return ``(taken_at, value)``, calling ``loader()`` on a miss or when forced.
+
+        ``decode`` turns a value read back from the JSON file into the type the
+        loader returns (the file only holds its JSON form).
+        """
+        requested = time.time()
+        if not force:
+            entry = self._fresh(key, ttl, path, requested, decode)
+            if entry is not None:
+                return entry
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            # Someone else is already loading: that result is at least as fresh
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        lock_fh = self._file_lock(path)
+        try:
+            entry = None
+            if lock_fh is not None:
+                # Another worker may have rebuilt the file while we waited on the lock
+                on_disk = self._read_file(path, key, decode)
+                if on_disk and on_disk[0] >= requested:
+                    entry = on_disk
+            if entry is None:
+                entry = (time.time(), loader())
+                if path:
+                    self._write_file(path, key, entry)
+            self._entries[key] = entry
+            flight.result = entry
+            return entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            if lock_fh is not None:
+                lock_fh.close()
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _newest(self, key, path, decode=None):
+        entry = self._entries.get(key)
+        if path:
+            # Only parse the file when another worker wrote something newer
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != self._file_mtimes.get(key):
+                self._file_mtimes[key] = mtime
+                on_disk = self._read_file(path, key, decode)
+                if on_disk is not None and (entry is None or on_disk[0] > entry[0]):
+                    entry = self._entries[key] = on_disk
+        return entry
+
+    def _fresh(self, key, ttl, path, now, decode=None):
+        entry = self._newest(key, path, decode)
+        if entry is not None and now - entry[0] < ttl:
+            return entry
+        return None
+
+
+# One cache per worker process
+snapshot_cache = SnapshotCache()
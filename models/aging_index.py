@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Pre-sorted, in-memory index over an aging snapshot for paged table views.
+
+Every sortable column is sorted once when the snapshot is (re)built; a page
+request then only walks the requested order, applies the cheap filters and
+slices, instead of sorting or rendering the whole customer universe. The
+customer search index (customer_search) is built with it and also serves the
+table's search filter.
+"""
+import threading
+
+from .aging_result import AMOUNT_COLUMNS, AgingResult
+from .customer_search import CustomerSearch, fold
+
+SORT_COLUMNS = ("customer_name", "customer_code") + AMOUNT_COLUMNS
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class AgingIndex:
+    def __init__(self, rows, search=None):
+        """``search``: a CustomerSearch built for the same customers, in the same order, to reuse."""
+        self.result = AgingResult.coerce(rows)
+        res = self.result
+        self.search = search if search is not None else CustomerSearch(res)
+        positions = range(len(res))
+        self.orders = {
+            "customer_code": sorted(positions, key=[c.lower() for c in res.codes].__getitem__),
+            "customer_name": sorted(positions, key=[n.lower() for n in res.names].__getitem__),
+        }
+        for col in AMOUNT_COLUMNS:
+            self.orders[col] = sorted(positions, key=res.columns[col].__getitem__)
+        self.totals = res.totals()
+
+    def page(self, page=1, page_size=DEFAULT_PAGE_SIZE, sort="customer_name", descending=False,
+             search="", hide_zero=False, bucket=None):
+        """Return ``(rows, filtered_count)`` for a 1-based page."""
+        if sort not in self.orders:
+            sort = "customer_name"
+        if bucket not in AMOUNT_COLUMNS:
+            bucket = None
+        page = max(1, int(page or 1))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(page_size or DEFAULT_PAGE_SIZE)))
+        needle = fold(search)
+
+        order = self.orders[sort]
+        if descending:
+            order = order[::-1]
+        if hide_zero:
+            order = self.result.nonzero("total", order)
+        if bucket:
+            order = self.result.nonzero(bucket, order)
+        if needle:
+            hits = self.search.containing(needle)
+            if hits is None:
+                # Shorter than a trigram: plain scan
+                haystack = self.search.haystack
+                order = [i for i in order if needle in haystack[i]]
+            else:
+                order = [i for i in order if i in hits]
+
+        start = (page - 1) * page_size
+        return self.result.to_dicts(order[start:start + page_size]), len(order)
+
+
+# -------------------------------------------------------------------------
+# One index per snapshot, rebuilt when the snapshot changes
+# -------------------------------------------------------------------------
+_indexes = {}      # cache key -> (taken_at, AgingIndex)
+_lock = threading.Lock()
+
+
+def index_for(key, taken_at, rows):
+    entry = _indexes.get(key)
+    if entry is not None and entry[0] == taken_at:
+        return entry[1]
+    with _lock:
+        entry = _indexes.get(key)
+        if entry is None or entry[0] != taken_at:
+            entry = _indexes[key] = (taken_at, AgingIndex(rows))
+    return entry[1]
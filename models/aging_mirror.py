@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""PostgreSQL mirror of the Sage 300 open items (AROBL) and customers (ARCUS).
+
+With ``mssql.source = mirror`` the bridge's get_* methods read these tables
+(mirror_sql) instead of querying MSSQL, so pages no longer wait on the SQL
+Server. Only the columns the bridge uses are copied, and only open items.
+
+Sync (cron every few minutes when enabled, the Refresh button, or
+``env["mssql.mirror.sync"].sync()``), per company:
+
+- full load: the watermarks are read first (changes racing the load are
+  picked up by the next run), then the company's rows are deleted and
+  reloaded with COPY, COPY_BATCH_SIZE rows at a time, in the job's
+  transaction: readers keep seeing the previous rows until it commits;
+- incremental: only the AROBL / ARCUS rows whose AUDTDATE/AUDTTIME reached
+  the watermark are read, and their mirror rows replaced (documents that
+  are no longer open are dropped);
+- a full load runs on a company's first sync and then every
+  mssql.mirror_full_interval seconds, which also catches deleted rows.
+"""
+import io
+import logging
+import re
+import time
+
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import UserError
+
+from . import aging_rules
+from .bridge import OPEN_ITEM_FILTER, WATERMARK_SQL, _borrowed
+from .mirror_sql import CUSTOMER_TABLE, ITEM_TABLE
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_FULL_INTERVAL = 86400   # seconds between full reloads of a company
+COPY_BATCH_SIZE = 20000         # rows per COPY round trip
+FETCH_BATCH_SIZE = 5000         # rows per MSSQL fetchmany
+
+ITEM_COLUMNS = (
+    "company", "idcust", "idinvc", "cntpaym", "datedue", "due_date",
+    "idordernbr", "idcustpo", "descinvc", "amtduehc",
+)
+CUSTOMER_COLUMNS = ("company", "idcust", "namecust")
+
+# AROBL: idcust, idinvc, cntpaym, datedue, idordernbr, idcustpo, descinvc, amount
+# [, is_open, audtdate, audttime]
+MIRROR_ITEMS_SQL = f"""
+    SELECT ob.IDCUST, ob.IDINVC, ob.CNTPAYM, ob.DATEDUE, ob.IDORDERNBR, ob.IDCUSTPO, ob.DESCINVC,
+           CAST(ob.AMTDUEHC AS DECIMAL(18,3))
+    FROM AROBL ob
+    WHERE {OPEN_ITEM_FILTER.format(a="ob")}
+"""
+
+MIRROR_CHANGED_ITEMS_SQL = f"""
+    SELECT ob.IDCUST, ob.IDINVC, ob.CNTPAYM, ob.DATEDUE, ob.IDORDERNBR, ob.IDCUSTPO, ob.DESCINVC,
+           CAST(ob.AMTDUEHC AS DECIMAL(18,3)),
+           CASE WHEN {OPEN_ITEM_FILTER.format(a="ob")} THEN 1 ELSE 0 END,
+           ob.AUDTDATE, ob.AUDTTIME
+    FROM AROBL ob
+    WHERE ob.AUDTDATE > ? OR (ob.AUDTDATE = ? AND ob.AUDTTIME >= ?)
+"""
+
+# ARCUS: idcust, namecust[, audtdate, audttime]
+MIRROR_CUSTOMERS_SQL = "SELECT cu.IDCUST, cu.NAMECUST FROM ARCUS cu"
+
+MIRROR_CHANGED_CUSTOMERS_SQL = """
+    SELECT cu.IDCUST, cu.NAMECUST, cu.AUDTDATE, cu.AUDTTIME
+    FROM ARCUS cu
+    WHERE cu.AUDTDATE > ? OR (cu.AUDTDATE = ? AND cu.AUDTTIME >= ?)
+"""
+
+CUSTOMER_WATERMARK_SQL = "SELECT TOP 1 AUDTDATE, AUDTTIME FROM ARCUS ORDER BY AUDTDATE DESC, AUDTTIME DESC"
+
+
+class MssqlMirrorItem(models.Model):
+    """Open AROBL document of a Sage 300 company."""
+    _name = "mssql.mirror.item"
+    _description = "Receivables mirror: open item (AROBL)"
+    _log_access = False
+
+    company = fields.Char(required=True)
+    idcust = fields.Char(required=True)          # stripped
+    idinvc = fields.Char(required=True)
+    cntpaym = fields.Integer()
+    datedue = fields.Integer()                   # yyyymmdd, as AROBL stores it
+    due_date = fields.Date()                     # NULL when datedue is not a date
+    idordernbr = fields.Char()
+    idcustpo = fields.Char()
+    descinvc = fields.Char()
+    amtduehc = fields.Float(digits=(18, 3))
+
+    _sql_constraints = [
+        ("document_uniq", "unique(company, idcust, idinvc, cntpaym)", "One mirror row per AROBL document."),
+    ]
+
+    def init(self):
+        tools.create_index(self._cr, "mssql_mirror_item_company_due_idx", self._table, ["company", "datedue"])
+
+
+class MssqlMirrorCustomer(models.Model):
+    """ARCUS customer of a Sage 300 company."""
+    _name = "mssql.mirror.customer"
+    _description = "Receivables mirror: customer (ARCUS)"
+    _log_access = False
+
+    company = fields.Char(required=True)
+    idcust = fields.Char(required=True)          # stripped
+    namecust = fields.Char()
+
+    _sql_constraints = [
+        ("customer_uniq", "unique(company, idcust)", "One mirror row per ARCUS customer."),
+    ]
+
+    def init(self):
+        # Name lookups compare like SQL Server does: trailing blanks ignored
+        tools.create_index(self._cr, "mssql_mirror_customer_name_idx", self._table,
+                           ["company", "rtrim(namecust)"])
+
+
+# -------------------------------------------------------------------------
+# COPY helpers (no Odoo environment needed beyond a cursor)
+# -------------------------------------------------------------------------
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\x00": ""})
+_needs_escape = re.compile(r"[\\\t\n\r\x00]").search
+
+
+def _copy_field(value):
+    if value is None:
+        return "\\N"
+    if value.__class__ is str:
+        # Almost no Sage 300 text needs escaping: only those pay for translate()
+        return value.translate(_COPY_ESCAPES) if _needs_escape(value) else value
+    return str(value)
+
+
+def copy_rows(cr, table, columns, rows, batch_size=COPY_BATCH_SIZE):
+    """COPY ``rows`` (tuples in ``columns`` order) into ``table``; returns the row count."""
+    sql = "COPY %s (%s) FROM STDIN" % (table, ", ".join(columns))
+    count = pending = 0
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(map(_copy_field, row)))
+        buf.write("\n")
+        pending += 1
+        if pending == batch_size:
+            buf.seek(0)
+            cr.copy_expert(sql, buf)
+            count += pending
+            buf, pending = io.StringIO(), 0
+    if pending:
+        buf.seek(0)
+        cr.copy_expert(sql, buf)
+        count += pending
+    return count
+
+
+def _fetched(cur, batch_size=FETCH_BATCH_SIZE):
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            return
+        yield from batch
+
+
+def _item_row(company, r):
+    idcust, idinvc, cntpaym, datedue, ordernbr, custpo, desc, amount = r[:8]
+    due = None if datedue is None else int(datedue)
+    # TRY_CONVERT(date, ..., 112) only accepts 8 digit yyyymmdd values
+    day = aging_rules.from_ymd(due) if due and due >= 10000101 else None
+    return (company, (idcust or "").strip(), idinvc or "", int(cntpaym or 0), due,
+            day.isoformat() if day else None, ordernbr, custpo, desc, amount)
+
+
+def _customer_row(company, r):
+    return company, (r[0] or "").strip(), r[1]
+
+
+def _watermark(cur, sql):
+    cur.execute(sql)
+    top = cur.fetchone()
+    return (int(top[0] or 0), int(top[1] or 0)) if top else (0, 0)
+
+
+class MssqlMirrorSync(models.Model):
+    """Sync state of one company's mirror: watermarks, last loads and row counts."""
+    _name = "mssql.mirror.sync"
+    _description = "Receivables mirror sync state"
+    _log_access = False
+
+    company = fields.Char(required=True, index=True)
+    item_audtdate = fields.Integer()
+    item_audttime = fields.Integer()
+    customer_audtdate = fields.Integer()
+    customer_audttime = fields.Integer()
+    loaded_at = fields.Float()      # epoch seconds of the last full load
+    synced_at = fields.Float()      # epoch seconds of the last sync (full or incremental)
+    items = fields.Integer()
+    customers = fields.Integer()
+    error = fields.Text()
+
+    _sql_constraints = [
+        ("company_uniq", "unique(company)", "One sync state per company."),
+    ]
+
+    # -------------------------------------------------------------------------
+    # State
+    # -------------------------------------------------------------------------
+    @api.model
+    def _state(self, company):
+        self.env.cr.execute("""
+            SELECT item_audtdate, item_audttime, customer_audtdate, customer_audttime, loaded_at, items, customers
+            FROM mssql_mirror_sync WHERE company = %s
+        """, [company])
+        row = self.env.cr.fetchone()
+        if not row:
+            return None
+        return {
+            "items_mark": (row[0] or 0, row[1] or 0),
+            "customers_mark": (row[2] or 0, row[3] or 0),
+            "loaded_at": row[4] or 0.0,
+            "items": row[5] or 0,
+            "customers": row[6] or 0,
+        }
+
+    @api.model
+    def _save_state(self, company, state):
+        self.env.cr.execute("""
+            INSERT INTO mssql_mirror_sync (company, item_audtdate, item_audttime, customer_audtdate,
+                                           customer_audttime, loaded_at, synced_at, items, customers, error)
+            VALUES (%(company)s, %(i_date)s, %(i_time)s, %(c_date)s, %(c_time)s, %(loaded_at)s, %(now)s,
+                    %(items)s, %(customers)s, NULL)
+            ON CONFLICT (company) DO UPDATE
+               SET item_audtdate = EXCLUDED.item_audtdate, item_audttime = EXCLUDED.item_audttime,
+                   customer_audtdate = EXCLUDED.customer_audtdate, customer_audttime = EXCLUDED.customer_audttime,
+                   loaded_at = EXCLUDED.loaded_at, synced_at = EXCLUDED.synced_at,
+                   items = EXCLUDED.items, customers = EXCLUDED.customers, error = NULL
+        """, {
+            "company": company,
+            "i_date": state["items_mark"][0], "i_time": state["items_mark"][1],
+            "c_date": state["customers_mark"][0], "c_time": state["customers_mark"][1],
+            "loaded_at": state["loaded_at"], "now": time.time(),
+            "items": state["items"], "customers": state["customers"],
+        })
+
+    @api.model
+    def check_loaded(self, companies):
+        """Raise unless every company code in ``companies`` had a full load."""
+        self.env.cr.execute(
+            "SELECT company FROM mssql_mirror_sync WHERE company = ANY(%s) AND loaded_at > 0", [list(companies)],
+        )
+        missing = set(companies) - {row[0] for row in self.env.cr.fetchall()}
+        if missing:
+            raise UserError(_("The PostgreSQL mirror is not loaded yet for: %s (run a mirror sync)")
+                            % ", ".join(sorted(missing)))
+
+    @api.model
+    def status(self):
+        """Sync state of every company, for the metrics endpoint."""
+        self.env.cr.execute("""
+            SELECT company, loaded_at, synced_at, items, customers, error FROM mssql_mirror_sync ORDER BY company
+        """)
+        return [
+            {"company": company, "loaded_at": loaded_at, "synced_at": synced_at,
+             "items": items or 0, "customers": customers or 0, "error": error or None}
+            for company, loaded_at, synced_at, items, customers, error in self.env.cr.fetchall()
+        ]
+
+    # -------------------------------------------------------------------------
+    # Sync
+    # -------------------------------------------------------------------------
+    @api.model
+    def _cron_sync(self):
+        """Keep the mirror current: every company in its own transaction."""
+        Bridge = self.env["mssql.bridge"].sudo()
+        if Bridge._source() != "mirror" and not Bridge._bool_param("mssql.mirror_sync"):
+            return
+        for company in Bridge._companies():
+            try:
+                self._sync_company(Bridge, company)
+                self.env.cr.commit()
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.exception("mirror sync of %s failed", company["code"])
+                self.env.cr.execute("""
+                    INSERT INTO mssql_mirror_sync (company, error) VALUES (%s, %s)
+                    ON CONFLICT (company) DO UPDATE SET error = EXCLUDED.error
+                """, [company["code"], str(e)])
+                self.env.cr.commit()
+
+    @api.model
+    def sync(self, full=False):
+        """Sync every company in the current transaction; ``{code: counts or None if skipped}``."""
+        Bridge = self.env["mssql.bridge"].sudo()
+        return {c["code"]: self._sync_company(Bridge, c, full=full) for c in Bridge._companies()}
+
+    @api.model
+    def _sync_company(self, Bridge, company, full=False):
+        code = company["code"]
+        cr = self.env.cr
+        # One sync per company at a time (cron, Refresh button); the lock ends with the transaction
+        cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", ["mssql_mirror:%s" % code])
+        if not cr.fetchone()[0]:
+            _logger.info("mirror sync of %s already running, skipped", code)
+            return None
+        state = self._state(code)
+        interval = Bridge._int_param("mssql.mirror_full_interval", DEFAULT_FULL_INTERVAL)
+        full = full or not state or not state["loaded_at"] or (
+            interval > 0 and time.time() - state["loaded_at"] > interval
+        )
+        t0 = time.perf_counter()
+        name = "mirror_sync"
+        span = Bridge._span("%s[%s]" % (name, code) if Bridge._multi_company() else name)
+        with _borrowed(Bridge._pool(company), span, Bridge._query_timeout(name),
+                       breaker=Bridge._breaker(company)) as conn:
+            try:
+                cur = conn.cursor()
+                if full:
+                    state = self._load_full(cur, code)
+                else:
+                    state = self._load_changes(cur, code, state)
+            except Exception as e:
+                raise UserError(_("Mirror sync of %s failed: %s") % (code, e))
+        self._save_state(code, state)
+        _logger.info("mirror sync of %s (%s): %s items, %s customers in %.1fs", code,
+                     "full" if full else "incremental", state["items"], state["customers"],
+                     time.perf_counter() - t0)
+        return {"full": full, "items": state["items"], "customers": state["customers"],
+                "changed": state.get("changed", 0)}
+
+    @api.model
+    def _load_full(self, cur, code):
+        cr = self.env.cr
+        # Watermarks first: a change racing the load is re-applied by the next run
+        items_mark = _watermark(cur, WATERMARK_SQL)
+        customers_mark = _watermark(cur, CUSTOMER_WATERMARK_SQL)
+
+        cr.execute("DELETE FROM %s WHERE company = %%s" % CUSTOMER_TABLE, [code])
+        cur.execute(MIRROR_CUSTOMERS_SQL)
+        customers = copy_rows(cr, CUSTOMER_TABLE, CUSTOMER_COLUMNS,
+                              (_customer_row(code, r) for r in _fetched(cur)))
+
+        cr.execute("DELETE FROM %s WHERE company = %%s" % ITEM_TABLE, [code])
+        cur.execute(MIRROR_ITEMS_SQL)
+        items = copy_rows(cr, ITEM_TABLE, ITEM_COLUMNS, (_item_row(code, r) for r in _fetched(cur)))
+
+        cr.execute("ANALYZE %s" % CUSTOMER_TABLE)
+        cr.execute("ANALYZE %s" % ITEM_TABLE)
+        return {"items_mark": items_mark, "customers_mark": customers_mark, "loaded_at": time.time(),
+                "items": items, "customers": customers, "changed": items + customers}
+
+    @api.model
+    def _load_changes(self, cur, code, state):
+        cr = self.env.cr
+        state = dict(state, changed=0)
+
+        audtdate, audttime = state["customers_mark"]
+        cur.execute(MIRROR_CHANGED_CUSTOMERS_SQL, [audtdate, audtdate, audttime])
+        changed = cur.fetchall()
+        if changed:
+            cr.execute("DELETE FROM %s WHERE company = %%s AND idcust = ANY(%%s)" % CUSTOMER_TABLE,
+                       [code, [(r[0] or "").strip() for r in changed]])
+            removed = cr.rowcount
+            added = copy_rows(cr, CUSTOMER_TABLE, CUSTOMER_COLUMNS, (_customer_row(code, r) for r in changed))
+            state["customers"] += added - removed
+            state["customers_mark"] = max((int(r[2] or 0), int(r[3] or 0)) for r in changed)
+            state["changed"] += len(changed)
+
+        audtdate, audttime = state["items_mark"]
+        cur.execute(MIRROR_CHANGED_ITEMS_SQL, [audtdate, audtdate, audttime])
+        changed = cur.fetchall()
+        if changed:
+            keys = [_item_row(code, r) for r in changed]
+            cr.execute("""
+                DELETE FROM %s m
+                USING unnest(%%s::varchar[], %%s::varchar[], %%s::int[]) AS k(idcust, idinvc, cntpaym)
+                WHERE m.company = %%s AND m.idcust = k.idcust AND m.idinvc = k.idinvc AND m.cntpaym = k.cntpaym
+            """ % ITEM_TABLE, [[k[1] for k in keys], [k[2] for k in keys], [k[3] for k in keys], code])
+            removed = cr.rowcount
+            # Paid or zeroed documents only leave the mirror
+            added = copy_rows(cr, ITEM_TABLE, ITEM_COLUMNS, (k for k, r in zip(keys, changed) if r[8]))
+            state["items"] += added - removed
+            state["items_mark"] = max((int(r[9] or 0), int(r[10] or 0)) for r in changed)
+            state["changed"] += len(changed)
+        return state
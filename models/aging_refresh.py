@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+from odoo import SUPERUSER_ID, api, fields, models
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+# A job still 'running' after this long is considered dead (worker recycled)
+STALE_JOB_SECONDS = 900
+
+
+class MssqlRefreshJob(models.Model):
+    """Status of background MSSQL refreshes, shared by every Odoo worker.
+
+    The job itself runs in a thread of the worker that started it, with its own
+    cursor; status transitions are committed in short separate transactions so
+    that any worker can answer the status endpoint.
+    """
+    _name = "mssql.refresh.job"
+    _description = "Receivables background refresh status"
+    _log_access = False
+
+    kind = fields.Char(required=True, index=True)      # "aging", "bucket:d90p", ...
+    state = fields.Selection(
+        [("idle", "Idle"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")],
+        required=True,
+        default="idle",
+    )
+    started_at = fields.Float()       # epoch seconds
+    finished_at = fields.Float()
+    row_count = fields.Integer()
+    error = fields.Text()
+
+    _sql_constraints = [
+        ("kind_uniq", "unique(kind)", "One status row per refresh kind."),
+    ]
+
+    # -------------------------------------------------------------------------
+    # Status
+    # -------------------------------------------------------------------------
+    @api.model
+    def status(self, kind):
+        self.env.cr.execute(
+            "SELECT state, started_at, finished_at, row_count, error FROM mssql_refresh_job WHERE kind = %s",
+            [kind],
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return {"kind": kind, "state": "idle", "elapsed": 0.0, "rows": 0, "error": None}
+        state, started, finished, count, error = row
+        end = finished if state in ("done", "failed") and finished else time.time()
+        return {
+            "kind": kind,
+            "state": state,
+            "elapsed": round(max(0.0, end - (started or end)), 1),
+            "started_at": started,
+            "finished_at": finished,
+            "rows": count or 0,
+            "error": error or None,
+        }
+
+    # -------------------------------------------------------------------------
+    # Start (claim the job atomically, then run it off the request path)
+    # -------------------------------------------------------------------------
+    @api.model
+    def start(self, kind):
+        """Start a background refresh of ``kind``; False if one is already running."""
+        dbname = self.env.cr.dbname
+        now = time.time()
+        with Registry(dbname).cursor() as cr:
+            cr.execute("""
+                INSERT INTO mssql_refresh_job (kind, state, started_at, finished_at, row_count, error)
+                VALUES (%(kind)s, 'running', %(now)s, NULL, 0, NULL)
+                ON CONFLICT (kind) DO UPDATE
+                   SET state = 'running', started_at = %(now)s, finished_at = NULL, row_count = 0, error = NULL
+                 WHERE mssql_refresh_job.state <> 'running'
+                    OR mssql_refresh_job.started_at < %(stale)s
+                RETURNING id
+            """, {"kind": kind, "now": now, "stale": now - STALE_JOB_SECONDS})
+            claimed = bool(cr.fetchone())
+        if not claimed:
+            return False
+        thread = threading.Thread(
+            target=_run_job, args=(dbname, kind), name="recv-refresh-%s" % kind, daemon=True,
+        )
+        thread.start()
+        return True
+
+
+def _finish(dbname, kind, state, rows=0, error=None):
+    with Registry(dbname).cursor() as cr:
+        cr.execute(
+            "UPDATE mssql_refresh_job SET state = %s, finished_at = %s, row_count = %s, error = %s WHERE kind = %s",
+            [state, time.time(), rows, error, kind],
+        )
+
+
+def _run_job(dbname, kind):
+    threading.current_thread().dbname = dbname
+    try:
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            rows = env["mssql.bridge"]._refresh_kind(kind)
+        _finish(dbname, kind, "done", rows=rows)
+    except Exception as e:
+        _logger.exception("background refresh %s failed", kind)
+        _finish(dbname, kind, "failed", error=str(e))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Columnar aging result: one entry per customer, one float array per column.
+
+Codes and names are stored once in parallel lists and every amount column is
+an ``array('d')``, so a 100k-customer aging costs a few MB instead of a dict
+per customer. Totals, top-N and filters run over the arrays; ``row(i)`` and
+iteration build the familiar ``get_aging_by_customer`` dicts only for the rows
+actually rendered (QWeb, JSON API).
+
+A consolidated (multi-company) result also carries ``companies``, the Sage 300
+company of each row, and ``sources``, the status of every company queried
+(see company_fanout), so a partial answer says which companies are missing.
+"""
+import hashlib
+import heapq
+import math
+from array import array
+from itertools import compress
+
+from .aging_rules import BUCKET_KEYS
+
+AMOUNT_COLUMNS = BUCKET_KEYS + ("total",)
+
+# Amounts below this are zero at the 3 decimals the dashboard shows
+ZERO_EPSILON = 0.0005
+
+
+class AgingResult:
+    __slots__ = ("codes", "names", "columns", "companies", "sources", "_digest")
+
+    def __init__(self, codes=(), names=(), columns=None, companies=None, sources=None):
+        self.codes = list(codes)
+        self.names = list(names)
+        self.columns = {
+            col: array("d", (columns or {}).get(col) or [0.0] * len(self.codes))
+            for col in AMOUNT_COLUMNS
+        }
+        self.companies = list(companies) if companies is not None else None
+        self.sources = list(sources) if sources is not None else None
+        self._digest = None
+
+    # ---------------------------------------------------------------------
+    # Builders
+    # ---------------------------------------------------------------------
+    @classmethod
+    def from_records(cls, records):
+        """From ``(code, name, current, d0_30, d31_60, d61_90, d90p, total)`` tuples (DB rows)."""
+        records = records if isinstance(records, list) else list(records)
+        if not records:
+            return cls()
+        code_col, name_col, *amounts = zip(*records)
+        return cls(
+            [(c or "").strip() for c in code_col],
+            [(n or "").strip() for n in name_col],
+            {col: [float(v or 0.0) for v in values] for col, values in zip(AMOUNT_COLUMNS, amounts)},
+        )
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From ``get_aging_by_customer``-shaped dicts."""
+        rows = list(rows or ())
+        result = cls.from_records(
+            (r.get("customer_code"), r.get("customer_name")) + tuple(r.get(col) for col in AMOUNT_COLUMNS)
+            for r in rows
+        )
+        if rows and "company" in rows[0]:
+            result.companies = [r.get("company") or "" for r in rows]
+        return result
+
+    @classmethod
+    def concat(cls, parts, sources=None):
+        """Consolidate ``[(company_code, AgingResult)]`` into one result with a company column."""
+        codes, names, companies = [], [], []
+        columns = {col: array("d") for col in AMOUNT_COLUMNS}
+        for company, part in parts:
+            codes.extend(part.codes)
+            names.extend(part.names)
+            companies.extend([company] * len(part))
+            for col in AMOUNT_COLUMNS:
+                columns[col].extend(part.columns[col])
+        return cls(codes, names, columns, companies=companies, sources=sources)
+
+    @classmethod
+    def coerce(cls, value):
+        """An AgingResult from itself, its ``to_json()`` form or a list of row dicts."""
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict) and "codes" in value:
+            return cls(value["codes"], value.get("names") or [""] * len(value["codes"]),
+                       value.get("columns"), companies=value.get("companies"), sources=value.get("sources"))
+        return cls.from_rows(value)
+
+    def to_json(self):
+        data = {
+            "codes": self.codes,
+            "names": self.names,
+            "columns": {col: self.columns[col].tolist() for col in AMOUNT_COLUMNS},
+        }
+        if self.companies is not None:
+            data["companies"] = self.companies
+        if self.sources is not None:
+            data["sources"] = self.sources
+        return data
+
+    def to_columnar(self):
+        """Compact payload: the header once, then one value array per column."""
+        header = ["customer_code", "customer_name"] + list(AMOUNT_COLUMNS)
+        values = [self.codes, self.names] + [self.columns[col].tolist() for col in AMOUNT_COLUMNS]
+        if self.companies is not None:
+            header.insert(0, "company")
+            values.insert(0, self.companies)
+        return {"columns": header, "values": values}
+
+    def digest(self):
+        """Content hash (hex) of the result, computed once.
+
+        Equal data gives an equal digest in every worker, whenever it was
+        loaded, so it can serve as the version of a snapshot (HTTP ETag).
+        """
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=12)
+            h.update("\x1f".join(self.codes).encode("utf-8"))
+            h.update(b"\x1e")
+            h.update("\x1f".join(self.names).encode("utf-8"))
+            if self.companies is not None:
+                h.update(b"\x1e")
+                h.update("\x1f".join(self.companies).encode("utf-8"))
+            for source in self.sources or ():
+                # Which companies answered, not how fast
+                h.update(("\x1d%s:%s" % (source.get("company"), source.get("state"))).encode("utf-8"))
+            for col in AMOUNT_COLUMNS:
+                h.update(self.columns[col].tobytes())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    # ---------------------------------------------------------------------
+    # Row view
+    # ---------------------------------------------------------------------
+    def __len__(self):
+        return len(self.codes)
+
+    def row(self, i):
+        rec = {"customer_code": self.codes[i], "customer_name": self.names[i]}
+        if self.companies is not None:
+            rec["company"] = self.companies[i]
+        for col in AMOUNT_COLUMNS:
+            rec[col] = self.columns[col][i]
+        return rec
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row(j) for j in range(*i.indices(len(self)))]
+        return self.row(i)
+
+    def __iter__(self):
+        return (self.row(i) for i in range(len(self)))
+
+    def to_dicts(self, positions=None):
+        """Row dicts (all, or at ``positions``) for JSON responses."""
+        return [self.row(i) for i in (range(len(self)) if positions is None else positions)]
+
+    # ---------------------------------------------------------------------
+    # Column operations
+    # ---------------------------------------------------------------------
+    def totals(self):
+        return {col: math.fsum(self.columns[col]) for col in AMOUNT_COLUMNS}
+
+    def top(self, n, column="total"):
+        """Positions of the ``n`` largest values of ``column``."""
+        return heapq.nlargest(n, range(len(self)), key=self.columns[column].__getitem__)
+
+    def nonzero(self, column="total", positions=None):
+        """Positions (optionally among ``positions``) whose ``column`` is not ~0."""
+        values = self.columns[column]
+        if positions is None:
+            return list(compress(range(len(values)), (abs(v) >= ZERO_EPSILON for v in values)))
+        return [i for i in positions if abs(values[i]) >= ZERO_EPSILON]
+
+    def take(self, positions):
+        """A new result holding only the rows at ``positions``."""
+        positions = list(positions)
+        return AgingResult(
+            [self.codes[i] for i in positions],
+            [self.names[i] for i in positions],
+            {col: [self.columns[col][i] for i in positions] for col in AMOUNT_COLUMNS},
+            companies=None if self.companies is None else [self.companies[i] for i in positions],
+            sources=self.sources,
+        )
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Python mirror of the SQL bucket rules in bridge.py (bucket_case).
+
+Due dates are yyyymmdd integers, exactly as AROBL.DATEDUE stores them, so a
+bucket is decided by plain integer comparisons against the boundaries.
+"""
+from datetime import date, timedelta
+
+BUCKET_KEYS = ("current", "d0_30", "d31_60", "d61_90", "d90p")
+DEFAULT_BOUNDARIES = (30, 60, 90)
+
+
+def ymd(d):
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def from_ymd(value):
+    """yyyymmdd integer -> date, or None for 0 / invalid values."""
+    try:
+        value = int(value or 0)
+        return date(value // 10000, (value // 100) % 100, value % 100)
+    except (TypeError, ValueError):
+        return None
+
+
+def bucket_bounds(today, boundaries=DEFAULT_BOUNDARIES):
+    """``(d_today, d_30, d_60, d_90)`` as yyyymmdd integers, like BOUNDS_JOIN."""
+    return (ymd(today),) + tuple(ymd(today - timedelta(days=days)) for days in boundaries)
+
+
+def is_forced_current(idinvc, amount):
+    """Negative PY*/C* documents always age as 'current'."""
+    return amount < 0 and (idinvc or "")[:1].upper() in ("P", "C")
+
+
+def bucket_of(idinvc, amount, due, bounds):
+    if is_forced_current(idinvc, amount):
+        return "current"
+    if due is None:
+        return "d90p"
+    d_today, d_30, d_60, d_90 = bounds
+    if due > d_today:
+        return "current"
+    if due >= d_30:
+        return "d0_30"
+    if due >= d_60:
+        return "d31_60"
+    if due >= d_90:
+        return "d61_90"
+    return "d90p"
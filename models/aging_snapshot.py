@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import timedelta
+
+from odoo import api, fields, models, tools
+
+from .aging_result import AgingResult
+
+_logger = logging.getLogger(__name__)
+
+AMOUNT_FIELDS = ("current_amt", "d0_30", "d31_60", "d61_90", "d90p", "total")
+
+DEFAULT_DAILY_DAYS = 90      # keep daily snapshots this long, then one per week
+DEFAULT_WEEKLY_DAYS = 730    # keep weekly snapshots this long, then one per month
+
+
+class MssqlAgingSnapshot(models.Model):
+    _name = "mssql.aging.snapshot"
+    _description = "Receivables Aging Snapshot (per customer, per day)"
+    _order = "date desc, total desc"
+    _log_access = False
+
+    date = fields.Date(required=True, index=True)
+    granularity = fields.Selection(
+        [("day", "Daily"), ("week", "Weekly"), ("month", "Monthly")],
+        required=True,
+        default="day",
+    )
+    company = fields.Char(index=True, help="Sage 300 company (consolidated multi-company snapshots)")
+    customer_code = fields.Char(required=True, index=True)
+    customer_name = fields.Char()
+    current_amt = fields.Float(string="Current", digits=(16, 3))
+    d0_30 = fields.Float(string="1–30", digits=(16, 3))
+    d31_60 = fields.Float(string="31–60", digits=(16, 3))
+    d61_90 = fields.Float(string="61–90", digits=(16, 3))
+    d90p = fields.Float(string="90+", digits=(16, 3))
+    total = fields.Float(digits=(16, 3))
+
+    _sql_constraints = [
+        ("date_customer_uniq", "unique(date, company, customer_code)",
+         "One snapshot row per company, customer and date."),
+    ]
+
+    def init(self):
+        tools.create_index(self._cr, "mssql_aging_snapshot_gran_date_idx", self._table, ["granularity", "date"])
+
+    # -------------------------------------------------------------------------
+    # Cron: one MSSQL aggregation per run, then roll old days up
+    # -------------------------------------------------------------------------
+    @api.model
+    def _cron_take_snapshot(self):
+        rows = self.env["mssql.bridge"].sudo().get_aging_by_customer()
+        missing = [s["company"] for s in rows.sources or () if s.get("state") != "ok"]
+        if missing:
+            # A partial consolidation would show up as a dip in the trend: keep
+            # the day's previous snapshot and let the next run try again
+            _logger.warning("aging snapshot skipped: no answer from %s", ", ".join(missing))
+            return
+        today = fields.Date.context_today(self)
+        self.env.cr.execute("DELETE FROM mssql_aging_snapshot WHERE date = %s", [today])
+        cols = rows.columns
+        # Single company: the database is the company, so the key stays unique
+        companies = rows.companies or [self.env["mssql.bridge"].sudo()._companies()[0]["code"]] * len(rows)
+        self.create([{
+            "date": today,
+            "granularity": "day",
+            "company": companies[i],
+            "customer_code": rows.codes[i],
+            "customer_name": rows.names[i],
+            "current_amt": cols["current"][i],
+            "d0_30": cols["d0_30"][i],
+            "d31_60": cols["d31_60"][i],
+            "d61_90": cols["d61_90"][i],
+            "d90p": cols["d90p"][i],
+            "total": cols["total"][i],
+        } for i in range(len(rows))])
+        _logger.info("aging snapshot %s: %s customers", today, len(rows))
+        self._rollup(today)
+
+    @api.model
+    def _rollup(self, today):
+        """Keep only the last snapshot of each week (then month) once it is old enough.
+
+        Balances are stocks, not flows: the period's closing snapshot stands for
+        the whole period, so rolling up means keeping it and dropping the rest.
+        """
+        ICP = self.env["ir.config_parameter"].sudo()
+        daily_days = int(ICP.get_param("mssql.snapshot_daily_days", DEFAULT_DAILY_DAYS))
+        weekly_days = int(ICP.get_param("mssql.snapshot_weekly_days", DEFAULT_WEEKLY_DAYS))
+
+        # Cut-offs aligned on period starts so no period is split
+        week_cutoff = today - timedelta(days=daily_days)
+        week_cutoff -= timedelta(days=week_cutoff.weekday())
+        month_cutoff = (today - timedelta(days=weekly_days)).replace(day=1)
+
+        for source, target, period, cutoff in (
+            ("day", "week", "week", week_cutoff),
+            ("week", "month", "month", month_cutoff),
+        ):
+            self.env.cr.execute(f"""
+                UPDATE mssql_aging_snapshot SET granularity = %(target)s
+                 WHERE granularity = %(source)s
+                   AND date IN (
+                       SELECT MAX(date) FROM mssql_aging_snapshot
+                        WHERE granularity = %(source)s AND date < %(cutoff)s
+                        GROUP BY date_trunc('{period}', date)
+                   )
+            """, {"source": source, "target": target, "cutoff": cutoff})
+            self.env.cr.execute(
+                "DELETE FROM mssql_aging_snapshot WHERE granularity = %s AND date < %s",
+                [source, cutoff],
+            )
+        self.invalidate_model()
+
+    # -------------------------------------------------------------------------
+    # Readers for the charts page
+    # -------------------------------------------------------------------------
+    @api.model
+    def latest_date(self):
+        self.env.cr.execute("SELECT MAX(date) FROM mssql_aging_snapshot")
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def version(self):
+        """Cheap change marker of the stored snapshots: ``(today, latest date, max id)``.
+
+        The cron deletes and re-creates the day's rows (and rolls up in the same
+        run), so MAX(id) moves whenever the charts data may have changed; today
+        is part of it because the trend window slides with the date.
+        """
+        self.env.cr.execute("SELECT MAX(date), MAX(id) FROM mssql_aging_snapshot")
+        latest, max_id = self.env.cr.fetchone()
+        return fields.Date.context_today(self), latest, max_id
+
+    @api.model
+    def latest_rows(self):
+        """Latest snapshot as an AgingResult, like get_aging_by_customer."""
+        latest = self.latest_date()
+        if not latest:
+            return AgingResult()
+        self.env.cr.execute(f"""
+            SELECT company, customer_code, customer_name, {", ".join(AMOUNT_FIELDS)}
+              FROM mssql_aging_snapshot
+             WHERE date = %s
+             ORDER BY company, customer_code
+        """, [latest])
+        records = self.env.cr.fetchall()
+        result = AgingResult.from_records([r[1:] for r in records])
+        companies = [r[0] or "" for r in records]
+        if len(set(companies)) > 1:
+            result.companies = companies
+        return result
+
+    @api.model
+    def trend(self, days=365):
+        """Ledger totals per snapshot date (daily, then weekly/monthly further back)."""
+        self.env.cr.execute("""
+            SELECT date,
+                   SUM(current_amt), SUM(d0_30), SUM(d31_60), SUM(d61_90), SUM(d90p), SUM(total)
+              FROM mssql_aging_snapshot
+             WHERE date >= %s
+             GROUP BY date
+             ORDER BY date
+        """, [fields.Date.context_today(self) - timedelta(days=days)])
+        trend = {"labels": [], "current": [], "d0_30": [], "d31_60": [], "d61_90": [], "d90p": [], "total": []}
+        for day, *sums in self.env.cr.fetchall():
+            trend["labels"].append(fields.Date.to_string(day))
+            for key, value in zip(("current", "d0_30", "d31_60", "d61_90", "d90p", "total"), sums):
+                trend[key].append(round(float(value or 0.0), 3))
+        return trend
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Open items in flat arrays, re-bucketed for any as-of date and boundaries.
+
+The aging snapshot answers for today with the 30/60/90 boundaries only. This
+store keeps what the bucket rules need of every open AROBL document
+(customer, due date, amount, IDINVC prefix), so another date or other
+boundaries cost no query:
+
+- documents are sorted by customer then due date (yyyymmdd, 0 when missing),
+  so a customer's documents are one slice of ``dues`` and each bucket is a
+  sub-range of it, found by bisecting on the boundary dates;
+- amounts are integer thousandths kept as a running sum (``cumulative``), so
+  a bucket sum is one subtraction, exact at the dashboard's 3 decimals;
+- negative PY*/C* documents (always 'current', see aging_rules) are summed
+  per customer when loading and kept out of the due-date ranges.
+
+A re-bucketing is then a few bisects per customer, whatever the number of
+documents. The store holds the items open when it was loaded: an earlier
+as-of date re-ages them, it does not bring back documents paid since.
+"""
+import bisect
+import threading
+from array import array
+from decimal import Decimal
+
+from .aging_index import AgingIndex
+from .aging_result import AgingResult
+from .aging_rules import BUCKET_KEYS, DEFAULT_BOUNDARIES, bucket_bounds, is_forced_current
+
+# Table indexes kept per store (one per distinct as-of date and boundaries)
+MEMO_SIZE = 32
+
+
+def _milli(value):
+    """Amount -> integer thousandths (AMTDUEHC has 3 decimals)."""
+    if value is None:
+        return 0
+    if isinstance(value, Decimal):
+        return int(value.scaleb(3).to_integral_value())
+    return int(round(float(value) * 1000))
+
+
+def parse_boundaries(value):
+    """Ascending bucket boundaries (days) from ``"30,60,90"`` or a list; the defaults when empty.
+
+    There are as many as the dashboard has aged columns between 'current'
+    and the oldest one; raise ValueError otherwise.
+    """
+    if not value:
+        return DEFAULT_BOUNDARIES
+    if isinstance(value, str):
+        value = [v for v in value.replace(";", ",").split(",") if v.strip()]
+    try:
+        days = tuple(int(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError("boundaries must be whole numbers of days")
+    if len(days) != len(DEFAULT_BOUNDARIES):
+        raise ValueError("expected %s boundaries" % len(DEFAULT_BOUNDARIES))
+    if days[0] < 1 or any(a >= b for a, b in zip(days, days[1:])):
+        raise ValueError("boundaries must be positive and increasing")
+    return days
+
+
+class InvoiceStore:
+    """Row input: ``(idcust, name, datedue, amount, idinvc_prefix)``, per company."""
+
+    __slots__ = ("codes", "names", "companies", "sources", "starts", "dues", "cumulative", "forced",
+                 "_memo", "_search", "_lock")
+
+    def __init__(self, codes=(), names=(), starts=(0,), dues=(), cumulative=(0,), forced=(),
+                 companies=None, sources=None):
+        self.codes = list(codes)
+        self.names = list(names)
+        self.companies = list(companies) if companies is not None else None
+        self.sources = list(sources) if sources is not None else None
+        self.starts = array("l", starts)            # customer i: documents starts[i] to starts[i + 1]
+        self.dues = array("l", dues)                # ascending within a customer
+        self.cumulative = array("q", cumulative)    # thousandths, sum of the documents before each index
+        self.forced = array("q", forced)            # forced-current thousandths, per customer
+        self._memo = {}
+        self._search = None
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------------
+    # Builders
+    # ---------------------------------------------------------------------
+    @classmethod
+    def from_parts(cls, parts, sources=None):
+        """From ``[(company_code, records)]``; a None company (single database) adds no company column.
+
+        Customers are kept in company then code order, and only those whose
+        open items do not net to zero (the dashboard's customer set).
+        """
+        parts = list(parts)
+        docs = []           # ((company position, code), due, thousandths)
+        names = {}
+        forced = {}
+        totals = {}
+        for position, (_company, records) in enumerate(parts):
+            for idcust, name, datedue, amount, prefix in records:
+                milli = _milli(amount)
+                if not milli:
+                    continue
+                key = (position, (idcust or "").strip())
+                names.setdefault(key, (name or "").strip())
+                totals[key] = totals.get(key, 0) + milli
+                if is_forced_current(prefix, milli):
+                    forced[key] = forced.get(key, 0) + milli
+                else:
+                    docs.append((key, int(datedue or 0), milli))
+        docs.sort()
+
+        keys = sorted(key for key, total in totals.items() if total)
+        starts, dues, cumulative = array("l", [0]), array("l"), array("q", [0])
+        running, i, n = 0, 0, len(docs)
+        for key in keys:
+            # Documents of customers netting to zero are skipped
+            while i < n and docs[i][0] < key:
+                i += 1
+            while i < n and docs[i][0] == key:
+                running += docs[i][2]
+                dues.append(docs[i][1])
+                cumulative.append(running)
+                i += 1
+            starts.append(len(dues))
+        consolidated = any(company is not None for company, _records in parts)
+        return cls(
+            [code for _position, code in keys],
+            [names[key] for key in keys],
+            starts, dues, cumulative,
+            [forced.get(key, 0) for key in keys],
+            companies=[parts[position][0] for position, _code in keys] if consolidated else None,
+            sources=sources,
+        )
+
+    @classmethod
+    def coerce(cls, value):
+        """An InvoiceStore from itself or its ``to_json()`` form."""
+        if isinstance(value, cls):
+            return value
+        return cls(value["codes"], value["names"], value["starts"], value["dues"], value["cumulative"],
+                   value["forced"], companies=value.get("companies"), sources=value.get("sources"))
+
+    def to_json(self):
+        data = {
+            "codes": self.codes,
+            "names": self.names,
+            "starts": self.starts.tolist(),
+            "dues": self.dues.tolist(),
+            "cumulative": self.cumulative.tolist(),
+            "forced": self.forced.tolist(),
+        }
+        if self.companies is not None:
+            data["companies"] = self.companies
+        if self.sources is not None:
+            data["sources"] = self.sources
+        return data
+
+    def __len__(self):
+        return len(self.codes)
+
+    # ---------------------------------------------------------------------
+    # Re-bucketing
+    # ---------------------------------------------------------------------
+    def aging(self, as_of, boundaries=DEFAULT_BOUNDARIES):
+        """Per-customer bucket sums as of ``as_of`` (a date), as an AgingResult.
+
+        ``boundaries`` are the days past due where the aged buckets start
+        (d0_30 up to the first one, ..., d90p beyond the last).
+        """
+        d_today, *cuts = bucket_bounds(as_of, boundaries)
+        cuts.sort()     # oldest boundary date first, like the due dates
+        dues, cumulative, starts, forced = self.dues, self.cumulative, self.starts, self.forced
+        left, right = bisect.bisect_left, bisect.bisect_right
+        columns = {col: [] for col in BUCKET_KEYS + ("total",)}
+        # Oldest bucket first, in the order of the ranges below
+        aged = [columns[col].append for col in reversed(BUCKET_KEYS)]
+        add_total = columns["total"].append
+        for i in range(len(self.codes)):
+            start, end = starts[i], starts[i + 1]
+            edges = [start]
+            for cut in cuts:
+                edges.append(left(dues, cut, edges[-1], end))
+            edges.append(right(dues, d_today, edges[-1], end))
+            edges.append(end)
+            amounts = [cumulative[b] - cumulative[a] for a, b in zip(edges, edges[1:])]
+            amounts[-1] += forced[i]
+            for add, amount in zip(aged, amounts):
+                add(amount / 1000.0)
+            add_total((cumulative[end] - cumulative[start] + forced[i]) / 1000.0)
+        return AgingResult(self.codes, self.names, columns, companies=self.companies, sources=self.sources)
+
+    def index(self, as_of, boundaries=DEFAULT_BOUNDARIES):
+        """Paged table index (see aging_index) of ``aging(as_of, boundaries)``, memoised.
+
+        Customers, names and totals do not depend on the date, so every
+        index shares the customer search built for the first one.
+        """
+        key = (as_of, tuple(boundaries))
+        index = self._memo.get(key)
+        if index is not None:
+            return index
+        with self._lock:
+            index = self._memo.get(key)
+            if index is None:
+                if len(self._memo) >= MEMO_SIZE:
+                    self._memo.clear()
+                index = self._memo[key] = AgingIndex(self.aging(as_of, boundaries), search=self._search)
+                self._search = index.search
+        return index
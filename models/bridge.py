@@ -1,7 +1,350 @@
 # -*- coding: utf-8 -*-
-import pyodbc
-from odoo import api, models, _
+import functools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.modules.registry import Registry
+
+from . import (
+    aging_incremental, aging_index, aging_rules, aging_store, company_fanout, customer_search, mirror_sql,
+    mssql_pool, query_guard, query_metrics,
+)
+from . import row_decoding as rd
+from .aging_cache import snapshot_cache
+from .aging_result import AgingResult
+from .aging_rules import BUCKET_KEYS
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_TTL = 60  # seconds
+DEFAULT_FULL_REBUILD_INTERVAL = 3600  # seconds between full reloads of the incremental aggregate
+
+# Execution budget (seconds, 0 = none) of each query, by kind: the
+# mssql.timeout.<kind> parameters override these
+QUERY_KINDS = {
+    "aging_by_customer": "aging",
+    "aging_incremental": "aging",
+    "open_items": "aging",
+    "invoices_by_customer": "invoices",
+    "invoices_by_customers": "invoices",
+    "invoices_by_bucket": "bucket",
+    "export": "bucket",
+    "mirror_sync": "mirror",
+}
+DEFAULT_QUERY_TIMEOUTS = {"aging": 120, "invoices": 15, "bucket": 120, "mirror": 600}
+
+# mssql.source: where the get_* methods read (see aging_mirror)
+SOURCE_MSSQL, SOURCE_MIRROR = "mssql", "mirror"
+
+# SQL Server accepts at most 2100 parameters per statement
+IN_LIST_CHUNK = 1000
+
+# Streaming export: rows fetched per round trip, and the tuple layout
+EXPORT_BATCH_SIZE = 5000
+EXPORT_COLUMNS = (
+    "customer_code", "customer_name", "bucket", "IDINV", "DATEINVC",
+    "IDORDERNBR", "IDCUSTPO", "DESCINVC", "AMTINVCHC",
+)
+
+# Column decoders of the invoice queries (see row_decoding)
+INVOICE_SPEC = rd.RowSpec((
+    ("IDINV", rd.TEXT),
+    ("DATEINVC", rd.ISO_DATE),
+    ("DUE_DATE", rd.ISO_DATE),
+    ("IDORDERNBR", rd.TEXT),
+    ("IDCUSTPO", rd.TEXT),
+    ("DESCINVC", rd.RAW_TEXT),
+    ("AMTINVCHC", rd.AMOUNT),
+    ("bucket", rd.LOWER),
+))
+# Compact (as_tuples) variant: DUE_DATE only repeats DATEINVC
+COMPACT_INVOICE_SPEC = rd.RowSpec((
+    ("IDINV", rd.TEXT),
+    ("DATEINVC", rd.ISO_DATE),
+    ("DUE_DATE", None),
+    ("IDORDERNBR", rd.TEXT),
+    ("IDCUSTPO", rd.TEXT),
+    ("DESCINVC", rd.RAW_TEXT),
+    ("AMTINVCHC", rd.AMOUNT),
+    ("bucket", rd.LOWER),
+))
+BATCH_INVOICE_SPEC = rd.RowSpec((
+    ("customer_code", rd.STRIP),
+    ("IDINV", rd.TEXT),
+    ("DATEINVC", rd.ISO_DATE),
+    ("IDORDERNBR", rd.TEXT),
+    ("IDCUSTPO", rd.TEXT),
+    ("DESCINVC", rd.RAW_TEXT),
+    ("AMTINVCHC", rd.AMOUNT),
+    ("bucket", rd.LOWER),
+))
+# bucket_invoices_sql() columns
+BUCKET_INVOICE_SPEC = rd.RowSpec((
+    ("customer_code", rd.STRIP),
+    ("customer_name", rd.RAW_TEXT),
+    ("IDINV", rd.TEXT),
+    ("DATEINVC", rd.ISO_DATE),
+    ("DUE_DATE", rd.ISO_DATE),
+    ("IDORDERNBR", rd.TEXT),
+    ("IDCUSTPO", rd.TEXT),
+    ("DESCINVC", rd.RAW_TEXT),
+    ("AMTINVCHC", rd.AMOUNT),
+    ("bucket", None),
+))
+EXPORT_SPEC = rd.RowSpec((
+    ("customer_code", rd.STRIP),
+    ("customer_name", rd.STRIP),
+    ("IDINV", rd.TEXT),
+    ("DATEINVC", rd.ISO_DATE),
+    ("DUE_DATE", None),
+    ("IDORDERNBR", rd.TEXT),
+    ("IDCUSTPO", rd.TEXT),
+    ("DESCINVC", rd.RAW_TEXT),
+    ("AMTINVCHC", rd.AMOUNT),
+    ("bucket", rd.LOWER),
+), order=EXPORT_COLUMNS)
+
+# Bucket boundaries as yyyymmdd integers, evaluated once per query.
+# AROBL.DATEDUE is stored as a yyyymmdd number, so comparing the raw column
+# against these constants keeps every date predicate sargable.
+BOUNDS_JOIN = """
+    CROSS JOIN (
+        SELECT
+            CONVERT(int, CONVERT(char(8), GETDATE(), 112))                    AS d_today,
+            CONVERT(int, CONVERT(char(8), DATEADD(day, -30, GETDATE()), 112)) AS d_30,
+            CONVERT(int, CONVERT(char(8), DATEADD(day, -60, GETDATE()), 112)) AS d_60,
+            CONVERT(int, CONVERT(char(8), DATEADD(day, -90, GETDATE()), 112)) AS d_90
+    ) bd
+"""
+
+OPEN_ITEM_FILTER = "({a}.SWPAID IN ('0', 0) OR {a}.SWPAID IS NULL) AND {a}.AMTDUEHC <> 0"
+
+# Incremental aging: document-level rows in IncrementalAging's input layout
+# (idcust, idinvc, cntpaym, datedue, amount, name, is_open[, audtdate, audttime])
+OPEN_ITEMS_SQL = f"""
+    SELECT ob.IDCUST, ob.IDINVC, ob.CNTPAYM, ob.DATEDUE,
+           CAST(ob.AMTDUEHC AS DECIMAL(18,3)), cu.NAMECUST, 1
+    FROM AROBL ob
+    JOIN ARCUS cu ON cu.IDCUST = ob.IDCUST
+    WHERE {OPEN_ITEM_FILTER.format(a="ob")}
+"""
+
+CHANGED_ITEMS_SQL = f"""
+    SELECT ob.IDCUST, ob.IDINVC, ob.CNTPAYM, ob.DATEDUE,
+           CAST(ob.AMTDUEHC AS DECIMAL(18,3)), cu.NAMECUST,
+           CASE WHEN {OPEN_ITEM_FILTER.format(a="ob")} THEN 1 ELSE 0 END,
+           ob.AUDTDATE, ob.AUDTTIME
+    FROM AROBL ob
+    JOIN ARCUS cu ON cu.IDCUST = ob.IDCUST
+    WHERE ob.AUDTDATE > ? OR (ob.AUDTDATE = ? AND ob.AUDTTIME >= ?)
+"""
+
+# As-of aging: what aging_store.InvoiceStore keeps of each open document
+# (idcust, name, datedue, amount, idinvc prefix)
+STORE_ITEMS_SQL = f"""
+    SELECT ob.IDCUST, cu.NAMECUST, ob.DATEDUE,
+           CAST(ob.AMTDUEHC AS DECIMAL(18,3)), LEFT(ob.IDINVC, 1)
+    FROM AROBL ob
+    JOIN ARCUS cu ON cu.IDCUST = ob.IDCUST
+    WHERE {OPEN_ITEM_FILTER.format(a="ob")}
+"""
+
+WATERMARK_SQL = "SELECT TOP 1 AUDTDATE, AUDTTIME FROM AROBL ORDER BY AUDTDATE DESC, AUDTTIME DESC"
+
+
+def _forced_current(a):
+    """Negative PY*/C* documents always age as 'current'."""
+    return f"(({a}.IDINVC LIKE 'P%' OR {a}.IDINVC LIKE 'C%') AND {a}.AMTDUEHC < 0)"
+
+
+def bucket_case(a):
+    """Bucket of an AROBL row aliased ``a`` (needs BOUNDS_JOIN in the FROM clause).
+
+    Same rules as DATEDIFF(day, due, GETDATE()): < 0 current, 0-30, 31-60,
+    61-90, anything older (or without a due date) 90+.
+    """
+    return f"""
+            CASE
+                WHEN {_forced_current(a)} THEN 'current'
+                WHEN {a}.DATEDUE >  bd.d_today THEN 'current'
+                WHEN {a}.DATEDUE >= bd.d_30    THEN 'd0_30'
+                WHEN {a}.DATEDUE >= bd.d_60    THEN 'd31_60'
+                WHEN {a}.DATEDUE >= bd.d_90    THEN 'd61_90'
+                ELSE 'd90p'
+            END"""
+
+
+def bucket_invoices_sql(bucket=None):
+    """Invoices of the dashboard's customer set, for one bucket or (None) all of them.
+
+    Rows are ordered by customer name then code, so every customer's lines are
+    contiguous (the bucket page and the export group on that).
+    """
+    bucket_filter = f"AND {bucket_predicate('bl', bucket)}" if bucket else ""
+    return f"""
+            /* 1) Restrict to the *same* customer set that appears on the dashboard */
+            WITH allowed_customers AS (
+                SELECT ob.IDCUST AS customer_code
+                FROM AROBL ob
+                JOIN ARCUS cu ON cu.IDCUST = ob.IDCUST
+                WHERE {OPEN_ITEM_FILTER.format(a="ob")}                -- open, non-zero
+                GROUP BY ob.IDCUST
+                HAVING ABS(SUM(CAST(ob.AMTDUEHC AS DECIMAL(18,3)))) <> 0  -- net open ≠ 0
+            )
+
+            /* 2) List invoices for those customers in the requested bucket */
+            SELECT
+                LTRIM(RTRIM(bl.IDCUST))                                  AS customer_code,
+                cu.NAMECUST                                              AS customer_name,
+                bl.IDINVC                                                AS IDINV,
+                TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112) AS DATEINVC,
+                TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112) AS DUE_DATE,
+                bl.IDORDERNBR,
+                bl.IDCUSTPO,
+                bl.DESCINVC,
+                CAST(bl.AMTDUEHC AS DECIMAL(18,3))                       AS AMTINVCHC,
+                {bucket_case("bl")}                                      AS bucket
+            FROM AROBL bl
+            JOIN ARCUS cu ON cu.IDCUST = bl.IDCUST
+            {BOUNDS_JOIN}
+            WHERE {OPEN_ITEM_FILTER.format(a="bl")}
+              AND bl.IDCUST IN (SELECT customer_code FROM allowed_customers)
+              {bucket_filter}
+            ORDER BY cu.NAMECUST, bl.IDCUST, bl.DATEDUE DESC, bl.IDINVC;
+        """
+
+
+@contextmanager
+def _borrowed(pool, span, timeout=0, breaker=None, token=None, watchdog=True):
+    """A pooled connection timed under ``span``; it goes back to the pool on exit.
+
+    Uses no Odoo environment, so it also runs in fan-out threads and in
+    generators consumed after the request. ``timeout`` (seconds) is applied as
+    the ODBC query timeout for the block and, with ``watchdog``, enforced on
+    the whole block (see query_guard). ``breaker`` fails the block fast while
+    the company is not answering and learns from its outcome; ``token`` lets
+    the caller cancel the running statement. A block that raises (or a
+    generator closed early) discards the connection instead of returning it.
+    """
+    if breaker is not None:
+        try:
+            breaker.before()
+        except query_guard.CircuitOpen as e:
+            span.finish(error=True)
+            raise UserError(_("MSSQL unavailable: %s") % e)
+    token = token or query_guard.CancelToken()
+    t0 = time.perf_counter()
+    try:
+        conn = pool.acquire()
+    except Exception as e:
+        if breaker is not None:
+            # An exhausted pool says nothing about the server
+            if isinstance(e, mssql_pool.PoolExhausted):
+                breaker.release_trial()
+            else:
+                breaker.failure(e)
+        span.finish(error=True)
+        raise UserError(_("MSSQL connection failed: %s") % e)
+    span.add("connect", time.perf_counter() - t0)
+    ok = False
+    try:
+        if timeout:
+            conn.timeout = timeout
+            if watchdog:
+                query_guard.watchdog.watch(token, timeout + query_guard.WATCHDOG_GRACE, span.name)
+        yield query_guard.GuardedConnection(query_metrics.TimedConnection(conn, span), token)
+        ok = True
+    except GeneratorExit:
+        # Stream closed before its end (client gone): stop the statement
+        token.cancel()
+        raise
+    finally:
+        token.finish()
+        if breaker is not None:
+            if token.timed_out:
+                breaker.failure(token.error or _("query cancelled after %ss") % timeout)
+            else:
+                breaker.success()
+        if timeout and ok:
+            conn.timeout = 0
+        pool.release(conn, discard=not ok)
+        span.finish(error=not ok)
+
+
+def _stream_rows(pool, sql, params, batch_size, span, timeout=0, breaker=None):
+    """Yield export tuples from a server-side cursor, ``batch_size`` rows at a time.
+
+    The connection is only returned to the pool when the result set was read to
+    the end; an abandoned stream (client gone) cancels its statement and
+    discards the connection. ``timeout`` bounds each ODBC call only: the
+    stream as a whole lasts as long as the client takes to download it.
+    """
+    with _borrowed(pool, span, timeout, breaker=breaker, watchdog=False) as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        yield from EXPORT_SPEC.iter_tuples(cur, batch_size)
+
+
+def _stream_mirror_rows(dbname, sql, params, batch_size, span):
+    """Export tuples from the PostgreSQL mirror, on a cursor of its own.
+
+    The request's cursor is closed by the time the response is streamed.
+    """
+    ok = False
+    try:
+        with Registry(dbname).cursor() as cr:
+            cur = query_metrics.TimedCursor(cr, span)
+            cur.execute(sql, params)
+            yield from EXPORT_SPEC.iter_tuples(cur, batch_size)
+        ok = True
+    finally:
+        span.finish(error=not ok)
+
+
+def _chain_companies(streams):
+    """Consolidated export: ``[(company_code, stream)]`` one after the other, company appended."""
+    for code, stream in streams:
+        suffix = (code,)
+        for row in stream:
+            yield row + suffix
+
+
+def _bucket_value(value):
+    # Bucket snapshots written before company support held the bare row list
+    if isinstance(value, list):
+        return {"rows": value, "sources": None}
+    return value
+
+
+def _with_company(code, rows):
+    """Invoice row dicts of one company, tagged for a consolidated list."""
+    return [dict(row, company=code) for row in rows]
+
+
+def _run_borrowed(pool, span, timeout, breaker, token, work):
+    # Fan-out task: everything it needs was resolved by the caller
+    with _borrowed(pool, span, timeout, breaker=breaker, token=token) as conn:
+        return work(conn)
+
+
+def bucket_predicate(a, bucket):
+    """Range predicate selecting the rows of one bucket (index friendly, no CASE)."""
+    forced = _forced_current(a)
+    if bucket == "current":
+        return f"({forced} OR {a}.DATEDUE > bd.d_today)"
+    ranges = {
+        "d0_30": f"{a}.DATEDUE BETWEEN bd.d_30 AND bd.d_today",
+        "d31_60": f"{a}.DATEDUE >= bd.d_60 AND {a}.DATEDUE < bd.d_30",
+        "d61_90": f"{a}.DATEDUE >= bd.d_90 AND {a}.DATEDUE < bd.d_60",
+        "d90p": f"({a}.DATEDUE < bd.d_90 OR {a}.DATEDUE IS NULL)",
+    }
+    return f"({ranges[bucket]} AND NOT {forced})"
 
 
 class MssqlBridge(models.TransientModel):
@@ -19,57 +362,253 @@ class MssqlBridge(models.TransientModel):
         return v
 
     @api.model
-    def _connect(self):
-        server = self._param("mssql.server")
-        database = self._param("mssql.database")
-        username = self._param("mssql.username")
-        password = self._param("mssql.password")
-        driver = self._param("mssql.driver", required=False, default="ODBC Driver 18 for SQL Server")
+    def _conn_str(self, profile=None):
+        """ODBC connection string and log label; ``profile`` keys override the mssql.* parameters."""
+        profile = profile or {}
+        server = profile.get("server") or self._param("mssql.server")
+        database = profile.get("database") or self._param("mssql.database")
+        username = profile.get("username") or self._param("mssql.username")
+        password = profile.get("password") or self._param("mssql.password")
+        driver = profile.get("driver") or self._param("mssql.driver", required=False,
+                                                      default="ODBC Driver 18 for SQL Server")
         conn_str = (
             f"DRIVER={{{driver}}};SERVER={server};DATABASE={database};UID={username};PWD={password};"
             "Encrypt=yes;TrustServerCertificate=yes;"
         )
+        return conn_str, f"{username}@{server}/{database}"
+
+    @api.model
+    def _int_param(self, key, default):
         try:
-            return pyodbc.connect(conn_str, timeout=10)
-        except Exception as e:
-            raise UserError(_("MSSQL connection failed: %s") % e)
+            return int(self._param(key, required=False, default=default))
+        except (TypeError, ValueError):
+            return default
+
+    @api.model
+    def _companies(self):
+        """Sage 300 companies to query: ``[{"code", "name", "conn_str", "label", "owner", "timeout"}]``.
+
+        ``mssql.companies`` holds a JSON list of connection profiles, e.g.
+        ``[{"code": "SAMLTD", "name": "Sample Ltd", "database": "SAMLTD"}, ...]``;
+        ``server``, ``username``, ``password``, ``driver`` default to the mssql.*
+        parameters, ``code`` to the database and ``timeout`` (seconds) to
+        mssql.company_timeout. Without it mssql.database is the only company.
+        """
+        raw = self._param("mssql.companies", required=False)
+        profiles = [{}]
+        if raw:
+            try:
+                profiles = json.loads(raw)
+            except ValueError as e:
+                raise UserError(_("Invalid mssql.companies: %s") % e)
+            if not profiles or not isinstance(profiles, list) or not all(isinstance(p, dict) for p in profiles):
+                raise UserError(_("Invalid mssql.companies: expected a non-empty JSON list of objects"))
+
+        timeout = self._int_param("mssql.company_timeout", company_fanout.DEFAULT_TIMEOUT)
+        companies = []
+        for profile in profiles:
+            conn_str, label = self._conn_str(profile)
+            code = str(profile.get("code") or profile.get("database") or self._param("mssql.database")).strip()
+            companies.append({
+                "code": code,
+                "name": profile.get("name") or code,
+                "conn_str": conn_str,
+                "label": label,
+                # Each company keeps its own pool (get_pool replaces an owner's pool)
+                "owner": "%s/%s" % (self.env.cr.dbname, code) if raw else self.env.cr.dbname,
+                "timeout": int(profile.get("timeout") or timeout),
+            })
+        codes = [c["code"] for c in companies]
+        if len(set(codes)) != len(codes):
+            raise UserError(_("Invalid mssql.companies: company codes must be unique"))
+        return companies
+
+    @api.model
+    def _multi_company(self):
+        return len(self._companies()) > 1
+
+    @api.model
+    def _source(self):
+        """``"mirror"`` when mssql.source (or the ``mssql_source`` context key) says so, else ``"mssql"``."""
+        source = self.env.context.get("mssql_source") or self._param("mssql.source", required=False) or ""
+        return SOURCE_MIRROR if source.strip().lower() == SOURCE_MIRROR else SOURCE_MSSQL
+
+    @api.model
+    def _mirror_params(self, companies):
+        """Bucket boundaries for the mirror statements; the companies must have been loaded.
+
+        Today's date comes from Odoo (the user's timezone), where the MSSQL
+        statements use the SQL Server's GETDATE().
+        """
+        self.env["mssql.mirror.sync"].sudo().check_loaded([c["code"] for c in companies])
+        return mirror_sql.bounds_params(fields.Date.context_today(self))
+
+    @api.model
+    def _pool(self, company=None):
+        company = company or self._companies()[0]
+        return mssql_pool.get_pool(
+            company["owner"],
+            company["conn_str"],
+            size=self._int_param("mssql.pool_size", mssql_pool.DEFAULT_POOL_SIZE),
+            idle_timeout=self._int_param("mssql.pool_idle_timeout", mssql_pool.DEFAULT_IDLE_TIMEOUT),
+            checkout_timeout=self._int_param("mssql.pool_checkout_timeout", mssql_pool.DEFAULT_CHECKOUT_TIMEOUT),
+            label=company["label"],
+        )
+
+    @api.model
+    def _query_timeout(self, name, company=None):
+        """Execution budget (seconds) of query ``name``; 0 means none.
+
+        ``mssql.timeout.aging`` / ``.invoices`` / ``.bucket`` set the budget of
+        each kind of query (see QUERY_KINDS); a company's fan-out timeout
+        caps it, since nobody waits for the answer after that.
+        """
+        kind = QUERY_KINDS.get(name.split("_", 1)[0] if name.startswith("export") else name)
+        timeout = self._int_param("mssql.timeout.%s" % kind, DEFAULT_QUERY_TIMEOUTS[kind]) if kind else 0
+        if company is not None and company.get("timeout"):
+            timeout = min(timeout, company["timeout"]) if timeout else company["timeout"]
+        return max(0, timeout)
+
+    @api.model
+    def _breaker(self, company=None):
+        """Circuit breaker of a company connection (see query_guard)."""
+        company = company or self._companies()[0]
+        return query_guard.breaker_for(
+            company["owner"], company["name"],
+            threshold=self._int_param("mssql.breaker_threshold", query_guard.DEFAULT_THRESHOLD),
+            cooldown=self._int_param("mssql.breaker_cooldown", query_guard.DEFAULT_COOLDOWN),
+        )
+
+    @api.model
+    def get_breaker_status(self):
+        """State of the configured companies' circuit breakers, with the company name."""
+        statuses = []
+        for company in self._companies():
+            status = self._breaker(company).status()
+            status.update(company=company["code"], company_name=company["name"])
+            statuses.append(status)
+        return statuses
+
+    @api.model
+    def _breaker_tripped(self):
+        return any(s["state"] != query_guard.CLOSED for s in self.get_breaker_status())
+
+    @api.model
+    def _span(self, name):
+        return query_metrics.QuerySpan(
+            name, slow_ms=self._int_param("mssql.slow_query_ms", query_metrics.DEFAULT_SLOW_QUERY_MS),
+        )
+
+    @contextmanager
+    def _connection(self, name):
+        """Borrow a pooled connection (first company) for query ``name``; it goes back to the pool on exit.
+
+        Checkout, execute and fetch times of the block are recorded under
+        ``name`` (see query_metrics) and slow runs are logged.
+        """
+        company = self._companies()[0]
+        with _borrowed(self._pool(company), self._span(name), self._query_timeout(name),
+                       breaker=self._breaker(company)) as conn:
+            yield conn
+
+    @api.model
+    def _per_company(self, name, work, company=None, mirror=None):
+        """Run ``work(conn)`` against every company (or only the one coded ``company``).
+
+        Returns one company_fanout.CompanyResult per company. A single company
+        runs inline and raises like any query. Several run in parallel on the
+        fan-out pool (mssql.fanout_workers threads), each bounded by its
+        timeout; their failures are reported in the results, not raised.
+
+        With mssql.source = mirror, ``mirror(cursor, params)`` runs instead,
+        company by company on the Odoo cursor (``params`` holds the company
+        code and the bucket boundaries of the mirror statements).
+        """
+        companies = self._companies()
+        if company:
+            companies = [c for c in companies if c["code"] == company]
+            if not companies:
+                raise UserError(_("Unknown company: %s") % company)
+        if mirror is not None and self._source() == SOURCE_MIRROR:
+            params = self._mirror_params(companies)
+            results = []
+            for c in companies:
+                t0 = time.perf_counter()
+                span = self._span("mirror:%s" % name)
+                ok = False
+                try:
+                    value = mirror(query_metrics.TimedCursor(self.env.cr, span), dict(params, company=c["code"]))
+                    ok = True
+                finally:
+                    span.finish(error=not ok)
+                results.append(company_fanout.CompanyResult(c, company_fanout.OK, value,
+                                                            elapsed=time.perf_counter() - t0))
+            return results
+        if len(companies) == 1:
+            t0 = time.perf_counter()
+            with _borrowed(self._pool(companies[0]), self._span(name), self._query_timeout(name),
+                           breaker=self._breaker(companies[0])) as conn:
+                value = work(conn)
+            return [company_fanout.CompanyResult(companies[0], company_fanout.OK, value,
+                                                 elapsed=time.perf_counter() - t0)]
+        # Pools, spans and breakers are resolved here: the fan-out threads must
+        # not touch self.env. A company given up on gets its statement cancelled.
+        tasks = []
+        for c in companies:
+            token = query_guard.CancelToken()
+            run = functools.partial(
+                _run_borrowed, self._pool(c), self._span("%s[%s]" % (name, c["code"])),
+                self._query_timeout(name, c), self._breaker(c), token, work,
+            )
+            tasks.append((c, run, c["timeout"], functools.partial(token.cancel, timeout=True)))
+        return company_fanout.fan_out(
+            tasks, workers=self._int_param("mssql.fanout_workers", company_fanout.DEFAULT_WORKERS),
+        )
+
+    @staticmethod
+    def _answered(results, what):
+        """Results of the companies that answered; raise when none did."""
+        ok = [r for r in results if r.ok]
+        if not ok:
+            raise UserError(_("%s failed for every company: %s") % (
+                what, "; ".join("%s: %s" % (r.company["code"], r.error) for r in results)))
+        return ok
+
+    @api.model
+    def get_pool_stats(self):
+        """Checkouts / waits / reconnects of every pool in this worker (debugging aid)."""
+        return mssql_pool.pool_stats()
+
+    @api.model
+    def get_query_metrics(self):
+        """Latency histograms of this worker (queries, endpoints, connections), pool stats, breakers
+        and, when reading from it, the mirror's sync state."""
+        mirror = self.env["mssql.mirror.sync"].sudo().status() if self._source() == SOURCE_MIRROR else None
+        return dict(query_metrics.metrics.snapshot(), pools=mssql_pool.pool_stats(),
+                    breakers=query_guard.breakers_status(), mirror=mirror)
 
     # -------------------------------------------------------------------------
     # Aging by customer (dashboard totals)
     #  - 3 decimals
     #  - negative PY*/C* invoices forced to 'current'
     #  - include any non-zero customer total
+    #  - returned as a columnar AgingResult (iterating it yields row dicts)
+    #  - several companies (mssql.companies): queried in parallel, merged
+    #    with a company column; rows.sources tells who timed out
     # -------------------------------------------------------------------------
     @api.model
     def get_aging_by_customer(self):
-        sql = """
+        sql = f"""
             WITH ar AS (
                 SELECT
                     ob.IDCUST AS customer_code,
                     cu.NAMECUST AS customer_name,
                     CAST(ob.AMTDUEHC AS DECIMAL(18,3)) AS balance,
-                    TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112) AS due_date,
-                    ob.IDINVC AS idinv,
-                    CASE
-                        WHEN (ob.IDINVC LIKE 'P%%' OR ob.IDINVC LIKE 'C%%') AND ob.AMTDUEHC < 0 THEN 'current'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) < 0 THEN 'current'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) BETWEEN 0 AND 30 THEN 'd0_30'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) BETWEEN 31 AND 60 THEN 'd31_60'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) BETWEEN 61 AND 90 THEN 'd61_90'
-                        ELSE 'd90p'
-                    END AS bucket
+                    {bucket_case("ob")} AS bucket
                 FROM AROBL ob
                 JOIN ARCUS cu ON cu.IDCUST = ob.IDCUST
-                WHERE (ob.SWPAID IN ('0', 0) OR ob.SWPAID IS NULL)
-                  AND ABS(ob.AMTDUEHC) <> 0
+                {BOUNDS_JOIN}
+                WHERE {OPEN_ITEM_FILTER.format(a="ob")}
             )
             SELECT
                 customer_code,
@@ -85,62 +624,352 @@ class MssqlBridge(models.TransientModel):
             HAVING ABS(SUM(balance)) > 0
             ORDER BY customer_code;
         """
-        conn = self._connect()
+
+        def read(conn):
+            try:
+                cur = conn.cursor()
+                cur.execute(sql)
+                # Column order matches AgingResult.from_records
+                return AgingResult.from_records(cur.fetchall())
+            except Exception as e:
+                raise UserError(_("AROBL query failed: %s") % e)
+
+        def read_mirror(cur, params):
+            cur.execute(mirror_sql.AGING_SQL, params)
+            return AgingResult.from_records(cur.fetchall())
+
+        results = self._per_company("aging_by_customer", read, mirror=read_mirror)
+        if len(results) == 1:
+            return results[0].value
+        # Consolidated view: the companies that answered, plus who did not
+        return AgingResult.concat(
+            [(r.company["code"], r.value) for r in self._answered(results, _("AROBL query"))],
+            sources=[r.status() for r in results],
+        )
+
+    # -------------------------------------------------------------------------
+    # Shared aging snapshot (dashboard, charts, API, bucket page)
+    #  - one aggregation per TTL, shared by every request of the worker
+    #  - optional JSON file so all workers reuse the same snapshot
+    # -------------------------------------------------------------------------
+    def _cache_key(self, name):
+        companies = "+".join(c["code"] for c in self._companies())
+        return "%s:%s:%s" % (self.env.cr.dbname, companies, name)
+
+    def _cache_path(self, name):
+        directory = self._param("mssql.aging_cache_dir", required=False)
+        if not directory:
+            return None
+        return os.path.join(directory, "recv_%s_%s.json" % (self.env.cr.dbname, name.replace(":", "_")))
+
+    @api.model
+    def _bool_param(self, key):
+        return (self._param(key, required=False) or "").strip().lower() in ("1", "true", "yes")
+
+    @api.model
+    def _cached(self, name, loader, force=False, stale_ok=False, decode=None):
+        """``(taken_at, value, stale)`` for a named snapshot of the shared cache.
+
+        With ``stale_ok`` the newest known value is returned at once even when
+        expired, and a background refresh (mssql.refresh.job) is started for it;
+        only the very first load blocks the caller.
+        """
+        ttl = self._int_param("mssql.aging_cache_ttl", DEFAULT_CACHE_TTL)
+        key, path = self._cache_key(name), self._cache_path(name)
+        if stale_ok and not force and ttl > 0:
+            entry = snapshot_cache.peek(key, path, decode)
+            if entry is not None:
+                stale = time.time() - entry[0] >= ttl
+                if stale:
+                    self.env["mssql.refresh.job"].sudo().start(name)
+                return entry[0], entry[1], stale
         try:
-            cur = conn.cursor()
-            cur.execute(sql)
-            cols = [d[0].lower() for d in cur.description]
-            rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-            for rec in rows:
-                rec["current"] = rec.pop("current_amt", 0) or 0.0
-                rec["d0_30"]   = rec.get("d0_30", 0) or 0.0
-                rec["d31_60"]  = rec.get("d31_60", 0) or 0.0
-                rec["d61_90"]  = rec.get("d61_90", 0) or 0.0
-                rec["d90p"]    = rec.get("d90p", 0) or 0.0
-                rec["total"]   = rec.pop("total_amt", 0) or 0.0
-            return rows
+            taken_at, value = snapshot_cache.get(key, loader, ttl, force=force or ttl <= 0, path=path,
+                                                 decode=decode)
         except Exception as e:
-            raise UserError(_("AROBL query failed: %s") % e)
-        finally:
+            # Sage 300 is not answering (circuit open): keep showing the last snapshot
+            entry = snapshot_cache.peek(key, path, decode) if self._breaker_tripped() else None
+            if entry is None:
+                raise
+            _logger.warning("MSSQL unavailable, serving the %s snapshot of %s: %s",
+                            name, datetime.fromtimestamp(entry[0]), e)
+            return entry[0], entry[1], True
+        return taken_at, value, False
+
+    @api.model
+    def get_aging_snapshot(self, force=False, stale_ok=False):
+        """Return ``{"rows": AgingResult, "taken_at": datetime, "stale": bool, "version": str}``
+        from the shared cache.
+
+        ``force`` rebuilds the snapshot; concurrent misses wait for the single
+        in-flight query instead of issuing their own. Pages pass ``stale_ok``
+        so they never block on MSSQL once a snapshot exists. ``version`` is the
+        content digest of the rows (same data, same version in every worker).
+        """
+        # The incremental aggregate follows a single company database (and MSSQL, not the mirror)
+        incremental = (self._bool_param("mssql.aging_incremental") and not self._multi_company()
+                       and self._source() == SOURCE_MSSQL)
+        loader = self.get_aging_incremental if incremental else self.get_aging_by_customer
+        taken_at, rows, stale = self._cached("aging", loader, force=force, stale_ok=stale_ok,
+                                             decode=AgingResult.coerce)
+        return {"rows": rows, "taken_at": datetime.fromtimestamp(taken_at), "stale": stale,
+                "version": rows.digest()}
+
+    @api.model
+    def get_bucket_snapshot(self, bucket, force=False, stale_ok=False):
+        """Cached ``get_invoices_by_bucket`` result, same contract as get_aging_snapshot.
+
+        ``sources`` is the per-company status (None with a single company).
+        """
+        b = (bucket or "").strip().lower()
+        if b not in BUCKET_KEYS:
+            b = "d0_30"
+
+        def load():
+            rows, sources = self.get_invoices_by_bucket(b, with_sources=True)
+            return {"rows": rows, "sources": sources}
+
+        taken_at, value, stale = self._cached(
+            "bucket:%s" % b, load, force=force, stale_ok=stale_ok, decode=_bucket_value,
+        )
+        return {"rows": value["rows"], "sources": value["sources"],
+                "taken_at": datetime.fromtimestamp(taken_at), "stale": stale}
+
+    @api.model
+    def _refresh_kind(self, kind):
+        """Rebuild one named snapshot (background job entry point); returns its row count."""
+        if self._source() == SOURCE_MIRROR:
+            # Pull the latest changes first; on failure the snapshot is rebuilt from the mirror as it is
+            try:
+                with self.env.cr.savepoint():
+                    self.env["mssql.mirror.sync"].sync()
+            except Exception as e:
+                _logger.warning("mirror sync before the %s refresh failed: %s", kind, e)
+        if kind.startswith("bucket:"):
+            return len(self.get_bucket_snapshot(kind.split(":", 1)[1], force=True)["rows"])
+        if kind == "store":
+            return len(self.get_store_snapshot(force=True)["store"])
+        snap = self.get_aging_snapshot(force=True)
+        # Sort and search indexes are built here, off the request path
+        aging_index.index_for(self._cache_key("aging"), snap["taken_at"], snap["rows"])
+        return len(snap["rows"])
+
+    @api.model
+    def _aging_index(self):
+        snap = self.get_aging_snapshot()
+        return snap, aging_index.index_for(self._cache_key("aging"), snap["taken_at"], snap["rows"])
+
+    @api.model
+    def _store_index(self, as_of=None, boundaries=None):
+        """``(store snapshot, AgingIndex)`` re-bucketed as of ``as_of`` (default today) with ``boundaries``."""
+        try:
+            as_of = fields.Date.to_date(as_of) if as_of else fields.Date.context_today(self)
+        except ValueError:
+            raise UserError(_("Invalid as-of date: %s") % as_of)
+        try:
+            boundaries = aging_store.parse_boundaries(boundaries)
+        except ValueError as e:
+            raise UserError(_("Invalid aging boundaries: %s") % e)
+        snap = self.get_store_snapshot(stale_ok=True)
+        return dict(snap, as_of=as_of, boundaries=boundaries), snap["store"].index(as_of, boundaries)
+
+    @api.model
+    def get_aging_page(self, page=1, page_size=aging_index.DEFAULT_PAGE_SIZE, sort="customer_name",
+                       descending=False, search="", hide_zero=False, bucket=None, as_of=None, boundaries=None):
+        """One page of the dashboard table, served from the snapshot's pre-sorted index.
+
+        With an ``as_of`` date or ``boundaries`` (days, e.g. ``"30,60,90"``) the
+        amounts come from the open item store instead, re-bucketed in memory.
+        """
+        if as_of or boundaries:
+            snap, index = self._store_index(as_of, boundaries)
+        else:
+            snap, index = self._aging_index()
+        rows, count = index.page(
+            page=page,
+            page_size=page_size,
+            sort=sort,
+            descending=descending,
+            search=search,
+            hide_zero=hide_zero,
+            bucket=bucket,
+        )
+        return {
+            "rows": rows,
+            "count": count,
+            "totals": index.totals,
+            "taken_at": snap["taken_at"],
+            "as_of": snap.get("as_of"),
+            "boundaries": snap.get("boundaries"),
+        }
+
+    @api.model
+    def search_customers(self, query, limit=customer_search.DEFAULT_LIMIT):
+        """Customers matching ``query`` (code, name or company), best first, with their amounts.
+
+        Served from the search index built with the snapshot's page index; each
+        row carries its ``score`` (see customer_search for the ranking).
+        """
+        snap, index = self._aging_index()
+        positions, scores, count = index.search.search(query, limit=limit)
+        rows = index.result.to_dicts(positions)
+        for row, score in zip(rows, scores):
+            row["score"] = score
+        return {
+            "rows": rows,
+            "count": count,
+            "taken_at": snap["taken_at"],
+            "version": snap["version"],
+        }
+
+    # -------------------------------------------------------------------------
+    # As-of aging (dashboard date picker)
+    #  - the open items are loaded once per TTL into an aging_store.InvoiceStore
+    #  - any as-of date / bucket boundaries are re-bucketed from it in memory
+    # -------------------------------------------------------------------------
+    @api.model
+    def get_open_item_store(self):
+        """Open items of every company (the dashboard's customer set) in an aging_store.InvoiceStore."""
+        def read(conn):
             try:
-                conn.close()
-            except Exception:
-                pass
+                cur = conn.cursor()
+                cur.execute(STORE_ITEMS_SQL)
+                return cur.fetchall()
+            except Exception as e:
+                raise UserError(_("AROBL open items query failed: %s") % e)
+
+        def read_mirror(cur, params):
+            cur.execute(mirror_sql.STORE_ITEMS_SQL, params)
+            return cur.fetchall()
+
+        results = self._per_company("open_items", read, mirror=read_mirror)
+        if len(results) == 1:
+            return aging_store.InvoiceStore.from_parts([(None, results[0].value)])
+        return aging_store.InvoiceStore.from_parts(
+            [(r.company["code"], r.value) for r in self._answered(results, _("AROBL open items query"))],
+            sources=[r.status() for r in results],
+        )
+
+    @api.model
+    def get_store_snapshot(self, force=False, stale_ok=False):
+        """Cached ``get_open_item_store`` result: ``{"store", "taken_at", "stale"}``, as get_aging_snapshot."""
+        taken_at, store, stale = self._cached("store", self.get_open_item_store, force=force, stale_ok=stale_ok,
+                                              decode=aging_store.InvoiceStore.coerce)
+        return {"store": store, "taken_at": datetime.fromtimestamp(taken_at), "stale": stale}
+
+    @api.model
+    def get_aging_as_of(self, as_of, boundaries=None):
+        """Aging rows (get_aging_by_customer shape) as of the ``as_of`` date, from the open item store."""
+        return self._store_index(as_of, boundaries)[1].result
+
+    # -------------------------------------------------------------------------
+    # Incremental aging (enable with mssql.aging_incremental = 1)
+    #  - first call / every mssql.aging_full_rebuild_interval: full load
+    #  - otherwise only AROBL rows whose AUDTDATE/AUDTTIME moved are read
+    #  - a day change re-buckets only documents crossing a boundary
+    # -------------------------------------------------------------------------
+    @api.model
+    def _server_bounds(self, cur):
+        """Bucket boundaries from the SQL Server clock (same source as GETDATE())."""
+        cur.execute("SELECT CONVERT(char(8), GETDATE(), 112)")
+        return aging_rules.bucket_bounds(aging_rules.from_ymd(cur.fetchone()[0]))
+
+    @api.model
+    def get_aging_incremental(self, full=False):
+        """Aging rows (get_aging_by_customer shape) from the incrementally maintained aggregate."""
+        state = aging_incremental.state_for(self._cache_key("aging"))
+        interval = self._int_param("mssql.aging_full_rebuild_interval", DEFAULT_FULL_REBUILD_INTERVAL)
+        with state.lock, self._connection("aging_incremental") as conn:
+            try:
+                cur = conn.cursor()
+                bounds = self._server_bounds(cur)
+                stale = interval > 0 and time.time() - state.loaded_at > interval
+                if full or not state.loaded or stale:
+                    # Read the watermark first: changes racing the full load are re-applied next time
+                    cur.execute(WATERMARK_SQL)
+                    top = cur.fetchone()
+                    watermark = (int(top[0] or 0), int(top[1] or 0)) if top else (0, 0)
+                    cur.execute(OPEN_ITEMS_SQL)
+                    state.load_full(cur.fetchall(), bounds, watermark)
+                    _logger.info("incremental aging: full load of %s open items", len(state.docs))
+                else:
+                    audtdate, audttime = state.watermark
+                    cur.execute(CHANGED_ITEMS_SQL, [audtdate, audtdate, audttime])
+                    changed = cur.fetchall()
+                    watermark = max(((int(r[7] or 0), int(r[8] or 0)) for r in changed), default=None)
+                    state.apply_changes([tuple(r[:7]) for r in changed], bounds, watermark)
+                    _logger.debug("incremental aging: applied %s changed documents", len(changed))
+            except Exception as e:
+                raise UserError(_("AROBL incremental query failed: %s") % e)
+        return state.rows()
+
+    @api.model
+    def check_aging_consistency(self):
+        """Compare the incremental aggregate with the full query; rebuild it on mismatch."""
+        if self._multi_company() or self._source() == SOURCE_MIRROR:
+            # get_aging_snapshot does not use the incremental aggregate then
+            return {"ok": True, "skipped": "multi-company" if self._multi_company() else "mirror"}
+        expected = self.get_aging_by_customer()
+        actual = self.get_aging_incremental()
+        mismatched = aging_incremental.diff_rows(expected, actual)
+        if mismatched:
+            _logger.warning("incremental aging drifted for %s customers (e.g. %s); rebuilding",
+                            len(mismatched), ", ".join(mismatched[:10]))
+            self.get_aging_incremental(full=True)
+        return {"ok": not mismatched, "customers": len(expected), "mismatched": mismatched[:100]}
+
+    @api.model
+    def check_mirror_consistency(self, sync=True):
+        """Compare the aging computed on the PostgreSQL mirror with the MSSQL query.
+
+        ``sync`` first brings the mirror up to date, so only a real drift
+        (e.g. rows deleted in Sage 300) is reported; a full reload fixes it.
+        """
+        if sync:
+            self.env["mssql.mirror.sync"].sudo().sync()
+
+        def keyed(rows):
+            # Customer codes only need to be unique within a company
+            return [dict(r, customer_code="%s/%s" % (r.get("company") or "", r["customer_code"])) for r in rows]
+
+        expected = keyed(self.with_context(mssql_source=SOURCE_MSSQL).get_aging_by_customer())
+        actual = keyed(self.with_context(mssql_source=SOURCE_MIRROR).get_aging_by_customer())
+        mismatched = aging_incremental.diff_rows(expected, actual)
+        if mismatched:
+            _logger.warning("mirror aging differs from MSSQL for %s customers (e.g. %s)",
+                            len(mismatched), ", ".join(mismatched[:10]))
+        return {"ok": not mismatched, "customers": len(expected), "mismatched": mismatched[:100]}
 
     # -------------------------------------------------------------------------
     # Invoices for a single customer (used by expander) - same bucket rules
     # -------------------------------------------------------------------------
     @api.model
-    def get_invoices_basic_by_customer(self, customer_code=None, customer_name=None, bucket=None):
+    def get_invoices_basic_by_customer(self, customer_code=None, customer_name=None, bucket=None,
+                                       as_tuples=False, company=None):
+        """Open invoices of one customer as dicts, or ``(header, tuples)`` with ``as_tuples``.
+
+        The tuples leave out DUE_DATE, which only repeats DATEINVC. With several
+        companies the customer is looked up in ``company`` only, or in all of
+        them (in parallel) when it is not given; rows then carry a company.
+        """
         code = (customer_code or "").strip()
         name = (customer_name or "").strip()
         bkt  = (bucket or "").strip().lower()
 
+        # Compare the stored keys directly (no LTRIM/RTRIM on the column):
+        # SQL Server ignores trailing blanks of CHAR keys in equality anyway.
         where, params = [], []
         if code:
-            where.append("LTRIM(RTRIM(bl.IDCUST)) = LTRIM(RTRIM(?))")
+            where.append("bl.IDCUST = ?")
             params.append(code)
         elif name:
-            where.append("LTRIM(RTRIM(cu.NAMECUST)) = LTRIM(RTRIM(?))")
+            where.append("cu.NAMECUST = ?")
             params.append(name)
         else:
-            return []
-
-        bucket_case = """
-            CASE
-                WHEN (bl.IDINVC LIKE 'P%%' OR bl.IDINVC LIKE 'C%%') AND bl.AMTDUEHC < 0 THEN 'current'
-                WHEN DATEDIFF(day, TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112), GETDATE()) < 0  THEN 'current'
-                WHEN DATEDIFF(day, TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112), GETDATE()) BETWEEN 0  AND 30 THEN 'd0_30'
-                WHEN DATEDIFF(day, TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112), GETDATE()) BETWEEN 31 AND 60 THEN 'd31_60'
-                WHEN DATEDIFF(day, TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112), GETDATE()) BETWEEN 61 AND 90 THEN 'd61_90'
-                ELSE 'd90p'
-            END
-        """
+            return (COMPACT_INVOICE_SPEC.header, []) if as_tuples else []
 
-        bucket_filter = ""
-        if bkt in ("current", "d0_30", "d31_60", "d61_90", "d90p"):
-            bucket_filter = f" AND {bucket_case} = ? "
-            params.append(bkt)
+        if bkt in BUCKET_KEYS:
+            where.append(bucket_predicate("bl", bkt))
 
         sql = f"""
             SELECT
@@ -151,170 +980,226 @@ class MssqlBridge(models.TransientModel):
                 bl.IDCUSTPO,
                 bl.DESCINVC,
                 CAST(bl.AMTDUEHC AS DECIMAL(18,3))                      AS AMTINVCHC,
-                {bucket_case}                                          AS bucket
+                {bucket_case("bl")}                                     AS bucket
             FROM AROBL bl
             {"JOIN ARCUS cu ON cu.IDCUST = bl.IDCUST" if name else ""}
+            {BOUNDS_JOIN}
             WHERE
-                (bl.SWPAID IN ('0', 0) OR bl.SWPAID IS NULL)
-                AND ABS(bl.AMTDUEHC) <> 0
+                {OPEN_ITEM_FILTER.format(a="bl")}
                 AND {" AND ".join(where)}
-                {bucket_filter}
-            ORDER BY DATEINVC DESC, bl.IDORDERNBR;
+            ORDER BY bl.DATEDUE DESC, bl.IDORDERNBR;
         """
 
-        conn = self._connect()
-        rows = []
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, params)
-            for IDINV, DATEINVC, DUE_DATE, IDORDERNBR, IDCUSTPO, DESCINVC, AMTINVCHC, BK in cur.fetchall():
-                rows.append({
-                    "IDINV": str(IDINV or ""),
-                    "DATEINVC": DATEINVC.isoformat() if hasattr(DATEINVC, "isoformat") else (str(DATEINVC) if DATEINVC else ""),
-                    "DUE_DATE": DUE_DATE.isoformat() if hasattr(DUE_DATE, "isoformat") else (str(DUE_DATE) if DUE_DATE else ""),
-                    "IDORDERNBR": str(IDORDERNBR or ""),
-                    "IDCUSTPO": str(IDCUSTPO or ""),
-                    "DESCINVC": DESCINVC or "",
-                    "AMTINVCHC": float(AMTINVCHC or 0.0),
-                    "bucket": (BK or "").lower(),
-                })
-            return rows
-        except Exception as e:
-            raise UserError(_("AROBL invoice query failed: %s") % e)
-        finally:
+        def read(conn):
             try:
-                conn.close()
-            except Exception:
-                pass
+                cur = conn.cursor()
+                cur.execute(sql, params)
+                if as_tuples:
+                    return COMPACT_INVOICE_SPEC.tuples(cur)
+                return INVOICE_SPEC.dicts(cur)
+            except Exception as e:
+                raise UserError(_("AROBL invoice query failed: %s") % e)
+
+        def read_mirror(cur, params):
+            cur.execute(mirror_sql.customer_invoices_sql(by_name=not code, bucket=bkt if bkt in BUCKET_KEYS else None),
+                        dict(params, code=code, name=name))
+            if as_tuples:
+                return COMPACT_INVOICE_SPEC.tuples(cur)
+            return INVOICE_SPEC.dicts(cur)
+
+        results = self._per_company("invoices_by_customer", read, company=company, mirror=read_mirror)
+        if len(results) == 1:
+            return (COMPACT_INVOICE_SPEC.header, results[0].value) if as_tuples else results[0].value
+        answered = self._answered(results, _("AROBL invoice query"))
+        if as_tuples:
+            return ("company",) + COMPACT_INVOICE_SPEC.header, [
+                (r.company["code"],) + row for r in answered for row in r.value
+            ]
+        return [row for r in answered for row in _with_company(r.company["code"], r.value)]
 
     # -------------------------------------------------------------------------
-    # Bucket-wide invoices (bucket page) — EXACTLY match dashboard scope
+    # Invoices for many customers at once (expander "expand all")
+    #  - chunked IN lists, all chunks on one pooled connection
+    #  - result grouped by customer code, same row shape as the expander
     # -------------------------------------------------------------------------
+    @api.model
+    def get_invoices_basic_by_customers(self, customer_codes, bucket=None, with_sources=False):
+        """``{code: [invoice dicts]}``; ``with_sources`` returns ``(grouped, sources)``.
+
+        With several companies every company is asked for the codes in
+        parallel, rows carry their company and ``sources`` is the per-company
+        status (None with a single company).
+        """
+        codes = []
+        seen = set()
+        for c in customer_codes or []:
+            c = (c or "").strip()
+            if c and c not in seen:
+                seen.add(c)
+                codes.append(c)
+        if not codes:
+            return ({}, None) if with_sources else {}
+        bkt = (bucket or "").strip().lower()
+        bucket_filter = f"AND {bucket_predicate('bl', bkt)}" if bkt in BUCKET_KEYS else ""
+
+        def collect(grouped, cur):
+            for code, idinv, due, ordernbr, custpo, desc, amount, bk in BATCH_INVOICE_SPEC.iter_tuples(cur):
+                grouped.setdefault(code, []).append({
+                    "IDINV": idinv,
+                    "DATEINVC": due,
+                    "DUE_DATE": due,
+                    "IDORDERNBR": ordernbr,
+                    "IDCUSTPO": custpo,
+                    "DESCINVC": desc,
+                    "AMTINVCHC": amount,
+                    "bucket": bk,
+                })
+
+        def read(conn):
+            grouped = {c: [] for c in codes}
+            try:
+                cur = conn.cursor()
+                for start in range(0, len(codes), IN_LIST_CHUNK):
+                    chunk = codes[start:start + IN_LIST_CHUNK]
+                    sql = f"""
+                        SELECT
+                            LTRIM(RTRIM(bl.IDCUST))                             AS customer_code,
+                            bl.IDINVC                                           AS IDINV,
+                            TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112) AS DATEINVC,
+                            bl.IDORDERNBR,
+                            bl.IDCUSTPO,
+                            bl.DESCINVC,
+                            CAST(bl.AMTDUEHC AS DECIMAL(18,3))                  AS AMTINVCHC,
+                            {bucket_case("bl")}                                 AS bucket
+                        FROM AROBL bl
+                        {BOUNDS_JOIN}
+                        WHERE {OPEN_ITEM_FILTER.format(a="bl")}
+                          AND bl.IDCUST IN ({", ".join("?" * len(chunk))})
+                          {bucket_filter}
+                        ORDER BY bl.IDCUST, bl.DATEDUE DESC, bl.IDORDERNBR;
+                    """
+                    cur.execute(sql, chunk)
+                    collect(grouped, cur)
+                return grouped
+            except Exception as e:
+                raise UserError(_("AROBL invoice query failed: %s") % e)
+
+        def read_mirror(cur, params):
+            # No parameter limit on PostgreSQL: one array for every code
+            grouped = {c: [] for c in codes}
+            cur.execute(mirror_sql.batch_invoices_sql(bkt if bkt in BUCKET_KEYS else None), dict(params, codes=codes))
+            collect(grouped, cur)
+            return grouped
+
+        results = self._per_company("invoices_by_customers", read, mirror=read_mirror)
+        if len(results) == 1:
+            return (results[0].value, None) if with_sources else results[0].value
+        grouped = {c: [] for c in codes}
+        for r in self._answered(results, _("AROBL invoice query")):
+            for code, rows in r.value.items():
+                grouped.setdefault(code, []).extend(_with_company(r.company["code"], rows))
+        if with_sources:
+            return grouped, [r.status() for r in results]
+        return grouped
+
     # -------------------------------------------------------------------------
     # Bucket-wide invoices (used by /recv/bucket/<bucket> page)
+    #  - EXACT mirror of dashboard bucketing and customer scope
     # -------------------------------------------------------------------------
-    # -------------------------------------------------------------------------
-    # Bucket-wide invoices (EXACT mirror of dashboard bucketing)
-    # -------------------------------------------------------------------------
-    # models/bridge.py  (inside class MssqlBridge)
-
     @api.model
-    def get_invoices_by_bucket(self, bucket):
+    def get_invoices_by_bucket(self, bucket, as_tuples=False, with_sources=False):
         """
         Return ONLY the invoices that contribute to the dashboard totals for a given bucket.
         - 3 decimals
         - 'PY*' or 'C*' negatives are forced to 'current' (same as dashboard)
         - exclude customers whose net open balance == 0 (so page totals match the cards)
+        - dicts, or ``(header, tuples)`` with ``as_tuples``
+        - several companies: queried in parallel, rows carry their company;
+          ``with_sources`` returns ``(result, per-company status or None)``
         """
         b = (bucket or "").strip().lower()
-        if b not in ("current", "d0_30", "d31_60", "d61_90", "d90p"):
+        if b not in BUCKET_KEYS:
             b = "d0_30"
 
-        bucket_case = """
-            CASE
-                WHEN (bl.IDINVC LIKE 'P%%' OR bl.IDINVC LIKE 'C%%') AND bl.AMTDUEHC < 0 THEN 'current'
-                WHEN DATEDIFF(day,
-                        TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112),
-                        GETDATE()) < 0 THEN 'current'
-                WHEN DATEDIFF(day,
-                        TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112),
-                        GETDATE()) BETWEEN 0  AND 30 THEN 'd0_30'
-                WHEN DATEDIFF(day,
-                        TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112),
-                        GETDATE()) BETWEEN 31 AND 60 THEN 'd31_60'
-                WHEN DATEDIFF(day,
-                        TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112),
-                        GETDATE()) BETWEEN 61 AND 90 THEN 'd61_90'
-                ELSE 'd90p'
-            END
-        """
+        sql = bucket_invoices_sql(b)
 
-        sql = f"""
-            /* 1) Same 'ar' CTE as dashboard (3 decimals + bucket rule) */
-            WITH ar AS (
-                SELECT
-                    ob.IDCUST AS customer_code,
-                    cu.NAMECUST AS customer_name,
-                    CAST(ob.AMTDUEHC AS DECIMAL(18,3)) AS balance,
-                    TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112) AS due_date,
-                    ob.IDINVC AS idinv,
-                    CASE
-                        WHEN (ob.IDINVC LIKE 'P%%' OR ob.IDINVC LIKE 'C%%') AND ob.AMTDUEHC < 0 THEN 'current'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) < 0 THEN 'current'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) BETWEEN 0 AND 30 THEN 'd0_30'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) BETWEEN 31 AND 60 THEN 'd31_60'
-                        WHEN DATEDIFF(day,
-                               TRY_CONVERT(date, CONVERT(varchar(8), CAST(ob.DATEDUE AS int)), 112),
-                               GETDATE()) BETWEEN 61 AND 90 THEN 'd61_90'
-                        ELSE 'd90p'
-                    END AS bucket
-                FROM AROBL ob
-                JOIN ARCUS cu ON cu.IDCUST = ob.IDCUST
-                WHERE (ob.SWPAID IN ('0', 0) OR ob.SWPAID IS NULL)     -- open only
-                  AND ABS(ob.AMTDUEHC) <> 0                            -- exclude true zeros
-            ),
-            /* 2) Restrict to the *same* customer set that appears on the dashboard */
-            allowed_customers AS (
-                SELECT customer_code
-                FROM ar
-                GROUP BY customer_code
-                HAVING ABS(SUM(balance)) <> 0                          -- net open ≠ 0
-            )
+        def read(conn):
+            try:
+                cur = conn.cursor()
+                cur.execute(sql)
+                if as_tuples:
+                    return BUCKET_INVOICE_SPEC.tuples(cur)
+                return BUCKET_INVOICE_SPEC.dicts(cur)
+            except Exception as e:
+                raise UserError(_("AROBL invoice query failed: %s") % e)
 
-            /* 3) List invoices for those customers in the requested bucket */
-            SELECT
-                LTRIM(RTRIM(bl.IDCUST))                                  AS customer_code,
-                cu.NAMECUST                                              AS customer_name,
-                bl.IDINVC                                                AS IDINV,
-                TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112) AS DATEINVC,
-                TRY_CONVERT(date, CONVERT(varchar(8), CAST(bl.DATEDUE AS int)), 112) AS DUE_DATE,
-                bl.IDORDERNBR,
-                bl.IDCUSTPO,
-                bl.DESCINVC,
-                CAST(bl.AMTDUEHC AS DECIMAL(18,3))                       AS AMTINVCHC
-            FROM AROBL bl
-            JOIN ARCUS cu ON cu.IDCUST = bl.IDCUST
-            WHERE (bl.SWPAID IN ('0', 0) OR bl.SWPAID IS NULL)           -- open only
-              AND ABS(bl.AMTDUEHC) <> 0
-              AND LTRIM(RTRIM(bl.IDCUST)) IN (SELECT customer_code FROM allowed_customers)
-              AND {bucket_case} = ?
-            ORDER BY cu.NAMECUST, DATEINVC DESC, bl.IDINVC;
-        """
+        def read_mirror(cur, params):
+            cur.execute(mirror_sql.bucket_invoices_sql(b), params)
+            if as_tuples:
+                return BUCKET_INVOICE_SPEC.tuples(cur)
+            return BUCKET_INVOICE_SPEC.dicts(cur)
 
-        conn = self._connect()
-        rows = []
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, [b])
-            for rec in cur.fetchall():
-                (customer_code, customer_name, IDINV, DATEINVC, DUE_DATE,
-                 IDORDERNBR, IDCUSTPO, DESCINVC, AMTINVCHC) = rec
-                rows.append({
-                    "customer_code": (customer_code or "").strip(),
-                    "customer_name": customer_name or "",
-                    "IDINV": str(IDINV or ""),
-                    "DATEINVC": DATEINVC.isoformat() if hasattr(DATEINVC, "isoformat") else (
-                        str(DATEINVC) if DATEINVC else ""),
-                    "DUE_DATE": DUE_DATE.isoformat() if hasattr(DUE_DATE, "isoformat") else (
-                        str(DUE_DATE) if DUE_DATE else ""),
-                    "IDORDERNBR": str(IDORDERNBR or ""),
-                    "IDCUSTPO": str(IDCUSTPO or ""),
-                    "DESCINVC": DESCINVC or "",
-                    "AMTINVCHC": float(AMTINVCHC or 0.0),
-                })
-            return rows
-        except Exception as e:
-            raise UserError(_("AROBL invoice query failed: %s") % e)
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        results = self._per_company("invoices_by_bucket", read, mirror=read_mirror)
+        sources = None
+        if len(results) == 1:
+            value = results[0].value
+            result = (BUCKET_INVOICE_SPEC.header, value) if as_tuples else value
+        else:
+            answered = self._answered(results, _("AROBL invoice query"))
+            sources = [r.status() for r in results]
+            if as_tuples:
+                result = ("company",) + BUCKET_INVOICE_SPEC.header, [
+                    (r.company["code"],) + row for r in answered for row in r.value
+                ]
+            else:
+                result = [row for r in answered for row in _with_company(r.company["code"], r.value)]
+        return (result, sources) if with_sources else result
 
+    # -------------------------------------------------------------------------
+    # Streaming export (same scope as get_invoices_by_bucket)
+    #  - several companies: streamed one after the other (a stream cannot be
+    #    merged without buffering it), with a trailing company column
+    # -------------------------------------------------------------------------
+    @api.model
+    def get_export_columns(self):
+        """Column names of the iter_invoices_by_bucket tuples."""
+        return EXPORT_COLUMNS + (("company",) if self._multi_company() else ())
+
+    @api.model
+    def iter_invoices_by_bucket(self, bucket=None, batch_size=EXPORT_BATCH_SIZE):
+        """Stream bucket invoices as tuples in get_export_columns() order.
 
+        ``bucket=None`` streams every open item of the dashboard's customers.
+        Rows arrive grouped by customer (name, then code). The SQL and pool are
+        resolved here, so the returned generator does not touch ``self.env``
+        and can be consumed after the request's cursor is closed.
+        """
+        b = (bucket or "").strip().lower() or None
+        if b is not None and b not in BUCKET_KEYS:
+            b = "d0_30"
+        sql, name = bucket_invoices_sql(b), "export_%s" % (b or "all")
+        companies = self._companies()
+        if self._source() == SOURCE_MIRROR:
+            params = self._mirror_params(companies)
+            streams = [
+                (c["code"], _stream_mirror_rows(self.env.cr.dbname, mirror_sql.bucket_invoices_sql(b),
+                                                dict(params, company=c["code"]), batch_size,
+                                                self._span("mirror:%s" % name)))
+                for c in companies
+            ]
+            return streams[0][1] if len(companies) == 1 else _chain_companies(streams)
+        # Refuse now rather than cut the download at the first unavailable company
+        for c in companies:
+            try:
+                self._breaker(c).check()
+            except query_guard.CircuitOpen as e:
+                raise UserError(_("MSSQL unavailable: %s") % e)
+        if len(companies) == 1:
+            return _stream_rows(self._pool(), sql, (), batch_size, self._span(name),
+                                self._query_timeout(name), self._breaker())
+        return _chain_companies([
+            (c["code"], _stream_rows(self._pool(c), sql, (), batch_size,
+                                     self._span("%s[%s]" % (name, c["code"])),
+                                     self._query_timeout(name), self._breaker(c)))
+            for c in companies
+        ])
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Bucket page rows sorted once and grouped by customer, served in windows.
+
+The bucket page only renders its header and totals; the browser then pulls
+the customer groups and windows of invoice rows from this index. Rows are
+sorted once per snapshot by the page key (customer, then invoice date and
+number, descending), so each customer's lines are contiguous and a group is a
+``(start, count)`` range of that order, with its subtotal computed here.
+
+A search keeps the order and the grouping: it gives a filtered view whose
+groups and subtotals only cover the matching lines.
+"""
+import math
+import threading
+from array import array
+
+from .customer_search import fold
+
+ROW_COLUMNS = ("IDINV", "DATEINVC", "DESCINVC", "AMTINVCHC")
+GROUP_COLUMNS = ("company", "customer_code", "customer_name", "start", "count", "subtotal")
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+# Filtered views kept per index (one per distinct search)
+MEMO_SIZE = 32
+
+
+def _sort_key(row):
+    # The page's customer / date / invoice order; company and code keep two
+    # customers with the same name in separate groups
+    return (row.get("customer_name") or "", row.get("company") or "", row.get("customer_code") or "",
+            row.get("DATEINVC") or "", row.get("IDINV") or "")
+
+
+class BucketView:
+    """Groups over some rows of a BucketIndex (all of them, or a search's matches).
+
+    ``positions`` are indexes into the sorted rows (a range for the full view);
+    ``groups`` holds one ``[customer, start, count, subtotal]`` per customer,
+    with ``start`` and ``count`` counted in ``positions``.
+    """
+
+    __slots__ = ("positions", "groups", "total")
+
+    def __init__(self, index, positions):
+        self.positions = positions
+        amounts = index.amounts
+        customer_of = index.customer_of
+        groups = []
+        current = None
+        for n, i in enumerate(positions):
+            customer = customer_of[i]
+            if customer != current:
+                groups.append([customer, n, 0, []])
+                current = customer
+            group = groups[-1]
+            group[2] += 1
+            group[3].append(amounts[i])
+        for group in groups:
+            group[3] = round(math.fsum(group[3]), 3)
+        self.groups = groups
+        self.total = round(math.fsum(amounts[i] for i in positions), 3)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class BucketIndex:
+    def __init__(self, rows):
+        rows = sorted(rows, key=_sort_key, reverse=True)
+        self.customers = []          # (company, code, name) per group
+        self.customer_of = array("I")
+        keys = {}
+        for row in rows:
+            key = (row.get("company") or "", row.get("customer_code") or "", row.get("customer_name") or "")
+            if key not in keys:
+                keys[key] = len(self.customers)
+                self.customers.append(key)
+            self.customer_of.append(keys[key])
+        self.rows = [tuple(row.get(col) for col in ROW_COLUMNS) for row in rows]
+        self.amounts = array("d", (float(row.get("AMTINVCHC") or 0.0) for row in rows))
+        # What the page's search box matches (the former data-q of each row)
+        self.haystack = [
+            fold(" ".join((row.get("company") or "", row.get("customer_code") or "", row.get("customer_name") or "",
+                           row.get("IDINV") or "", row.get("DESCINVC") or "")))
+            for row in rows
+        ]
+        self.full = BucketView(self, range(len(rows)))
+        self._views = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def view(self, search=""):
+        """The full view, or the lines matching ``search`` (memoised)."""
+        needle = fold(search)
+        if not needle:
+            return self.full
+        view = self._views.get(needle)
+        if view is None:
+            if len(self._views) >= MEMO_SIZE:
+                self._views.clear()
+            haystack = self.haystack
+            view = self._views[needle] = BucketView(
+                self, [i for i in range(len(haystack)) if needle in haystack[i]]
+            )
+        return view
+
+    def groups(self, view):
+        """``GROUP_COLUMNS`` tuples of ``view``."""
+        customers = self.customers
+        return [customers[c] + (start, count, subtotal) for c, start, count, subtotal in view.groups]
+
+    def rows_at(self, view, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """``ROW_COLUMNS`` tuples of the view's lines ``offset`` to ``offset + limit``."""
+        offset = max(0, int(offset or 0))
+        limit = min(MAX_PAGE_SIZE, max(1, int(limit or DEFAULT_PAGE_SIZE)))
+        return [self.rows[i] for i in view.positions[offset:offset + limit]]
+
+
+# -------------------------------------------------------------------------
+# One index per bucket, rebuilt when its snapshots change
+# -------------------------------------------------------------------------
+_indexes = {}      # key -> (stamp, BucketIndex)
+_lock = threading.Lock()
+
+
+def index_for(key, stamp, load_rows):
+    """The index of ``key`` for ``stamp``; ``load_rows()`` gives the rows on a rebuild."""
+    entry = _indexes.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    with _lock:
+        entry = _indexes.get(key)
+        if entry is None or entry[0] != stamp:
+            entry = _indexes[key] = (stamp, BucketIndex(load_rows()))
+    return entry[1]
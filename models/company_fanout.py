@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Run one query per Sage 300 company in parallel, each with its own timeout.
+
+Tasks are plain callables executed on a small, process-wide thread pool; they
+must not touch the Odoo environment (its cursor is not thread safe), so the
+bridge resolves pools and SQL before submitting them. A company that does not
+answer within its timeout is reported as ``timeout`` and the caller goes on
+with the others; the task's ``cancel`` callback then stops the abandoned
+query (see query_guard), so the worker thread and the connection come back
+without waiting for its ODBC query timeout.
+"""
+import concurrent.futures
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 30  # seconds, per company
+
+OK, TIMEOUT, ERROR = "ok", "timeout", "error"
+
+_executor = None
+_executor_workers = 0
+_lock = threading.Lock()
+
+
+def executor(workers=DEFAULT_WORKERS):
+    """The shared pool, recreated when the configured size changes."""
+    global _executor, _executor_workers
+    workers = max(1, int(workers))
+    with _lock:
+        if _executor is None or _executor_workers != workers:
+            previous = _executor
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="mssql-fanout",
+            )
+            _executor_workers = workers
+            if previous is not None:
+                previous.shutdown(wait=False)
+        return _executor
+
+
+class CompanyResult:
+    """Outcome of one company's task: ``state`` is ok, timeout or error."""
+
+    __slots__ = ("company", "state", "value", "error", "elapsed")
+
+    def __init__(self, company, state, value=None, error="", elapsed=0.0):
+        self.company = company
+        self.state = state
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.state == OK
+
+    def status(self):
+        """JSON-friendly summary for pages and snapshots (no value)."""
+        return {
+            "company": self.company["code"],
+            "name": self.company["name"],
+            "state": self.state,
+            "error": self.error,
+            "elapsed_ms": round(self.elapsed * 1000.0, 1),
+        }
+
+
+def _timed_call(fn):
+    t0 = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - t0
+
+
+def fan_out(tasks, workers=DEFAULT_WORKERS):
+    """Run ``[(company, fn, timeout, cancel)]`` concurrently; one CompanyResult per task, in order.
+
+    Timeouts count from the start of the fan-out, i.e. they bound what the
+    caller waits for that company (queueing behind a busy pool included).
+    ``cancel`` (or None) is called for a task that timed out.
+    """
+    pool = executor(workers)
+    started = time.monotonic()
+    submitted = [(company, timeout, cancel, pool.submit(_timed_call, fn))
+                 for company, fn, timeout, cancel in tasks]
+    results = []
+    for company, timeout, cancel, future in submitted:
+        try:
+            value, elapsed = future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+            results.append(CompanyResult(company, OK, value, elapsed=elapsed))
+        except concurrent.futures.TimeoutError:
+            if not future.cancel() and cancel is not None:  # still queued: never runs
+                cancel()
+            _logger.warning("mssql company %s: no answer within %ss", company["code"], timeout)
+            results.append(CompanyResult(company, TIMEOUT, error="timed out after %ss" % timeout,
+                                         elapsed=time.monotonic() - started))
+        except Exception as e:
+            _logger.warning("mssql company %s failed: %s", company["code"], e)
+            results.append(CompanyResult(company, ERROR, error=str(e), elapsed=time.monotonic() - started))
+    return results
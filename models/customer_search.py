@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Customer search over an aging snapshot: prefix and trigram lookups, ranked.
+
+Built once per snapshot next to the page index (see aging_index), so a lookup
+never scans the customer universe:
+
+- prefixes: codes, full names and every word of a name are kept in one
+  sorted term list; a query prefix is a ``bisect`` range in it;
+- trigrams: an inverted index from each trigram of ``"code name [company]"``
+  to the rows containing it (``array('I')`` postings), for substring matches
+  anywhere in the text and for approximate matches (typos, word order).
+
+Text is case- and accent-folded on both sides. Matches are ranked by how they
+matched (exact code first, then prefixes, substrings), then by outstanding
+total, so the biggest customers come first among equals. Approximate matches
+are only looked for when nothing else matched.
+"""
+import bisect
+import heapq
+import re
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Approximate matches must share this share of the query's trigrams
+MIN_SIMILARITY = 0.6
+
+# Answers kept per index (typeahead queries repeat while typing / erasing)
+MEMO_SIZE = 256
+
+# Rank of each way to match; approximate matches score below SUBSTRING
+EXACT_CODE = 100
+CODE_PREFIX = 90
+NAME_PREFIX = 80
+WORDS_PREFIX = 70
+WORD_PREFIX = 60
+SUBSTRING = 50
+APPROXIMATE = 40
+
+_CODE, _NAME, _WORD = 0, 1, 2
+_PREFIX_SCORES = {_CODE: CODE_PREFIX, _NAME: NAME_PREFIX, _WORD: WORD_PREFIX}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def fold(text):
+    """Lower-case ``text`` and drop accents (``Société`` -> ``societe``)."""
+    text = (text or "").strip().lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CustomerSearch:
+    __slots__ = ("result", "haystack", "_terms", "_term_rows", "_term_kinds", "_grams", "_memo")
+
+    def __init__(self, result):
+        self.result = result
+        codes = [fold(c) for c in result.codes]
+        names = [fold(n) for n in result.names]
+        self.haystack = ["%s %s" % (c, n) for c, n in zip(codes, names)]
+        if result.companies is not None:
+            # Consolidated view: the company code is searchable too
+            self.haystack = ["%s %s" % (h, fold(co)) for h, co in zip(self.haystack, result.companies)]
+
+        terms = []
+        for i, (code, name) in enumerate(zip(codes, names)):
+            if code:
+                terms.append((code, i, _CODE))
+            if name:
+                terms.append((name, i, _NAME))
+                terms.extend((word, i, _WORD) for word in set(_WORD_RE.findall(name)))
+        terms.sort()
+        self._terms = [t for t, _i, _k in terms]
+        self._term_rows = array("I", (i for _t, i, _k in terms))
+        self._term_kinds = bytes(k for _t, _i, k in terms)
+
+        grams = defaultdict(list)
+        for i, text in enumerate(self.haystack):
+            for gram in trigrams(text):
+                grams[gram].append(i)
+        self._grams = {gram: array("I", postings) for gram, postings in grams.items()}
+        self._memo = {}
+
+    # ---------------------------------------------------------------------
+    # Lookups
+    # ---------------------------------------------------------------------
+    def _prefixed(self, prefix):
+        """Indexes into the term list of the terms starting with ``prefix``."""
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\uffff", start)
+        return range(start, end)
+
+    def containing(self, needle):
+        """Rows whose text contains ``needle`` (folded), or None when it is too short to index."""
+        needle = fold(needle)
+        grams = trigrams(needle)
+        if not grams:
+            return None
+        candidates = None
+        # Intersect from the rarest trigram: the first posting list bounds the work
+        for gram in sorted(grams, key=lambda g: len(self._grams.get(g, ()))):
+            postings = self._grams.get(gram)
+            if not postings:
+                return set()
+            candidates = set(postings) if candidates is None else candidates.intersection(postings)
+            if not candidates:
+                return candidates
+        # Trigrams match in any order: confirm the substring itself
+        haystack = self.haystack
+        return {i for i in candidates if needle in haystack[i]}
+
+    def _approximate(self, query, scores):
+        grams = trigrams(query)
+        if len(grams) < 2:
+            return
+        hits = Counter()
+        for gram in grams:
+            hits.update(self._grams.get(gram, ()))
+        needed = MIN_SIMILARITY * len(grams)
+        for i, shared in hits.items():
+            if shared >= needed:
+                scores[i] = APPROXIMATE * shared / len(grams)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Best matches for ``query`` as ``(positions, scores, count)``, best first.
+
+        ``count`` is the number of matching customers, of which ``limit`` come back.
+        """
+        query = fold(query)
+        if not query:
+            return [], [], 0
+        limit = max(1, min(MAX_LIMIT, int(limit or DEFAULT_LIMIT)))
+        key = (query, limit)
+        if key not in self._memo:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[key] = self._search(query, limit)
+        return self._memo[key]
+
+    def _search(self, query, limit):
+        scores = {}
+        terms, rows, kinds = self._terms, self._term_rows, self._term_kinds
+        for t in self._prefixed(query):
+            kind = kinds[t]
+            score = EXACT_CODE if kind == _CODE and terms[t] == query else _PREFIX_SCORES[kind]
+            i = rows[t]
+            if score > scores.get(i, 0):
+                scores[i] = score
+
+        words = _WORD_RE.findall(query)
+        if len(words) > 1:
+            # Every word of the query starts some word of the name, in any order
+            matched = None
+            for word in words:
+                found = {rows[t] for t in self._prefixed(word) if kinds[t] == _WORD}
+                matched = found if matched is None else matched & found
+                if not matched:
+                    break
+            for i in matched or ():
+                if scores.get(i, 0) < WORDS_PREFIX:
+                    scores[i] = WORDS_PREFIX
+
+        for i in self.containing(query) or ():
+            scores.setdefault(i, SUBSTRING)
+
+        if not scores:
+            self._approximate(query, scores)
+
+        totals = self.result.columns["total"]
+        names = self.result.names
+        best = heapq.nsmallest(limit, scores, key=lambda i: (-scores[i], -abs(totals[i]), names[i]))
+        return best, [round(scores[i], 1) for i in best], len(scores)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""PostgreSQL dialect of the bridge's read statements, for the local mirror.
+
+Same bucket rules, customer scope, column layout and order as the MSSQL
+statements in bridge.py, so the RowSpecs there decode both. The mirror
+tables (see aging_mirror) only hold open items, so OPEN_ITEM_FILTER is
+already applied; customer codes are stored stripped and due dates both as
+the raw yyyymmdd number (``datedue``, used by the bucket rules) and as a
+date (``due_date``, what TRY_CONVERT returns: NULL when invalid).
+
+Statements take named parameters: ``company`` and the bucket boundaries of
+``bounds_params``. No literal ``%`` may appear in them (psycopg2 format).
+"""
+from . import aging_rules
+
+ITEM_TABLE = "mssql_mirror_item"
+CUSTOMER_TABLE = "mssql_mirror_customer"
+
+# Bucket boundaries as yyyymmdd integers, bound once per statement
+BOUNDS_JOIN = """
+    CROSS JOIN (
+        SELECT %(d_today)s::int AS d_today, %(d_30)s::int AS d_30,
+               %(d_60)s::int AS d_60, %(d_90)s::int AS d_90
+    ) bd
+"""
+
+
+def bounds_params(today):
+    """``BOUNDS_JOIN`` parameters for ``today`` (the mirror's stand-in for GETDATE())."""
+    return dict(zip(("d_today", "d_30", "d_60", "d_90"), aging_rules.bucket_bounds(today)))
+
+
+def _forced_current(a):
+    """Negative PY*/C* documents always age as 'current' (LIKE 'P%' is case-insensitive on MSSQL)."""
+    return f"(upper(left({a}.idinvc, 1)) IN ('P', 'C') AND {a}.amtduehc < 0)"
+
+
+def bucket_case(a):
+    """Bucket of a mirror item aliased ``a`` (needs BOUNDS_JOIN), as bridge.bucket_case."""
+    return f"""
+            CASE
+                WHEN {_forced_current(a)} THEN 'current'
+                WHEN {a}.datedue >  bd.d_today THEN 'current'
+                WHEN {a}.datedue >= bd.d_30    THEN 'd0_30'
+                WHEN {a}.datedue >= bd.d_60    THEN 'd31_60'
+                WHEN {a}.datedue >= bd.d_90    THEN 'd61_90'
+                ELSE 'd90p'
+            END"""
+
+
+def bucket_predicate(a, bucket):
+    """Range predicate selecting the rows of one bucket, as bridge.bucket_predicate."""
+    forced = _forced_current(a)
+    if bucket == "current":
+        return f"({forced} OR {a}.datedue > bd.d_today)"
+    ranges = {
+        "d0_30": f"{a}.datedue BETWEEN bd.d_30 AND bd.d_today",
+        "d31_60": f"{a}.datedue >= bd.d_60 AND {a}.datedue < bd.d_30",
+        "d61_90": f"{a}.datedue >= bd.d_90 AND {a}.datedue < bd.d_60",
+        "d90p": f"({a}.datedue < bd.d_90 OR {a}.datedue IS NULL)",
+    }
+    return f"({ranges[bucket]} AND NOT {forced})"
+
+
+def _customer_join(a):
+    return f"JOIN {CUSTOMER_TABLE} cu ON cu.company = {a}.company AND cu.idcust = {a}.idcust"
+
+
+# get_aging_by_customer: AgingResult.from_records column order
+AGING_SQL = f"""
+    WITH ar AS (
+        SELECT
+            ob.idcust AS customer_code,
+            cu.namecust AS customer_name,
+            ob.amtduehc AS balance,
+            {bucket_case("ob")} AS bucket
+        FROM {ITEM_TABLE} ob
+        {_customer_join("ob")}
+        {BOUNDS_JOIN}
+        WHERE ob.company = %(company)s
+    )
+    SELECT
+        customer_code,
+        MAX(customer_name) AS customer_name,
+        SUM(CASE WHEN bucket = 'current' THEN balance ELSE 0 END) AS current_amt,
+        SUM(CASE WHEN bucket = 'd0_30'  THEN balance ELSE 0 END) AS d0_30,
+        SUM(CASE WHEN bucket = 'd31_60' THEN balance ELSE 0 END) AS d31_60,
+        SUM(CASE WHEN bucket = 'd61_90' THEN balance ELSE 0 END) AS d61_90,
+        SUM(CASE WHEN bucket = 'd90p'   THEN balance ELSE 0 END) AS d90p,
+        SUM(balance) AS total_amt
+    FROM ar
+    GROUP BY customer_code
+    HAVING ABS(SUM(balance)) > 0
+    ORDER BY customer_code;
+"""
+
+
+# get_open_item_store: aging_store.InvoiceStore input
+STORE_ITEMS_SQL = f"""
+    SELECT ob.idcust, cu.namecust, ob.datedue, ob.amtduehc, left(ob.idinvc, 1)
+    FROM {ITEM_TABLE} ob
+    {_customer_join("ob")}
+    WHERE ob.company = %(company)s
+"""
+
+
+def customer_invoices_sql(by_name=False, bucket=None):
+    """get_invoices_basic_by_customer (INVOICE_SPEC columns); binds ``code`` or ``name``."""
+    where = "rtrim(cu.namecust) = %(name)s" if by_name else "bl.idcust = %(code)s"
+    bucket_filter = f"AND {bucket_predicate('bl', bucket)}" if bucket else ""
+    # SQL Server sorts NULLs first: NULLS LAST/FIRST keep its order
+    return f"""
+        SELECT
+            bl.idinvc       AS IDINV,
+            bl.due_date     AS DATEINVC,
+            bl.due_date     AS DUE_DATE,
+            bl.idordernbr,
+            bl.idcustpo,
+            bl.descinvc,
+            bl.amtduehc     AS AMTINVCHC,
+            {bucket_case("bl")} AS bucket
+        FROM {ITEM_TABLE} bl
+        {_customer_join("bl") if by_name else ""}
+        {BOUNDS_JOIN}
+        WHERE bl.company = %(company)s
+          AND {where}
+          {bucket_filter}
+        ORDER BY bl.datedue DESC NULLS LAST, bl.idordernbr NULLS FIRST;
+    """
+
+
+def batch_invoices_sql(bucket=None):
+    """get_invoices_basic_by_customers (BATCH_INVOICE_SPEC columns); binds the ``codes`` list."""
+    bucket_filter = f"AND {bucket_predicate('bl', bucket)}" if bucket else ""
+    return f"""
+        SELECT
+            bl.idcust       AS customer_code,
+            bl.idinvc       AS IDINV,
+            bl.due_date     AS DATEINVC,
+            bl.idordernbr,
+            bl.idcustpo,
+            bl.descinvc,
+            bl.amtduehc     AS AMTINVCHC,
+            {bucket_case("bl")} AS bucket
+        FROM {ITEM_TABLE} bl
+        {BOUNDS_JOIN}
+        WHERE bl.company = %(company)s
+          AND bl.idcust = ANY(%(codes)s)
+          {bucket_filter}
+        ORDER BY bl.idcust, bl.datedue DESC NULLS LAST, bl.idordernbr NULLS FIRST;
+    """
+
+
+def bucket_invoices_sql(bucket=None):
+    """bridge.bucket_invoices_sql on the mirror (BUCKET_INVOICE_SPEC / EXPORT_SPEC columns)."""
+    bucket_filter = f"AND {bucket_predicate('bl', bucket)}" if bucket else ""
+    return f"""
+        WITH allowed_customers AS (
+            SELECT ob.idcust AS customer_code
+            FROM {ITEM_TABLE} ob
+            {_customer_join("ob")}
+            WHERE ob.company = %(company)s
+            GROUP BY ob.idcust
+            HAVING ABS(SUM(ob.amtduehc)) <> 0
+        )
+        SELECT
+            bl.idcust       AS customer_code,
+            cu.namecust     AS customer_name,
+            bl.idinvc       AS IDINV,
+            bl.due_date     AS DATEINVC,
+            bl.due_date     AS DUE_DATE,
+            bl.idordernbr,
+            bl.idcustpo,
+            bl.descinvc,
+            bl.amtduehc     AS AMTINVCHC,
+            {bucket_case("bl")} AS bucket
+        FROM {ITEM_TABLE} bl
+        {_customer_join("bl")}
+        {BOUNDS_JOIN}
+        WHERE bl.company = %(company)s
+          AND bl.idcust IN (SELECT customer_code FROM allowed_customers)
+          {bucket_filter}
+        ORDER BY cu.namecust, bl.idcust, bl.datedue DESC NULLS LAST, bl.idinvc;
+    """
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Process-wide pyodbc connection pools for the MSSQL bridge.
+
+Opening an encrypted connection to Sage 300 (TLS + login) costs more than most
+of the queries we run, so connections are kept and reused per worker process.
+Pools are keyed by the connection parameters: when a system parameter changes,
+the next checkout builds a fresh pool and the stale one is closed.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pyodbc
+
+from .query_metrics import metrics
+from .row_decoding import install_converters
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 300      # seconds an idle connection may stay in the pool
+DEFAULT_CHECKOUT_TIMEOUT = 30   # seconds to wait for a free slot
+LOGIN_TIMEOUT = 10
+
+
+class PoolExhausted(Exception):
+    """No connection became available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """A small LIFO pool of pyodbc connections with a health-check on checkout."""
+
+    def __init__(self, conn_str, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT, label=""):
+        self.conn_str = conn_str
+        self.size = max(1, int(size))
+        self.idle_timeout = max(0, int(idle_timeout))
+        self.checkout_timeout = max(1, int(checkout_timeout))
+        self.label = label
+        self.closed = False
+        self._idle = deque()          # (conn, last_used)
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "created": 0,
+            "reconnects": 0,
+            "expired": 0,
+            "discarded": 0,
+        }
+
+    # ---------------------------------------------------------------------
+    # Connection lifecycle
+    # ---------------------------------------------------------------------
+    def _open(self):
+        t0 = time.perf_counter()
+        try:
+            conn = pyodbc.connect(self.conn_str, timeout=LOGIN_TIMEOUT, autocommit=True)
+        except Exception:
+            metrics.record("connection", self.label, "open", time.perf_counter() - t0, error=True)
+            raise
+        metrics.record("connection", self.label, "open", time.perf_counter() - t0)
+        install_converters(conn)
+        with self._cond:
+            self.stats["created"] += 1
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        conn = None
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            if self.closed:
+                raise PoolExhausted("connection pool is closed")
+            self.stats["checkouts"] += 1
+            waited = False
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    candidate, last_used = self._idle.pop()
+                    if self.idle_timeout and now - last_used > self.idle_timeout:
+                        self.stats["expired"] += 1
+                        self._close(candidate)
+                        continue
+                    conn = candidate
+                    break
+                if conn is not None or self._in_use < self.size:
+                    self._in_use += 1
+                    break
+                if not waited:
+                    self.stats["waits"] += 1
+                    waited = True
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise PoolExhausted(
+                        "no MSSQL connection available after %ss (pool size %s)"
+                        % (self.checkout_timeout, self.size)
+                    )
+                self._cond.wait(remaining)
+                if self.closed:
+                    # close() ran while we waited: do not open on a closed pool
+                    raise PoolExhausted("connection pool is closed")
+
+        # Network work happens outside the lock
+        try:
+            if conn is not None and not self._healthy(conn):
+                _logger.debug("mssql pool %s: dropping dead connection", self.label)
+                self._close(conn)
+                conn = None
+                with self._cond:
+                    self.stats["reconnects"] += 1
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            self._in_use -= 1
+            if discard or self.closed:
+                if discard:
+                    self.stats["discarded"] += 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out; it is discarded instead of reused if the block raises."""
+        conn = self.acquire()
+        ok = False
+        try:
+            yield conn
+            ok = True
+        finally:
+            self.release(conn, discard=not ok)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            while self._idle:
+                conn, _last = self._idle.pop()
+                self._close(conn)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "label": self.label,
+                "size": self.size,
+                "idle_timeout": self.idle_timeout,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self.stats,
+            }
+
+
+# -------------------------------------------------------------------------
+# Registry (one pool per parameter set, per process)
+# -------------------------------------------------------------------------
+_pools = {}        # key -> ConnectionPool
+_current = {}      # owner (Odoo db name) -> key
+_registry_lock = threading.Lock()
+
+
+def pool_key(conn_str, size, idle_timeout, checkout_timeout):
+    # The connection string carries the password: only keep a digest of it
+    digest = hashlib.sha256(conn_str.encode("utf-8")).hexdigest()
+    return (digest, int(size), int(idle_timeout), int(checkout_timeout))
+
+
+def get_pool(owner, conn_str, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+             checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT, label=""):
+    """Return the pool for these parameters, replacing the owner's stale pool if they changed."""
+    key = pool_key(conn_str, size, idle_timeout, checkout_timeout)
+    stale = None
+    with _registry_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(conn_str, size=size, idle_timeout=idle_timeout,
+                                  checkout_timeout=checkout_timeout, label=label)
+            _pools[key] = pool
+        previous = _current.get(owner)
+        _current[owner] = key
+        if previous is not None and previous != key and previous not in _current.values():
+            stale = _pools.pop(previous, None)
+    if stale is not None:
+        _logger.info("mssql pool %s: parameters changed, closing previous pool", label)
+        stale.close()
+    return pool
+
+
+def pool_stats():
+    with _registry_lock:
+        pools = list(_pools.values())
+    return [p.snapshot() for p in pools]
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""Query budgets, cancellation and a circuit breaker for the MSSQL bridge.
+
+Budgets: a query block runs with an execution timeout (seconds) chosen per
+kind of query. It is set as the ODBC query timeout of the connection, so the
+driver cancels the statement itself; the watchdog thread cancels the cursors
+of a block still running ``WATCHDOG_GRACE`` seconds past its budget, for
+drivers that do not apply the attribute while fetching.
+
+Cancellation: a ``CancelToken`` tracks the cursors opened by one block and
+``cancel()`` sends them SQLCancel from any thread. The fan-out cancels the
+token of a company it stopped waiting for, and an export stream closed early
+(client gone) cancels its own, so Sage 300 does not keep working for nobody.
+
+Circuit breaker: one per company connection. After ``threshold`` timeouts or
+failed logins in a row it opens: blocks fail fast with CircuitOpen without
+touching the server, and cached snapshots are served instead. After
+``cooldown`` seconds one trial block is let through (half open); an answer
+closes the breaker, another timeout opens it again.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 3        # consecutive timeouts before the breaker opens
+DEFAULT_COOLDOWN = 60        # seconds before a trial query is let through
+WATCHDOG_GRACE = 5           # seconds past its budget before a block is cancelled
+
+# SQLSTATEs of an expired ODBC query / login timeout
+TIMEOUT_STATES = ("HYT00", "HYT01")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """The company's breaker is open: the query was not sent."""
+
+
+class QueryCancelled(Exception):
+    """The block was cancelled before this statement could start."""
+
+
+def is_timeout(exc):
+    """Whether ``exc`` is a pyodbc error for an expired query or login timeout."""
+    args = getattr(exc, "args", None) or ()
+    return bool(args) and args[0] in TIMEOUT_STATES
+
+
+# -------------------------------------------------------------------------
+# Cancellation
+# -------------------------------------------------------------------------
+class CancelToken:
+    """Cursors of one query block, cancellable from another thread."""
+
+    __slots__ = ("cursors", "cancelled", "timed_out", "error", "done", "_lock")
+
+    def __init__(self):
+        self.cursors = []
+        self.cancelled = False
+        self.timed_out = False
+        self.error = None            # the driver's timeout error, if any
+        self.done = False
+        self._lock = threading.Lock()
+
+    def track(self, cursor):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled("query abandoned by its caller")
+            self.cursors.append(cursor)
+        return cursor
+
+    def cancel(self, timeout=False):
+        """Stop whatever the block's cursors are running; ``timeout`` counts it for the breaker."""
+        with self._lock:
+            if self.done:
+                return
+            self.cancelled = True
+            # Only a statement that was running counts against the server
+            self.timed_out = self.timed_out or (timeout and bool(self.cursors))
+            cursors = list(self.cursors)
+        for cursor in cursors:
+            try:
+                cursor.cancel()
+            except Exception:
+                pass
+
+    def note(self, exc):
+        if is_timeout(exc):
+            self.timed_out = True
+            self.error = exc
+
+    def finish(self):
+        with self._lock:
+            self.done = True
+            self.cursors = []
+
+
+class GuardedCursor:
+    """Cursor proxy that refuses to start once cancelled and records timeouts."""
+
+    def __init__(self, cursor, token):
+        self._cursor = cursor
+        self._token = token
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _call(self, method, *args):
+        if self._token.cancelled:
+            raise QueryCancelled("query abandoned by its caller")
+        try:
+            return getattr(self._cursor, method)(*args)
+        except Exception as e:
+            self._token.note(e)
+            raise
+
+    def execute(self, *args):
+        self._call("execute", *args)
+        return self
+
+    def fetchone(self):
+        return self._call("fetchone")
+
+    def fetchmany(self, size):
+        return self._call("fetchmany", size)
+
+    def fetchall(self):
+        return self._call("fetchall")
+
+
+class GuardedConnection:
+    """Connection proxy whose cursors are tracked by ``token``."""
+
+    def __init__(self, conn, token):
+        self._conn = conn
+        self._token = token
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return GuardedCursor(self._token.track(self._conn.cursor()), self._token)
+
+
+class Watchdog:
+    """One thread cancelling the blocks that outlive their deadline."""
+
+    def __init__(self):
+        self._heap = []              # (deadline, seq, token, label)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def watch(self, token, seconds, label=""):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + seconds, next(self._seq), token, label))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mssql-watchdog", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._heap and self._heap[0][2].done:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _deadline, _seq, token, label = heapq.heappop(self._heap)
+            if not token.done:
+                _logger.warning("mssql query %s still running past its budget: cancelling it", label)
+                token.cancel(timeout=True)
+
+
+# -------------------------------------------------------------------------
+# Circuit breaker
+# -------------------------------------------------------------------------
+class CircuitBreaker:
+    def __init__(self, name, label="", threshold=DEFAULT_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        self.name = name
+        self.label = label
+        self.threshold = max(1, int(threshold))
+        self.cooldown = max(1, int(cooldown))
+        self.state = CLOSED
+        self.failures = 0            # consecutive
+        self.trips = 0
+        self.opened_at = 0.0
+        self.last_error = ""
+        self._trial = False          # a half-open trial is in flight
+        self._lock = threading.Lock()
+
+    def _check_open(self):
+        wait = self.opened_at + self.cooldown - time.monotonic()
+        if self.state == OPEN and wait > 0:
+            raise CircuitOpen(
+                "%s is not answering (%s timeouts in a row); next try in %ss"
+                % (self.label or self.name, self.failures, int(wait) + 1)
+            )
+
+    def check(self):
+        """Raise CircuitOpen while open, without taking the half-open trial."""
+        with self._lock:
+            self._check_open()
+
+    def before(self):
+        """Let a block through, or raise CircuitOpen."""
+        with self._lock:
+            self._check_open()
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._trial:
+                    raise CircuitOpen("%s is not answering; a trial query is running" % (self.label or self.name))
+                self._trial = True
+
+    def success(self):
+        """The server answered (even with an SQL error)."""
+        with self._lock:
+            if self.state != CLOSED:
+                _logger.info("mssql %s answers again: circuit closed", self.label or self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def failure(self, error=""):
+        """A timeout or a failed login."""
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error or "")[:300]
+            self._trial = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                _logger.warning("mssql %s: %s timeouts in a row, circuit open for %ss",
+                                self.label or self.name, self.failures, self.cooldown)
+
+    def release_trial(self):
+        """The block never reached the server (no pooled connection): let another one try."""
+        with self._lock:
+            self._trial = False
+
+    def status(self):
+        with self._lock:
+            retry_in = 0
+            if self.state == OPEN:
+                retry_in = max(0, int(self.opened_at + self.cooldown - time.monotonic()) + 1)
+            return {
+                "name": self.name,
+                "label": self.label,
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "retry_in": retry_in,
+                "last_error": self.last_error,
+            }
+
+
+_breakers = {}     # name -> CircuitBreaker
+_registry_lock = threading.Lock()
+
+
+def breaker_for(name, label="", threshold=DEFAULT_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+    """The process-wide breaker of ``name`` (settings follow the current parameters)."""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, label, threshold, cooldown)
+        else:
+            breaker.label = label or breaker.label
+            breaker.threshold = max(1, int(threshold))
+            breaker.cooldown = max(1, int(cooldown))
+        return breaker
+
+
+def breakers_status():
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return [b.status() for b in breakers]
+
+
+# One watchdog per worker process
+watchdog = Watchdog()
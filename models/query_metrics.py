@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Latency histograms for the MSSQL bridge and the /recv endpoints.
+
+Every bridge query is timed in phases: ``connect`` (pool checkout, including a
+new TLS login when needed), ``execute`` (SQL Server), ``fetch`` (rows over the
+network) and ``decode`` (the Python work around them). Endpoints are timed as a
+whole plus their QWeb ``render``. Comparing the phases tells whether a slowdown
+comes from Sage 300, the network or Odoo.
+
+Histograms use fixed millisecond buckets, so memory stays constant however
+many samples are recorded; percentiles are interpolated inside a bucket.
+Metrics are kept per worker process, like the connection pools.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+_logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the histogram buckets; one more bucket catches the rest
+BUCKET_BOUNDS_MS = tuple(
+    m * scale for scale in (1, 10, 100, 1000) for m in (1, 1.5, 2, 3, 5, 7)
+) + (10000, 15000, 20000, 30000, 60000)
+PERCENTILES = (0.5, 0.95, 0.99)
+DEFAULT_SLOW_QUERY_MS = 2000
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total_ms", "min_ms", "max_ms", "errors", "rows")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+        self.errors = 0
+        self.rows = 0
+
+    def add(self, ms, rows=0, error=False):
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+        if error:
+            self.errors += 1
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if not n:
+                continue
+            if seen + n >= rank:
+                lo = BUCKET_BOUNDS_MS[i - 1] if i else 0.0
+                hi = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+                # Never report more than was observed, nor less than the minimum
+                lo, hi = max(lo, self.min_ms), min(hi, self.max_ms)
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return self.max_ms
+
+    def summary(self):
+        out = {
+            "count": self.count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.count, 4) if self.count else 0.0,
+            "rows": self.rows,
+            "rows_avg": round(self.rows / self.count, 1) if self.count else 0.0,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 1),
+        }
+        for q in PERCENTILES:
+            out["p%d_ms" % round(q * 100)] = round(self.percentile(q), 1)
+        return out
+
+
+class MetricsRegistry:
+    """``(kind, name, phase) -> Histogram`` for kinds ``query``, ``endpoint``, ``connection``."""
+
+    def __init__(self):
+        self._hists = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def record(self, kind, name, phase, seconds, rows=0, error=False):
+        key = (kind, name, phase)
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = Histogram()
+            hist.add(seconds * 1000.0, rows=rows, error=error)
+
+    def reset(self):
+        with self._lock:
+            self._hists.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """``{kind: {name: {phase: summary}}}`` plus the process it describes."""
+        with self._lock:
+            items = [(key, hist.summary()) for key, hist in self._hists.items()]
+        out = {"pid": os.getpid(), "since": self.started_at}
+        for (kind, name, phase), summary in sorted(items):
+            out.setdefault(kind, {}).setdefault(name, {})[phase] = summary
+        return out
+
+
+class QuerySpan:
+    """Timing of one bridge query, split into phases."""
+
+    def __init__(self, name, slow_ms=DEFAULT_SLOW_QUERY_MS):
+        self.name = name
+        self.slow_ms = slow_ms
+        self.phases = {"connect": 0.0, "execute": 0.0, "fetch": 0.0}
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def add(self, phase, seconds, rows=0):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.rows += rows
+
+    def finish(self, error=False):
+        total = time.perf_counter() - self.started
+        phases = dict(self.phases, decode=max(0.0, total - sum(self.phases.values())))
+        for phase, seconds in phases.items():
+            metrics.record("query", self.name, phase, seconds, error=error)
+        metrics.record("query", self.name, "total", total, rows=self.rows, error=error)
+        ms = total * 1000.0
+        if self.slow_ms and ms >= self.slow_ms:
+            _logger.warning(
+                "slow MSSQL query %s: %.0f ms (connect %.0f, execute %.0f, fetch %.0f, decode %.0f), %s rows%s",
+                self.name, ms, *(phases[p] * 1000.0 for p in ("connect", "execute", "fetch", "decode")),
+                self.rows, " [failed]" if error else "",
+            )
+
+
+class TimedCursor:
+    """pyodbc cursor proxy adding execute/fetch times and row counts to a span."""
+
+    def __init__(self, cursor, span):
+        self._cursor = cursor
+        self._span = span
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, *args):
+        t0 = time.perf_counter()
+        try:
+            self._cursor.execute(*args)
+        finally:
+            self._span.add("execute", time.perf_counter() - t0)
+        return self
+
+    def _fetch(self, method, *args):
+        t0 = time.perf_counter()
+        result = getattr(self._cursor, method)(*args)
+        rows = (1 if result is not None else 0) if method == "fetchone" else len(result)
+        self._span.add("fetch", time.perf_counter() - t0, rows=rows)
+        return result
+
+    def fetchone(self):
+        return self._fetch("fetchone")
+
+    def fetchmany(self, size):
+        return self._fetch("fetchmany", size)
+
+    def fetchall(self):
+        return self._fetch("fetchall")
+
+
+class TimedConnection:
+    """pyodbc connection proxy whose cursors report to ``span``."""
+
+    def __init__(self, conn, span):
+        self._conn = conn
+        self._span = span
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return TimedCursor(self._conn.cursor(), self._span)
+
+
+def _result_rows(result):
+    if isinstance(result, dict):
+        for key in ("rows", "customers"):
+            if isinstance(result.get(key), (list, dict)):
+                return len(result[key])
+        return 0
+    qcontext = getattr(result, "qcontext", None) or {}
+    if "row_count" in qcontext:
+        return qcontext["row_count"] or 0
+    return len(qcontext.get("rows") or ())
+
+
+def timed_endpoint(name):
+    """Decorator for controller methods (below ``@http.route``).
+
+    Records the whole call under ``("endpoint", name, "total")``; a lazy QWeb
+    response is rendered here so that its ``render`` time is measured too. A
+    raised exception or a JSON result carrying ``"error"`` counts as an error.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            result, error = None, True
+            try:
+                result = method(*args, **kwargs)
+                if getattr(result, "is_qweb", False):
+                    t1 = time.perf_counter()
+                    result.flatten()
+                    metrics.record("endpoint", name, "render", time.perf_counter() - t1)
+                error = isinstance(result, dict) and bool(result.get("error"))
+                return result
+            finally:
+                metrics.record("endpoint", name, "total", time.perf_counter() - t0,
+                               rows=_result_rows(result) if result is not None else 0, error=error)
+        return wrapper
+    return decorate
+
+
+# One registry per worker process
+metrics = MetricsRegistry()
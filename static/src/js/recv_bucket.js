@@ -3,49 +3,289 @@
 (function () {
   "use strict";
 
+  // The page ships only its header and totals. Customer groups (with their
+  // server-side subtotals) come from /recv/bucket/<bucket>/groups, invoice
+  // lines from /recv/bucket/<bucket>/rows in windows of CHUNK rows, and only
+  // the lines inside the scrolled viewport are in the DOM.
+  //
+  // Every line (group header or invoice) is ROW_HEIGHT px high, so the layout
+  // is a prefix sum over the groups: an open group takes 1 + count lines, a
+  // collapsed one a single line.
+
+  const ROW_HEIGHT = 30;   // px, see .o-bucket__viewport in recv_bucket.scss
+  const CHUNK = 200;       // invoice lines per /rows request
+  const OVERSCAN = 12;     // lines rendered above and below the viewport
+
   function fmt3(n) {
     const x = Number(n || 0);
     return x.toLocaleString(undefined, { minimumFractionDigits: 3, maximumFractionDigits: 3 });
   }
 
-  function parseNum(str) {
-    if (!str) return 0;
-    return Number(String(str).replace(/,/g, "")) || 0;
+  const escapeHtml = (s) =>
+    String(s == null ? "" : s).replace(/[&<>"']/g, (m) => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" }[m]));
+
+  // GET, so the browser revalidates its copy with If-None-Match (304 when unchanged)
+  function getJson(url, params) {
+    const u = new URL(url, window.location.origin);
+    Object.entries(params || {}).forEach(([k, v]) => {
+      if (v !== "" && v != null) u.searchParams.set(k, v);
+    });
+    return fetch(u, { credentials: "same-origin" }).then((r) => {
+      if (!r.ok) throw new Error(`HTTP ${r.status}`);
+      return r.json();
+    });
   }
 
-  function recalcTotal(tbody, totalSpanIds) {
-    let sum = 0;
-    tbody.querySelectorAll("tr:not(.d-none) .o-bucket-amt").forEach(td => {
-      sum += parseNum(td.textContent);
+  // Compact payload { columns: [...], values: [array per column] } -> row objects
+  function fromColumns(payload) {
+    const columns = payload.columns || [];
+    const values = payload.values || [];
+    const count = values.length ? values[0].length : 0;
+    const rows = new Array(count);
+    for (let i = 0; i < count; i++) {
+      const row = {};
+      for (let c = 0; c < columns.length; c++) row[columns[c]] = values[c][i];
+      rows[i] = row;
+    }
+    return rows;
+  }
+
+  const state = {
+    bucket: "",
+    version: "",
+    q: "",
+    groups: [],               // { company, customer_code, customer_name, start, count, subtotal, open }
+    lineStart: new Int32Array(1), // first line of each group, plus the total line count
+    chunks: new Map(),        // chunk index -> array of rows, or a pending Promise
+    seq: 0,
+    frame: 0,
+  };
+
+  // --- layout -----------------------------------------------------------------
+  function layout() {
+    const starts = new Int32Array(state.groups.length + 1);
+    let line = 0;
+    state.groups.forEach((g, i) => {
+      starts[i] = line;
+      line += g.open ? 1 + g.count : 1;
     });
-    for (const id of totalSpanIds) {
+    starts[state.groups.length] = line;
+    state.lineStart = starts;
+  }
+
+  // Group holding ``line`` (binary search over the prefix sums)
+  function groupAt(line) {
+    const starts = state.lineStart;
+    let lo = 0;
+    let hi = state.groups.length - 1;
+    while (lo < hi) {
+      const mid = (lo + hi + 1) >> 1;
+      if (starts[mid] <= line) lo = mid;
+      else hi = mid - 1;
+    }
+    return lo;
+  }
+
+  // --- invoice rows, one window (chunk) at a time -----------------------------
+  function rowAt(position) {
+    const rows = state.chunks.get(Math.floor(position / CHUNK));
+    return Array.isArray(rows) ? rows[position % CHUNK] : null;
+  }
+
+  function loadChunk(k) {
+    if (state.chunks.has(k)) return;
+    const seq = state.seq;
+    const pending = getJson(`/recv/bucket/${state.bucket}/rows`, { q: state.q, offset: k * CHUNK, limit: CHUNK })
+      .then((data) => {
+        if (seq !== state.seq) return;
+        if (data.error) throw new Error(data.error);
+        if (data.version !== state.version) {
+          // The snapshot moved on since the groups were laid out
+          loadGroups();
+          return;
+        }
+        state.chunks.set(k, fromColumns(data));
+        schedule();
+      })
+      .catch((e) => {
+        if (seq !== state.seq) return;
+        console.error("[mssql_bridge] bucket rows fetch failed", e);
+        state.chunks.delete(k);
+      });
+    state.chunks.set(k, pending);
+  }
+
+  // --- rendering --------------------------------------------------------------
+  function groupRow(g, i) {
+    return `
+      <tr class="o-bucket-group${g.open ? " open" : ""}" data-group="${i}">
+        <td>
+          <span class="o-bucket-group__toggle">${g.open ? "▾" : "▸"}</span>
+          ${g.company ? `<span class="o-recv-company">${escapeHtml(g.company)}</span>` : ""}${escapeHtml(g.customer_code)}
+        </td>
+        <td class="o-bucket-group__name">${escapeHtml(g.customer_name)}</td>
+        <td colspan="3" class="o-bucket-group__count">${g.count} invoice${g.count === 1 ? "" : "s"}</td>
+        <td class="num o-bucket-amt col-${state.bucket}">${fmt3(g.subtotal)}</td>
+      </tr>`;
+  }
+
+  function invoiceRow(r) {
+    if (!r) {
+      return "<tr class='o-bucket-row o-bucket-row--loading'><td></td><td colspan='5' class='text-muted'>…</td></tr>";
+    }
+    return `
+      <tr class="o-bucket-row">
+        <td></td>
+        <td></td>
+        <td class="o-bucket__inv" title="${escapeHtml(r.IDINV)}">${escapeHtml(r.IDINV)}</td>
+        <td>${escapeHtml(r.DATEINVC)}</td>
+        <td class="o-bucket__desc" title="${escapeHtml(r.DESCINVC)}">${escapeHtml(r.DESCINVC)}</td>
+        <td class="num o-bucket-amt col-${state.bucket}">${fmt3(r.AMTINVCHC)}</td>
+      </tr>`;
+  }
+
+  // Stands for ``lines`` lines outside the rendered window
+  function spacer(lines) {
+    return `<tr class="o-bucket-spacer"><td colspan="6" style="height:${lines * ROW_HEIGHT}px"></td></tr>`;
+  }
+
+  function render() {
+    state.frame = 0;
+    const viewport = document.getElementById("bucketViewport");
+    const tbody = document.querySelector("#bucketTable tbody");
+    if (!viewport || !tbody) return;
+
+    const total = state.lineStart[state.groups.length];
+    if (!total) {
+      tbody.innerHTML = `<tr><td colspan="6" class="text-muted">${state.q ? "No matching invoices." : "No invoices."}</td></tr>`;
+      return;
+    }
+    const first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - OVERSCAN);
+    const last = Math.min(total, Math.ceil((viewport.scrollTop + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+
+    const html = [spacer(first)];
+    let gi = groupAt(first);
+    for (let line = first; line < last; line++) {
+      while (gi + 1 < state.groups.length && state.lineStart[gi + 1] <= line) gi++;
+      const g = state.groups[gi];
+      const offset = line - state.lineStart[gi];
+      if (offset === 0) {
+        html.push(groupRow(g, gi));
+        continue;
+      }
+      const position = g.start + offset - 1;
+      const row = rowAt(position);
+      if (!row) loadChunk(Math.floor(position / CHUNK));
+      html.push(invoiceRow(row));
+    }
+    html.push(spacer(total - last));
+    tbody.innerHTML = html.join("");
+  }
+
+  function schedule() {
+    if (!state.frame) state.frame = window.requestAnimationFrame(render);
+  }
+
+  function setTotals(total) {
+    for (const id of ["bucketTotal", "bucketTotalFoot"]) {
       const el = document.getElementById(id);
-      if (el) el.textContent = fmt3(sum);
+      if (el) el.textContent = fmt3(total);
+    }
+  }
+
+  // --- groups -----------------------------------------------------------------
+  async function loadGroups() {
+    const seq = ++state.seq;
+    state.chunks = new Map();
+    try {
+      const data = await getJson(`/recv/bucket/${state.bucket}/groups`, { q: state.q });
+      if (seq !== state.seq) return;
+      if (data.error) throw new Error(data.error);
+      // Keep what the user collapsed when the same customers come back
+      const closed = new Set(state.groups.filter((g) => !g.open).map((g) => `${g.company}\u0000${g.customer_code}`));
+      state.groups = fromColumns(data).map((g) => Object.assign(g, {
+        open: !closed.has(`${g.company}\u0000${g.customer_code}`),
+      }));
+      state.version = data.version;
+      layout();
+      setTotals(data.total);
+      const viewport = document.getElementById("bucketViewport");
+      if (viewport) viewport.scrollTop = Math.min(viewport.scrollTop, state.lineStart[state.groups.length] * ROW_HEIGHT);
+      schedule();
+    } catch (e) {
+      if (seq !== state.seq) return;
+      console.error("[mssql_bridge] bucket groups fetch failed", e);
+      const tbody = document.querySelector("#bucketTable tbody");
+      if (tbody) tbody.innerHTML = "<tr><td colspan='6' class='text-danger'>Failed to load invoices.</td></tr>";
     }
   }
-  function bindBucketSearch() {
-    const table = document.getElementById("bucketTable");
-    if (!table) return;
 
-    const tbody = table.querySelector("tbody");
+  function setAllOpen(open) {
+    state.groups.forEach((g) => { g.open = open; });
+    layout();
+    schedule();
+  }
+
+  function debounce(fn, ms) {
+    let t = null;
+    return (...args) => {
+      clearTimeout(t);
+      t = setTimeout(() => fn(...args), ms);
+    };
+  }
+
+  function bindBucketPage() {
+    const root = document.querySelector(".o_recv_bucket[data-bucket]");
+    const viewport = document.getElementById("bucketViewport");
+    if (!root || !viewport) return;
+
+    state.bucket = root.dataset.bucket;
+    state.version = root.dataset.version || "";
+
     const search = document.getElementById("bucketSearch");
     const clear = document.getElementById("bucketClear");
 
-    const doFilter = () => {
-      const q = (search.value || "").trim().toLowerCase();
-      tbody.querySelectorAll("tr.o-bucket-row").forEach(tr => {
-        const hay = tr.dataset.q || tr.textContent.toLowerCase();
-        tr.classList.toggle("d-none", !!q && !hay.includes(q));
-      });
-      recalcTotal(tbody, ["bucketTotal", "bucketTotalFoot"]);
+    const reload = () => {
+      viewport.scrollTop = 0;
+      state.groups = [];
+      loadGroups();
     };
 
-    search.addEventListener("input", doFilter);
-    clear.addEventListener("click", () => { search.value = ""; doFilter(); });
+    search?.addEventListener("input", debounce(() => {
+      const q = (search.value || "").trim();
+      if (q === state.q) return;
+      state.q = q;
+      reload();
+    }, 250));
+    clear?.addEventListener("click", () => {
+      if (search) search.value = "";
+      if (state.q) {
+        state.q = "";
+        reload();
+      }
+    });
+    document.getElementById("bucketExpandAll")?.addEventListener("click", () => setAllOpen(true));
+    document.getElementById("bucketCollapseAll")?.addEventListener("click", () => setAllOpen(false));
+
+    viewport.addEventListener("scroll", schedule, { passive: true });
+    window.addEventListener("resize", schedule);
+
+    // Group header: collapse / expand its lines, keeping the header in place
+    viewport.addEventListener("click", (ev) => {
+      const tr = ev.target.closest("tr.o-bucket-group");
+      if (!tr) return;
+      const i = Number(tr.dataset.group);
+      const g = state.groups[i];
+      if (!g) return;
+      const before = state.lineStart[i] * ROW_HEIGHT - viewport.scrollTop;
+      g.open = !g.open;
+      layout();
+      viewport.scrollTop = state.lineStart[i] * ROW_HEIGHT - before;
+      schedule();
+    });
 
-    // initial normalize
-    recalcTotal(tbody, ["bucketTotal", "bucketTotalFoot"]);
+    loadGroups(); // initial
   }
 
-  document.addEventListener("DOMContentLoaded", bindBucketSearch);
+  document.addEventListener("DOMContentLoaded", bindBucketPage);
 })();
@@ -1,10 +1,18 @@
 /** @odoo-module **/
 
-function parseJSON(id) {
-  const el = document.getElementById(id);
-  if (!el) return null;
-  try { return JSON.parse(el.textContent || "null"); }
-  catch { console.warn(`[mssql_bridge] Bad JSON in #${id}`); return null; }
+// Charts data: GET so the browser revalidates it with If-None-Match (304 when unchanged)
+async function loadChartsData(root) {
+  const url = new URL("/recv/charts/data", window.location.origin);
+  if (root.dataset.refresh) url.searchParams.set("refresh", "1");
+  const r = await fetch(url, { credentials: "same-origin" });
+  if (!r.ok) throw new Error(`HTTP ${r.status}`);
+  return r.json();
+}
+
+// Compact payload: { columns: [...], values: [array per column] }
+function column(payload, name) {
+  const i = (payload?.columns || []).indexOf(name);
+  return i < 0 ? [] : payload.values[i] || [];
 }
 
 const n = (v) => Number(v || 0); // force numeric
@@ -20,11 +28,15 @@ const BUCKET_COLORS = [
   "#ef4444", // 90+ (dark RED)
 ];
 
-function renderCharts() {
+function renderCharts(data) {
   const Chart = window.Chart || globalThis.Chart;
-  const totals = parseJSON("recv_totals_json");
-  const top10Labels = (parseJSON("recv_top10_labels_json") || []).map((t) => shorten(t, 24));
-  const top10Values = (parseJSON("recv_top10_values_json") || []).map(n);
+  const totals = data.totals;
+  const codes = column(data.top10, "customer_code");
+  const top10Labels = column(data.top10, "customer_name").map((t, i) => shorten(t || codes[i] || "-", 24));
+  const top10Values = column(data.top10, "total").map(n);
+
+  const asOf = document.getElementById("recv_as_of");
+  if (asOf) asOf.textContent = data.as_of || "";
 
   if (!Chart || !totals) return;
 
@@ -125,6 +137,49 @@ function renderCharts() {
       },
     });
   }
+
+  // ---------------- TREND (stacked area per bucket, from snapshots) ----------------
+  const trendLabels = column(data.trend, "labels");
+  const trendEl = document.getElementById("recv_trend");
+  if (trendEl && trendLabels.length) {
+    const series = [["current", "Current"], ["d0_30", "1–30"], ["d31_60", "31–60"], ["d61_90", "61–90"], ["d90p", "90+"]];
+    new Chart(trendEl, {
+      type: "line",
+      data: {
+        labels: trendLabels,
+        datasets: series.map(([key, label], i) => ({
+          label,
+          data: column(data.trend, key).map(n),
+          borderColor: BUCKET_COLORS[i],
+          backgroundColor: BUCKET_COLORS[i],
+          pointRadius: 0,
+          fill: true,
+          stack: "aging",
+        })),
+      },
+      options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        interaction: { mode: "index", intersect: false },
+        scales: {
+          x: { ticks: { autoSkip: true, maxTicksLimit: 12, maxRotation: 0 }, grid: { display: false } },
+          y: { stacked: true, beginAtZero: true, ticks: moneyTicks, grid: axisGrid },
+        },
+        plugins: {
+          legend: { position: "bottom" },
+          tooltip: { callbacks: { label: (ctx) => ` ${ctx.dataset.label}: ${fmt(ctx.parsed.y)}` } },
+        },
+      },
+    });
+  }
 }
 
-document.addEventListener("DOMContentLoaded", renderCharts);
+document.addEventListener("DOMContentLoaded", async () => {
+  const root = document.querySelector(".o_mssql_recv_charts");
+  if (!root) return;
+  try {
+    renderCharts(await loadChartsData(root));
+  } catch (e) {
+    console.error("[mssql_bridge] charts data failed", e);
+  }
+});
@@ -27,6 +27,32 @@
     }).then((r) => r.json());
   }
 
+  // GET, so the browser revalidates its copy with If-None-Match (304 when unchanged)
+  function getJson(url, params) {
+    const u = new URL(url, window.location.origin);
+    Object.entries(params || {}).forEach(([k, v]) => {
+      if (v) u.searchParams.set(k, v);
+    });
+    return fetch(u, { credentials: "same-origin" }).then((r) => {
+      if (!r.ok) throw new Error(`HTTP ${r.status}`);
+      return r.json();
+    });
+  }
+
+  // Compact payload { columns: [...], values: [array per column] } -> row objects
+  function fromColumns(payload) {
+    const columns = payload.columns || [];
+    const values = payload.values || [];
+    const count = values.length ? values[0].length : 0;
+    const rows = new Array(count);
+    for (let i = 0; i < count; i++) {
+      const row = {};
+      for (let c = 0; c < columns.length; c++) row[columns[c]] = values[c][i];
+      rows[i] = row;
+    }
+    return rows;
+  }
+
   // --- renderer ---------------------------------------------------------------
   function renderInvoiceGridAligned(rows) {
     const list = rows || [];
@@ -112,6 +138,22 @@
     `;
   }
 
+  // --- invoice cache ------------------------------------------------------------
+  // Fetched invoice lists, per bucket + customer, so re-opening a row (or the
+  // same row after paging) never refetches.
+  const invoiceCache = new Map();
+  // Consolidated view: customer codes are only unique within a company
+  const cacheKey = (bucket, company, code, name) => `${bucket}|${company || ""}|${code || ""}|${code ? "" : name || ""}`;
+
+  function showInvoices(expandRow, rows, bucket) {
+    const body = expandRow.querySelector(".o-recv-expand__body");
+    if (!body) return;
+    body.innerHTML = renderInvoiceGridAligned(rows);
+    expandRow.dataset.loaded = "1";
+    expandRow.dataset.bucket = bucket;
+    expandRow.classList.add("open");
+  }
+
   // --- handlers ---------------------------------------------------------------
   function bindExpand() {
     const table = document.getElementById("recv_table");
@@ -129,6 +171,7 @@
 
       const code = row.dataset.customer_code || null;
       const name = row.dataset.customer_name || null;
+      const company = row.dataset.company || null;
       const bucket = (window.__recvBucket || "").toLowerCase();
 
       if (expandRow.dataset.loaded === "1" && expandRow.dataset.bucket === bucket) {
@@ -136,15 +179,20 @@
         return;
       }
 
+      const key = cacheKey(bucket, company, code, name);
+      if (invoiceCache.has(key)) {
+        showInvoices(expandRow, invoiceCache.get(key), bucket);
+        return;
+      }
+
       body.innerHTML = "<div class='o-recv-expand__loading'>Loading…</div>";
 
       try {
-        const res = await postJson("/recv/invoices", { customer_code: code, customer_name: name, bucket });
-        const rows = res.result?.rows || res.rows || [];
-        body.innerHTML = renderInvoiceGridAligned(rows);
-        expandRow.dataset.loaded = "1";
-        expandRow.dataset.bucket = bucket;
-        expandRow.classList.add("open");
+        const res = await getJson("/recv/invoices/data", { customer_code: code, customer_name: name, company, bucket });
+        if (res.error) throw new Error(res.error);
+        const rows = fromColumns(res);
+        invoiceCache.set(key, rows);
+        showInvoices(expandRow, rows, bucket);
       } catch (e) {
         console.error("[mssql_bridge] invoices fetch failed", e);
         body.innerHTML = "<div class='o-recv-expand__error'>Failed to load invoices.</div>";
@@ -152,6 +200,64 @@
     });
   }
 
+  // "Expand all visible": one batch request for every row not cached yet
+  function bindExpandAll() {
+    const btn = document.getElementById("recvExpandAll");
+    const table = document.getElementById("recv_table");
+    if (!btn || !table) return;
+
+    btn.addEventListener("click", async () => {
+      const bucket = (window.__recvBucket || "").toLowerCase();
+      const pairs = [];
+      table.querySelectorAll("tbody tr.o-recv-row").forEach((row) => {
+        const expandRow = row.nextElementSibling;
+        if (row.style.display === "none" || !expandRow || !expandRow.classList.contains("o-recv-expand")) return;
+        pairs.push({ row, expandRow, code: row.dataset.customer_code || "", company: row.dataset.company || "" });
+      });
+      if (!pairs.length) return;
+
+      // Second click collapses everything that is open
+      if (pairs.every((p) => p.expandRow.classList.contains("open"))) {
+        pairs.forEach((p) => p.expandRow.classList.remove("open"));
+        return;
+      }
+
+      const todo = pairs.filter((p) => p.code && !invoiceCache.has(cacheKey(bucket, p.company, p.code)));
+      const missing = [...new Set(todo.map((p) => p.code))];
+      const failed = new Set();
+      btn.disabled = true;
+      try {
+        if (missing.length) {
+          const res = await postJson("/recv/invoices/batch", { customer_codes: missing, bucket });
+          const data = res.result || res;
+          if (data.error) throw new Error(data.error);
+          const customers = data.customers || {};
+          // Companies that did not answer: their rows are not cached as "no invoices"
+          (data.missing || []).forEach((m) => failed.add(m.company));
+          todo.forEach((p) => {
+            if (failed.has(p.company)) return;
+            const rows = (customers[p.code] || []).filter((r) => (r.company || "") === p.company);
+            invoiceCache.set(cacheKey(bucket, p.company, p.code), rows);
+          });
+        }
+        pairs.forEach((p) => {
+          const key = cacheKey(bucket, p.company, p.code);
+          if (invoiceCache.has(key)) {
+            showInvoices(p.expandRow, invoiceCache.get(key), bucket);
+          } else if (failed.has(p.company)) {
+            const body = p.expandRow.querySelector(".o-recv-expand__body");
+            if (body) body.innerHTML = "<div class='o-recv-expand__error'>This company did not answer.</div>";
+            p.expandRow.classList.add("open");
+          }
+        });
+      } catch (e) {
+        console.error("[mssql_bridge] batch invoices fetch failed", e);
+      } finally {
+        btn.disabled = false;
+      }
+    });
+  }
+
   function bindCards() {
     document.querySelectorAll(".o_example_cards .o_card[data-bucket]").forEach((el) => {
       el.addEventListener("click", () => {
@@ -170,5 +276,6 @@
     if (!document.querySelector(".o_mssql_recv")) return;
     bindCards();
     bindExpand();
+    bindExpandAll();
   });
 })();
@@ -1,81 +1,362 @@
 /** @odoo-module **/
 
 (function () {
-  function num(v) { return Number(v || 0); }
-
-  function matchesBucket(tr, bucket) {
-    if (!bucket) return true;
-    const c = num(tr.dataset.current);
-    const a = num(tr.dataset.d0_30);
-    const b = num(tr.dataset.d31_60);
-    const d = num(tr.dataset.d61_90);
-    const e = num(tr.dataset.d90p);
-
-    if (bucket === 'hasneg') {
-      return [c, a, b, d, e].some(x => x < 0);
+  'use strict';
+
+  // Rows come from /recv/aging/page: the server filters, sorts and slices its
+  // pre-sorted snapshot index, so the browser only ever holds one page.
+  // The typeahead asks /recv/search, ranked on the snapshot's search index.
+  // With an as-of date or other bucket boundaries, the same endpoint pages
+  // through amounts re-bucketed from the server's open item store instead.
+
+  const fmt3 = (n) =>
+    Number(n || 0).toLocaleString(undefined, { minimumFractionDigits: 3, maximumFractionDigits: 3 });
+
+  const escapeHtml = (s) =>
+    String(s == null ? '' : s).replace(/[&<>"']/g, (m) => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[m]));
+
+  const state = {
+    page: 1,
+    pageSize: 50,
+    sort: 'customer_name',
+    order: 'asc',
+    search: '',
+    hideZero: false,
+    bucket: '',
+    asOf: '',       // yyyy-mm-dd, '' = the live snapshot
+    bounds: '',     // e.g. '15,45,90', '' = the standard 30,60,90
+    count: 0,
+    seq: 0,
+  };
+
+  const DEFAULT_BOUNDS = [30, 60, 90];
+
+  // '30,60,90' -> [30, 60, 90]; null when not three increasing positive days
+  function parseBounds(text) {
+    const parts = String(text || '').split(/[,;\s]+/).filter(Boolean);
+    if (!parts.length) return DEFAULT_BOUNDS;
+    const days = parts.map(Number);
+    if (days.length !== DEFAULT_BOUNDS.length || !days.every((d) => Number.isInteger(d) && d > 0)) return null;
+    return days.every((d, i) => i === 0 || d > days[i - 1]) ? days : null;
+  }
+
+  function bucketLabels(days) {
+    return {
+      current: 'Current',
+      d0_30: `1–${days[0]}`,
+      d31_60: `${days[0] + 1}–${days[1]}`,
+      d61_90: `${days[1] + 1}–${days[2]}`,
+      d90p: `${days[2]}+`,
+    };
+  }
+
+  // Cards and column headers follow the amounts shown in the table
+  function renderAsOf(data) {
+    const root = document.querySelector('.o_mssql_recv');
+    if (root) {
+      if (state.asOf || state.bounds) root.dataset.asOf = data.as_of || '';
+      else delete root.dataset.asOf;
     }
-    if (bucket === 'current') return c !== 0;
-    if (bucket === 'd0_30') return a !== 0;
-    if (bucket === 'd31_60') return b !== 0;
-    if (bucket === 'd61_90') return d !== 0;
-    if (bucket === 'd90p')   return e !== 0;
-    return true;
+    // The Refresh button rebuilds what the table shows (recv_dashboard_refresh.js)
+    const bar = document.querySelector('.o_recv__refreshbar[data-recv-kind]');
+    if (bar) bar.dataset.recvKind = state.asOf || state.bounds ? 'store' : 'aging';
+    const totals = data.totals || {};
+    document.querySelectorAll('[data-recv-total]').forEach((el) => {
+      el.textContent = fmt3(totals[el.dataset.recvTotal]);
+    });
+    const labels = bucketLabels(data.boundaries || DEFAULT_BOUNDS);
+    document.querySelectorAll('.o_card[data-recv-bucket] .o_card_title').forEach((el) => {
+      const key = el.parentElement.dataset.recvBucket;
+      el.textContent = key === 'current' ? labels[key] : `${labels[key]} Days`;
+    });
+    document.querySelectorAll('#recv_table th.o-recv-sort').forEach((th) => {
+      if (labels[th.dataset.sort]) th.textContent = labels[th.dataset.sort];
+    });
   }
 
-  function shouldKeep(tr, q, bucket, zeroPolicy) {
-    const name = (tr.dataset.customer_name || '').toLowerCase();
-    const total = num(tr.dataset.total);
+  function rpc(url, params) {
+    return fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      credentials: 'same-origin',
+      body: JSON.stringify({ jsonrpc: '2.0', method: 'call', params: params || {} }),
+    }).then((r) => r.json());
+  }
 
-    if (zeroPolicy === 'hide_zero' && total === 0) return false;
-    if (q && q.length >= 2 && !name.includes(q)) return false;
-    if (!matchesBucket(tr, bucket)) return false;
+  function renderRows(rows, offset) {
+    if (!rows.length) {
+      return "<tr><td colspan='8' class='text-muted'>No data.</td></tr>";
+    }
+    return rows.map((r, i) => `
+      <tr class="o-recv-row"
+          data-customer_code="${escapeHtml(r.customer_code)}"
+          data-customer_name="${escapeHtml(r.customer_name)}"
+          data-company="${escapeHtml(r.company)}">
+        <td class="num text-center">${offset + i + 1}</td>
+        <td>${r.company ? `<span class="o-recv-company">${escapeHtml(r.company)}</span>` : ''}${escapeHtml(r.customer_name || r.customer_code)}</td>
+        <td class="num col-current">${fmt3(r.current)}</td>
+        <td class="num col-d0_30">${fmt3(r.d0_30)}</td>
+        <td class="num col-d31_60">${fmt3(r.d31_60)}</td>
+        <td class="num col-d61_90">${fmt3(r.d61_90)}</td>
+        <td class="num col-d90p">${fmt3(r.d90p)}</td>
+        <td class="num">${fmt3(r.total)}</td>
+      </tr>
+      <tr class="o-recv-expand">
+        <td colspan="8">
+          <div class="o-recv-expand__body"></div>
+        </td>
+      </tr>`).join('');
+  }
+
+  function renderPager() {
+    const info = document.getElementById('recvPageInfo');
+    const prev = document.getElementById('recvPrev');
+    const next = document.getElementById('recvNext');
+    const pages = Math.max(1, Math.ceil(state.count / state.pageSize));
+    const first = state.count ? (state.page - 1) * state.pageSize + 1 : 0;
+    const last = Math.min(state.count, state.page * state.pageSize);
+    const asOf = state.asOf ? ` · as of ${state.asOf}` : '';
+    if (info) info.textContent = `${first}–${last} of ${state.count} customers (page ${state.page} / ${pages})${asOf}`;
+    if (prev) prev.disabled = state.page <= 1;
+    if (next) next.disabled = state.page >= pages;
 
-    return true;
+    document.querySelectorAll('#recv_table th.o-recv-sort').forEach((th) => {
+      th.classList.toggle('asc', th.dataset.sort === state.sort && state.order === 'asc');
+      th.classList.toggle('desc', th.dataset.sort === state.sort && state.order === 'desc');
+    });
   }
 
-  function applyFilter() {
-    const q       = (document.getElementById('recvSearch')?.value || '').trim().toLowerCase();
-    const bucket  = document.getElementById('recvBucket')?.value || '';
-    const zeroPol = document.getElementById('recvZero')?.value || 'hide_zero';
+  async function loadPage() {
+    const tbody = document.querySelector('#recv_table tbody');
+    if (!tbody) return;
+    const seq = ++state.seq;
+    try {
+      const res = await rpc('/recv/aging/page', {
+        page: state.page,
+        page_size: state.pageSize,
+        sort: state.sort,
+        order: state.order,
+        search: state.search.length >= 2 ? state.search : '',
+        hide_zero: state.hideZero,
+        bucket: state.bucket || null,
+        as_of: state.asOf || null,
+        boundaries: state.bounds || null,
+      });
+      if (seq !== state.seq) return; // a newer request superseded this one
+      const data = res.result || {};
+      if (res.error || data.error) throw new Error(data.error || (res.error && res.error.message));
+      state.count = data.count || 0;
+      tbody.innerHTML = renderRows(data.rows || [], (state.page - 1) * state.pageSize);
+      renderAsOf(data);
+      renderPager();
+    } catch (e) {
+      if (seq !== state.seq) return;
+      console.error('[mssql_bridge] aging page fetch failed', e);
+      tbody.innerHTML = "<tr><td colspan='8' class='text-danger'>Failed to load customers.</td></tr>";
+    }
+  }
 
-    const rows = document.querySelectorAll('#recv_table tbody tr.o-recv-row');
-    let shown = 0;
+  // --- typeahead ---------------------------------------------------------------
+  const suggest = { rows: [], active: -1, seq: 0 };
 
-    rows.forEach((tr) => {
-      const keep = shouldKeep(tr, q, bucket, zeroPol);
-      tr.style.display = keep ? '' : 'none';
+  const BUCKET_LABELS = [
+    ['current', 'Current'], ['d0_30', '1–30'], ['d31_60', '31–60'], ['d61_90', '61–90'], ['d90p', '90+'],
+  ];
 
-      // hide/show expander partner row too
-      const exp = tr.nextElementSibling;
-      if (exp && exp.classList.contains('o-recv-expand')) {
-        if (!keep) exp.style.display = 'none';
-        else if (!exp.classList.contains('open')) exp.style.display = 'none';
-      }
-      if (keep) shown += 1;
+  function renderSuggest(box, rows, count) {
+    suggest.rows = rows;
+    suggest.active = -1;
+    if (!rows.length) {
+      box.innerHTML = "<div class='o-recv-suggest__empty'>No matching customer.</div>";
+    } else {
+      box.innerHTML = rows.map((r, i) => `
+        <div class="o-recv-suggest__item" role="option" id="recvSuggest-${i}" data-index="${i}">
+          <div class="o-recv-suggest__head">
+            ${r.company ? `<span class="o-recv-company">${escapeHtml(r.company)}</span>` : ''}
+            <span class="o-recv-suggest__name">${escapeHtml(r.customer_name || r.customer_code)}</span>
+            <span class="o-recv-suggest__code">${escapeHtml(r.customer_code)}</span>
+            <span class="o-recv-suggest__total">${fmt3(r.total)}</span>
+          </div>
+          <div class="o-recv-suggest__buckets">
+            ${BUCKET_LABELS.filter(([k]) => Math.abs(r[k] || 0) >= 0.0005)
+              .map(([k, label]) => `<span>${label} <b>${fmt3(r[k])}</b></span>`).join('')}
+          </div>
+        </div>`).join('')
+        + (count > rows.length ? `<div class="o-recv-suggest__more">${count - rows.length} more…</div>` : '');
+    }
+    box.hidden = false;
+  }
+
+  function closeSuggest(box) {
+    box.hidden = true;
+    suggest.rows = [];
+    suggest.active = -1;
+    suggest.seq++; // drop answers still in flight
+  }
+
+  function highlight(box, input, index) {
+    const items = box.querySelectorAll('.o-recv-suggest__item');
+    if (!items.length) return;
+    suggest.active = (index + items.length) % items.length;
+    items.forEach((el, i) => el.classList.toggle('active', i === suggest.active));
+    items[suggest.active].scrollIntoView({ block: 'nearest' });
+    input.setAttribute('aria-activedescendant', items[suggest.active].id);
+  }
+
+  async function loadSuggest(box, query) {
+    const seq = ++suggest.seq;
+    try {
+      const u = new URL('/recv/search', window.location.origin);
+      u.searchParams.set('q', query);
+      u.searchParams.set('limit', '10');
+      const r = await fetch(u, { credentials: 'same-origin' });
+      if (!r.ok) throw new Error(`HTTP ${r.status}`);
+      const data = await r.json();
+      if (seq !== suggest.seq) return;
+      if (data.error) throw new Error(data.error);
+      renderSuggest(box, data.rows || [], data.count || 0);
+    } catch (e) {
+      if (seq !== suggest.seq) return;
+      console.error('[mssql_bridge] customer search failed', e);
+      closeSuggest(box);
+    }
+  }
+
+  // Show the picked customer alone in the table, opened on its invoices
+  async function jumpTo(customer) {
+    const s = document.getElementById('recvSearch');
+    const b = document.getElementById('recvBucket');
+    const z = document.getElementById('recvZero');
+    if (s) s.value = customer.customer_code;
+    if (b) b.value = '';
+    if (z) z.value = 'show_zero';
+    Object.assign(state, { search: customer.customer_code, bucket: '', hideZero: false, page: 1 });
+    await loadPage();
+    const row = Array.from(document.querySelectorAll('#recv_table tr.o-recv-row')).find((tr) =>
+      tr.dataset.customer_code === customer.customer_code && (tr.dataset.company || '') === (customer.company || ''));
+    if (row) {
+      row.scrollIntoView({ block: 'center' });
+      row.click(); // recv_dashboard_expand.js loads the invoices
+    }
+  }
+
+  function bindTypeahead(input) {
+    const box = document.getElementById('recvSuggest');
+    if (!input || !box) return;
+
+    const pick = (index) => {
+      const customer = suggest.rows[index];
+      if (!customer) return;
+      closeSuggest(box);
+      jumpTo(customer);
+    };
+
+    input.addEventListener('input', debounce(() => {
+      const query = input.value.trim();
+      if (query.length < 2) closeSuggest(box);
+      else loadSuggest(box, query);
+    }, 120));
+
+    input.addEventListener('keydown', (ev) => {
+      if (box.hidden) return;
+      if (ev.key === 'ArrowDown') { ev.preventDefault(); highlight(box, input, suggest.active + 1); }
+      else if (ev.key === 'ArrowUp') { ev.preventDefault(); highlight(box, input, suggest.active - 1); }
+      else if (ev.key === 'Enter' && suggest.active >= 0) { ev.preventDefault(); pick(suggest.active); }
+      else if (ev.key === 'Escape') closeSuggest(box);
     });
 
-    // (optional) could show a small “n results” chip
-    // console.log('visible rows:', shown);
+    // mousedown: runs before the input's blur closes the list
+    box.addEventListener('mousedown', (ev) => {
+      const item = ev.target.closest('.o-recv-suggest__item');
+      if (!item) return;
+      ev.preventDefault();
+      pick(Number(item.dataset.index));
+    });
+    input.addEventListener('blur', () => closeSuggest(box));
+  }
+
+  function debounce(fn, ms) {
+    let t = null;
+    return (...args) => {
+      clearTimeout(t);
+      t = setTimeout(() => fn(...args), ms);
+    };
   }
 
   function bindToolbar() {
+    if (!document.getElementById('recv_table')) return;
+
     const s = document.getElementById('recvSearch');
     const b = document.getElementById('recvBucket');
     const z = document.getElementById('recvZero');
     const c = document.getElementById('recvClear');
+    const size = document.getElementById('recvPageSize');
+
+    const reload = () => { state.page = 1; loadPage(); };
 
-    if (s) s.addEventListener('input', applyFilter);
-    if (b) b.addEventListener('change', applyFilter);
-    if (z) z.addEventListener('change', applyFilter);
+    if (s) s.addEventListener('input', debounce(() => { state.search = s.value.trim(); reload(); }, 250));
+    bindTypeahead(s);
+    if (b) b.addEventListener('change', () => { state.bucket = b.value; reload(); });
+    if (z) {
+      state.hideZero = z.value === 'hide_zero';
+      z.addEventListener('change', () => { state.hideZero = z.value === 'hide_zero'; reload(); });
+    }
+    if (size) {
+      state.pageSize = Number(size.value) || state.pageSize;
+      size.addEventListener('change', () => { state.pageSize = Number(size.value) || 50; reload(); });
+    }
     if (c) c.addEventListener('click', () => {
       if (s) s.value = '';
       if (b) b.value = '';
-      if (z) z.value = 'hide_zero';
-      applyFilter();
+      if (z) z.value = 'show_zero';
+      Object.assign(state, { search: '', bucket: '', hideZero: false });
+      reload();
       s?.focus();
     });
 
-    applyFilter(); // initial
+    const asOf = document.getElementById('recvAsOf');
+    const bounds = document.getElementById('recvBounds');
+    asOf?.addEventListener('change', () => { state.asOf = asOf.value || ''; reload(); });
+    bounds?.addEventListener('change', () => {
+      const days = parseBounds(bounds.value);
+      bounds.classList.toggle('is-invalid', !days);
+      if (!days) return;
+      const text = days.join(',') === DEFAULT_BOUNDS.join(',') ? '' : days.join(',');
+      if (text === state.bounds) return;
+      state.bounds = text;
+      reload();
+    });
+    document.addEventListener('recv:refreshed', (ev) => {
+      if (ev.detail?.kind === 'store') loadPage();
+    });
+    document.getElementById('recvAsOfReset')?.addEventListener('click', () => {
+      if (asOf) asOf.value = '';
+      if (bounds) {
+        bounds.value = '';
+        bounds.classList.remove('is-invalid');
+      }
+      if (!state.asOf && !state.bounds) return;
+      Object.assign(state, { asOf: '', bounds: '' });
+      reload();
+    });
+
+    document.getElementById('recvPrev')?.addEventListener('click', () => {
+      if (state.page > 1) { state.page -= 1; loadPage(); }
+    });
+    document.getElementById('recvNext')?.addEventListener('click', () => {
+      if (state.page * state.pageSize < state.count) { state.page += 1; loadPage(); }
+    });
+
+    document.querySelectorAll('#recv_table th.o-recv-sort').forEach((th) => {
+      th.addEventListener('click', () => {
+        const col = th.dataset.sort;
+        state.order = state.sort === col && state.order === 'asc' ? 'desc' : 'asc';
+        state.sort = col;
+        reload();
+      });
+    });
+
+    loadPage(); // initial
   }
 
   document.addEventListener('DOMContentLoaded', bindToolbar);
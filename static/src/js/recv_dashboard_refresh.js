@@ -3,81 +3,111 @@
 (function () {
   'use strict';
 
+  const POLL_MS = 1500;
+
   document.addEventListener('DOMContentLoaded', () => {
-    setupRefreshButton();
-    setupZeroTotalToggle();  // default = SHOW
+    dropRefreshFlag();
+    const bar = document.querySelector('.o_recv__refreshbar[data-recv-kind]');
+    if (!bar) return;
+    setupRefreshButton(bar);
+    // The page was rendered from an expired snapshot: the server already
+    // started a background refresh, offer a reload once it is done.
+    if (bar.dataset.stale) watch(bar.dataset.recvKind, false);
   });
 
-  // ---------------------------
-  // Refresh button (unchanged)
-  // ---------------------------
-  function setupRefreshButton() {
-    const btn = document.getElementById('recv_refresh');
-    const status = document.getElementById('recv_refresh_status');
-    if (!btn) return;
+  function rpc(url, params) {
+    return fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      credentials: 'same-origin',
+      body: JSON.stringify({ jsonrpc: '2.0', method: 'call', params: params || {} }),
+    }).then((r) => r.json());
+  }
 
-    btn.addEventListener('click', () => {
-      btn.disabled = true;
-      const started = new Date().toLocaleTimeString();
-      if (status) status.textContent = `Refreshing… (${started})`;
-      const url = new URL(window.location.href);
-      url.searchParams.set('ts', Date.now().toString());
-      window.location.replace(url.toString());
-    });
+  function setStatus(html) {
+    const status = document.getElementById('recv_refresh_status');
+    if (status) status.innerHTML = html;
   }
 
   // ---------------------------------------------------
-  // Hide/Show zero-total rows (default = SHOW)
+  // Refresh button: rebuild in the background, poll for progress
   // ---------------------------------------------------
-  function setupZeroTotalToggle() {
-    const sel = document.getElementById('recv_zero_toggle');
-    // If the control isn’t on this page, nothing to do
-    if (!sel) return;
-
-    // Default to SHOW if there is no saved preference
-    const saved = localStorage.getItem('recv_hide_zero'); // 'hide' | 'show' | null
-    const startValue = saved === 'hide' ? 'hide' : 'show';
-    sel.value = startValue;
-
-    // Apply once on load
-    applyHideZero(startValue === 'hide');
+  // The kind is read on click: the dashboard switches it to 'store' while an
+  // as-of date or other boundaries are shown (recv_dashboard_filter.js)
+  function setupRefreshButton(bar) {
+    const btn = document.getElementById('recv_refresh');
+    if (!btn) return;
 
-    // Save preference and re-apply when changed
-    sel.addEventListener('change', () => {
-      const hide = sel.value === 'hide';
-      localStorage.setItem('recv_hide_zero', hide ? 'hide' : 'show');
-      applyHideZero(hide);
+    btn.addEventListener('click', async () => {
+      const kind = bar.dataset.recvKind;
+      btn.disabled = true;
+      setStatus('Refreshing…');
+      try {
+        const data = await rpc('/recv/refresh/start', { kind });
+        if (data.error || (data.result && data.result.error)) {
+          throw new Error((data.result && data.result.error) || data.error.message || 'refresh failed');
+        }
+        watch(kind, true);
+      } catch (e) {
+        console.error('[mssql_bridge] refresh start failed', e);
+        setStatus("<span class='text-danger'>Refresh failed to start.</span>");
+        btn.disabled = false;
+      }
     });
   }
 
-  // Hide rows with total==0.000; show otherwise.
-  // Also hide matching expander row.
-  function applyHideZero(hide) {
-    const rows = document.querySelectorAll('#recv_table tbody tr.o-recv-row');
-    rows.forEach((tr) => {
-      const total = readRowTotal(tr);
-      const shouldHide = hide && Math.abs(total) < 1e-9;
-      tr.style.display = shouldHide ? 'none' : '';
-
-      // Hide the expander row just below, if present
-      const expander = tr.nextElementSibling;
-      if (expander && expander.classList.contains('o-recv-expand')) {
-        expander.style.display = shouldHide ? 'none' : (expander.classList.contains('open') ? 'table-row' : 'none');
+  // reloadWhenDone: the user asked for it, so reload; otherwise just offer it
+  function watch(kind, reloadWhenDone) {
+    const btn = document.getElementById('recv_refresh');
+    const tick = async () => {
+      let st;
+      try {
+        const data = await rpc('/recv/refresh/status', { kind });
+        st = data.result || {};
+      } catch (e) {
+        console.error('[mssql_bridge] refresh status failed', e);
+        setTimeout(tick, POLL_MS * 2);
+        return;
       }
-    });
+      if (st.state === 'running') {
+        setStatus(`Refreshing… ${Math.round(st.elapsed || 0)}s`);
+        setTimeout(tick, POLL_MS);
+      } else if (st.state === 'done') {
+        if (reloadWhenDone && kind === 'store') {
+          // A page reload would drop the as-of view: let the table reload itself
+          setStatus('');
+          if (btn) btn.disabled = false;
+          document.dispatchEvent(new CustomEvent('recv:refreshed', { detail: { kind } }));
+        } else if (reloadWhenDone) {
+          window.location.reload();
+        } else {
+          setStatus("New data available — <a href='#' id='recv_reload'>reload</a>");
+          const link = document.getElementById('recv_reload');
+          if (link) link.addEventListener('click', (ev) => { ev.preventDefault(); window.location.reload(); });
+        }
+      } else if (st.state === 'failed') {
+        setStatus(`<span class='text-danger'>Refresh failed: ${escapeHtml(st.error || '')}</span>`);
+        if (btn) btn.disabled = false;
+      } else {
+        setStatus('');
+        if (btn) btn.disabled = false;
+      }
+    };
+    tick();
+  }
+
+  function escapeHtml(s) {
+    return String(s ?? '').replace(/[&<>"']/g, (c) => ({
+      '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;',
+    }[c]));
   }
 
-  // Prefer data-total, else parse the last numeric cell.
-  function readRowTotal(tr) {
-    if (tr.dataset && tr.dataset.total != null) {
-      return Number(tr.dataset.total || 0);
-    }
-    // Fallback: read last cell’s text
-    const last = tr.querySelector('td:last-child');
-    if (!last) return 0;
-    // Remove commas and spaces, then Number()
-    const raw = (last.textContent || '').replace(/[, ]/g, '');
-    const v = Number(raw);
-    return isNaN(v) ? 0 : v;
+  // A plain browser reload must hit the cache again, so forget ?refresh=1
+  function dropRefreshFlag() {
+    const url = new URL(window.location.href);
+    if (!url.searchParams.has('refresh')) return;
+    url.searchParams.delete('refresh');
+    url.searchParams.delete('ts');
+    window.history.replaceState(null, '', url.toString());
   }
 })();
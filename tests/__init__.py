@@ -0,0 +1,5 @@
+from . import test_bucket_page
+from . import test_export_stream
+from . import test_query_guard
+from . import test_aging_mirror
+from . import test_aging_store
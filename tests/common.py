@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""The bridge talking to benchmarks/fake_sage.py instead of a SQL Server.
+
+The benchmarks/ scripts are importable from here (fake_sage, bench_bridge,
+bench_aging_sql): the tests reuse their fixtures.
+
+``FakeSageCase`` swaps pyodbc for a fake server answering from a synthetic
+Sage 300 ledger (``self.ledger``); ``self.fake.kinds`` counts the statements
+the bridge sent, by kind (see bench_bridge.make_classifier).
+"""
+import os
+import sys
+from collections import Counter
+from decimal import Decimal
+
+from odoo import fields
+from odoo.tests import TransactionCase
+
+from odoo.addons.mssql_bridge.models import mssql_pool, query_guard
+from odoo.addons.mssql_bridge.models.aging_cache import snapshot_cache
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+if BENCHMARKS not in sys.path:
+    sys.path.insert(0, BENCHMARKS)
+
+import bench_aging_sql  # noqa: E402
+import bench_bridge  # noqa: E402
+import fake_sage  # noqa: E402
+
+
+class CountingPyodbc(fake_sage.FakePyodbc):
+    """FakePyodbc recording the kind of every statement it runs (health checks excluded)."""
+
+    def __init__(self, ledger, classify):
+        super().__init__(ledger, classify)
+        self.kinds = Counter()
+
+    def run(self, sql, params):
+        if sql.strip() != "SELECT 1":
+            self.kinds[self.classify(sql, params)[0]] += 1
+        return super().run(sql, params)
+
+
+class FakeSageCase(TransactionCase):
+    items = 2000
+    seed = 7
+
+    def setUp(self):
+        super().setUp()
+        self.Bridge = self.env["mssql.bridge"].sudo()
+        self.today = fields.Date.context_today(self.Bridge)
+        self.ledger = fake_sage.Ledger(self.items, today=self.today, seed=self.seed)
+        self.fake = CountingPyodbc(self.ledger, bench_bridge.make_classifier())
+
+        bench_bridge._reset_pools()
+        self.addCleanup(bench_bridge._reset_pools)
+        self.patch(mssql_pool, "pyodbc", self.fake)
+        snapshot_cache.invalidate()
+        self.addCleanup(snapshot_cache.invalidate)
+        self.addCleanup(query_guard._breakers.clear)
+
+        ICP = self.env["ir.config_parameter"].sudo()
+        for key, value in bench_bridge.BENCH_PARAMS.items():
+            ICP.set_param(key, value)
+
+    def changed(self):
+        """Forget what the fake server computed: call after editing ``self.ledger``."""
+        self.ledger._open = None
+        self.fake._results.clear()
+
+    def add_customer(self, code, name=None):
+        self.ledger.names[code] = (name or "Customer %s" % code).ljust(fake_sage.NAMECUST_WIDTH)
+        self.ledger.customer_audt[code] = (Decimal(fake_sage._ymd(self.today)), Decimal(0))
+
+    def add_doc(self, code, idinvc, due, amount, paid=0, audt=None):
+        """Append an AROBL document; ``due`` is a date or a yyyymmdd number, ``audt`` (date, time)."""
+        if hasattr(due, "year"):
+            due = fake_sage._ymd(due)
+        audtdate, audttime = audt or (fake_sage._ymd(self.today), 0)
+        n = len(self.ledger.docs)
+        doc = (
+            code.ljust(fake_sage.IDCUST_WIDTH), idinvc.ljust(fake_sage.IDINVC_WIDTH), 1,
+            Decimal(due), Decimal(str(amount)), paid,
+            "ORD%08d" % n, "PO%08d" % n, "Test %s" % idinvc, Decimal(audtdate), Decimal(audttime),
+        )
+        self.ledger.docs.append(doc)
+        self.changed()
+        return doc
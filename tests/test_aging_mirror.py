@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from datetime import timedelta
+from decimal import Decimal
+
+from odoo.tests import BaseCase
+
+from odoo.addons.mssql_bridge.models import aging_incremental, aging_mirror
+
+from .common import FakeSageCase, fake_sage
+
+
+class TestAgingMirror(FakeSageCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Sync = self.env["mssql.mirror.sync"].sudo()
+        self.company = self.Bridge._companies()[0]["code"]
+        self.assertTrue(self.Sync.sync(full=True)[self.company]["full"])
+        self.mark = self.Sync._state(self.company)["items_mark"]
+        # AUDTDATE of a change made after the full load
+        self.later = fake_sage._ymd(self.today + timedelta(days=1))
+        # Rows stamped at the watermarks are read again by every run
+        self.idle = self.sync()["changed"]
+        self.assertGreater(self.idle, 0)
+
+    def sync(self):
+        result = self.Sync.sync()[self.company]
+        self.assertFalse(result["full"])
+        return result
+
+    def edit(self, position, audt, amount=None, due=None, paid=None):
+        """Change the ledger document at ``position`` and stamp it ``audt`` (AUDTDATE, AUDTTIME)."""
+        doc = list(self.ledger.docs[position])
+        if amount is not None:
+            doc[4] = Decimal(amount)
+        if due is not None:
+            doc[3] = Decimal(fake_sage._ymd(due))
+        if paid is not None:
+            doc[5] = paid
+        doc[9], doc[10] = Decimal(audt[0]), Decimal(audt[1])
+        self.ledger.docs[position] = tuple(doc)
+        self.changed()
+        return self.ledger.docs[position]
+
+    def open_position(self, skip=()):
+        """Position of an open, positive invoice of a customer with several documents."""
+        sizes = self.ledger.customer_sizes()
+        for position, doc in enumerate(self.ledger.docs):
+            if (not doc[5] and doc[4] > 0 and doc[1][0] == "I" and position not in skip
+                    and doc[0].strip() in sizes[:10]):
+                return position
+        self.fail("no open invoice in the ledger")
+
+    def mirrored(self, doc):
+        """``[(amount, datedue)]`` of ``doc``'s mirror row (empty when not mirrored)."""
+        self.env.cr.execute("""
+            SELECT amtduehc, datedue FROM mssql_mirror_item
+            WHERE company = %s AND idcust = %s AND idinvc = %s AND cntpaym = %s
+        """, [self.company, doc[0].strip(), doc[1], doc[2]])
+        return [(Decimal(amount).quantize(fake_sage.MILLI), datedue) for amount, datedue in self.env.cr.fetchall()]
+
+    def assertConsistent(self):
+        check = self.Bridge.check_mirror_consistency(sync=False)
+        self.assertTrue(check["ok"], check["mismatched"])
+        self.assertGreater(check["customers"], 0)
+        items = self.Sync._state(self.company)["items"]
+        self.env.cr.execute("SELECT count(*) FROM mssql_mirror_item WHERE company = %s", [self.company])
+        self.assertEqual(self.env.cr.fetchone()[0], items)
+
+    def test_full_load(self):
+        self.assertEqual(self.mark, max((int(d[9]), int(d[10])) for d in self.ledger.docs))
+        self.assertEqual(self.Sync._state(self.company)["items"], len(self.ledger.open_docs()))
+        self.assertConsistent()
+
+    def test_watermark_ties(self):
+        # Written in the same AUDTTIME tick as the last document of the full load
+        position = self.open_position()
+        edited = self.edit(position, self.mark, amount="1234.567")
+        added = self.add_doc(edited[0].strip(), "I999000001", self.today - timedelta(days=45), "88.800",
+                             audt=self.mark)
+        result = self.sync()
+        self.assertEqual(result["changed"], self.idle + 2)
+        self.assertEqual(self.mirrored(edited), [(Decimal("1234.567"), int(edited[3]))])
+        self.assertEqual(self.mirrored(added), [(Decimal("88.800"), int(added[3]))])
+        self.assertConsistent()
+        # Only the tied documents come back until something newer is written
+        self.assertEqual(self.sync()["changed"], result["changed"])
+
+    def test_updated_rows(self):
+        position = self.open_position()
+        due = self.today - timedelta(days=75)
+        edited = self.edit(position, (self.later, 5), amount="42.420", due=due)
+        self.assertEqual(self.sync()["changed"], self.idle + 1)
+        self.assertEqual(self.mirrored(edited), [(Decimal("42.420"), fake_sage._ymd(due))])
+        self.assertEqual(self.Sync._state(self.company)["items_mark"], (self.later, 5))
+        self.assertConsistent()
+
+    def test_closed_items(self):
+        paid_position = self.open_position()
+        paid = self.edit(paid_position, (self.later, 1), paid=1)
+        zeroed = self.edit(self.open_position(skip={paid_position}), (self.later, 2), amount="0")
+        items = self.Sync._state(self.company)["items"]
+        self.sync()
+        self.assertEqual(self.mirrored(paid), [])
+        self.assertEqual(self.mirrored(zeroed), [])
+        self.assertEqual(self.Sync._state(self.company)["items"], items - 2)
+        self.assertConsistent()
+
+    def test_deleted_items(self):
+        # A deleted row leaves no audit stamp: only the full reload notices it
+        doc = self.ledger.docs.pop(self.open_position())
+        self.changed()
+        self.assertEqual(self.sync()["changed"], self.idle)
+        check = self.Bridge.check_mirror_consistency(sync=False)
+        self.assertFalse(check["ok"])
+        self.assertEqual(check["mismatched"], ["/%s" % doc[0].strip()])
+
+        self.assertTrue(self.Sync.sync(full=True)[self.company]["full"])
+        self.assertEqual(self.mirrored(doc), [])
+        self.assertConsistent()
+
+    def test_source_mirror_matches_live(self):
+        self.edit(self.open_position(), (self.later, 0), amount="310.250", due=self.today + timedelta(days=3))
+        self.sync()
+        live = self.Bridge.with_context(mssql_source="mssql").get_aging_by_customer()
+
+        self.env["ir.config_parameter"].sudo().set_param("mssql.source", "mirror")
+        self.fake.kinds.clear()
+        mirror = self.Bridge.get_aging_by_customer()
+        self.assertEqual(sum(self.fake.kinds.values()), 0, "mssql.source=mirror must not query MSSQL")
+        self.assertEqual(len(mirror), len(live))
+        self.assertEqual(mirror.codes, live.codes)
+        self.assertEqual(aging_incremental.diff_rows(live, mirror), [])
+
+
+class TestChangedItemsStatement(BaseCase):
+    """MIRROR_CHANGED_ITEMS_SQL itself, on SQLite (the fake server above only classifies it)."""
+
+    def test_watermark_comparison(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.execute("""
+            CREATE TABLE AROBL (IDCUST TEXT, IDINVC TEXT, CNTPAYM INTEGER, DATEDUE INTEGER, IDORDERNBR TEXT,
+                                IDCUSTPO TEXT, DESCINVC TEXT, AMTDUEHC NUMERIC, SWPAID INTEGER,
+                                AUDTDATE INTEGER, AUDTTIME INTEGER)
+        """)
+        mark = (20250630, 12000000)
+        rows = [
+            ("BEFORE_DAY", 20250629, 23595999, 0, 10),
+            ("BEFORE_TICK", 20250630, 11595999, 0, 10),
+            ("TIE", 20250630, 12000000, 0, 10),
+            ("AFTER_TICK", 20250630, 12000001, 0, 10),
+            ("AFTER_DAY", 20250701, 0, 0, 10),
+            ("PAID", 20250701, 1, 1, 10),
+            ("ZEROED", 20250701, 2, 0, 0),
+        ]
+        conn.executemany(
+            "INSERT INTO AROBL VALUES ('C1', ?, 1, 20250601, '', '', '', ?, ?, ?, ?)",
+            [(idinvc, amount, paid, audtdate, audttime) for idinvc, audtdate, audttime, paid, amount in rows],
+        )
+        changed = conn.execute(aging_mirror.MIRROR_CHANGED_ITEMS_SQL, [mark[0], mark[0], mark[1]]).fetchall()
+        self.assertEqual(
+            {row[1]: row[8] for row in changed},
+            {"TIE": 1, "AFTER_TICK": 1, "AFTER_DAY": 1, "PAID": 0, "ZEROED": 0},
+        )
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from datetime import date, timedelta
+
+from odoo.tests import BaseCase
+
+from odoo.addons.mssql_bridge.controllers import api
+from odoo.addons.mssql_bridge.models import bridge
+from odoo.addons.mssql_bridge.models.aging_result import AMOUNT_COLUMNS
+from odoo.addons.mssql_bridge.models.aging_rules import BUCKET_KEYS, DEFAULT_BOUNDARIES
+from odoo.addons.mssql_bridge.models.aging_store import InvoiceStore, parse_boundaries
+
+from .common import FakeSageCase, bench_aging_sql
+
+AS_OF_DATES = (date(2025, 3, 31), date(2024, 2, 29), date(2025, 1, 1))
+
+
+def _ledger(as_of, boundaries):
+    """AROBL rows ``(idcust, idinvc, datedue, amount)`` around the bucket edges of ``as_of``."""
+    ymd = lambda d: int(d.strftime("%Y%m%d"))  # noqa: E731
+    days = {0, 1}
+    for boundary in boundaries:
+        days.update((boundary - 1, boundary, boundary + 1))
+    rows = []
+    for age in sorted(days | {400}):
+        # One customer per age, so a misplaced edge shows as that customer
+        rows.append(("AGE%03d" % age, "I%05d" % age, ymd(as_of - timedelta(days=age)), 100.0 + age))
+    rows += [
+        ("FUTURE", "I90001", ymd(as_of + timedelta(days=1)), 11.5),
+        ("FUTURE", "I90002", ymd(as_of + timedelta(days=400)), 12.25),
+        ("NODUE", "I90003", None, 13.0),
+        ("NODUE", "I90004", 0, 14.0),
+        # Negative payments / credit notes are current whatever their due date
+        ("MIXED", "P90005", ymd(as_of - timedelta(days=200)), -40.0),
+        ("MIXED", "C90006", ymd(as_of - timedelta(days=45)), -5.5),
+        ("MIXED", "C90007", ymd(as_of - timedelta(days=45)), 7.25),
+        ("MIXED", "I90008", ymd(as_of - timedelta(days=boundaries[-1] + 1)), -3.0),
+        ("MIXED", "I90009", ymd(as_of - timedelta(days=boundaries[0])), 250.0),
+        ("MIXED", "D90010", ymd(as_of), 0.0),
+        # Nets to zero: not a dashboard customer
+        ("ZERO", "I90011", ymd(as_of - timedelta(days=5)), 60.0),
+        ("ZERO", "C90012", ymd(as_of - timedelta(days=95)), -60.0),
+    ]
+    return rows
+
+
+def _sql_aging(rows, as_of, boundaries):
+    """``{code: {bucket: amount}}`` from the bridge's bucket_case, run on SQLite."""
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.executescript(bench_aging_sql.SCHEMA)
+        conn.executemany(
+            "INSERT INTO AROBL (IDCUST, IDINVC, CNTPAYM, DATEDUE, AMTDUEHC, SWPAID) VALUES (?, ?, 1, ?, ?, 0)",
+            rows,
+        )
+        result = conn.execute(f"""
+            SELECT bl.IDCUST, {bridge.bucket_case("bl")}, SUM(bl.AMTDUEHC)
+            FROM AROBL bl {bench_aging_sql.SQLITE_BOUNDS_JOIN}
+            WHERE {bridge.OPEN_ITEM_FILTER.format(a="bl")}
+            GROUP BY 1, 2
+        """, bench_aging_sql.bounds(as_of, boundaries)).fetchall()
+    finally:
+        conn.close()
+    aging = {}
+    for code, bucket, amount in result:
+        aging.setdefault(code, dict.fromkeys(BUCKET_KEYS, 0.0))[bucket] += amount
+    for amounts in aging.values():
+        amounts["total"] = sum(amounts[b] for b in BUCKET_KEYS)
+    return {code: amounts for code, amounts in aging.items() if round(amounts["total"], 3)}
+
+
+class TestInvoiceStore(BaseCase):
+
+    def assertSameAging(self, as_of, boundaries):
+        rows = _ledger(as_of, boundaries)
+        store = InvoiceStore.from_parts([(None, [
+            (idcust, "Name of %s" % idcust, datedue, amount, idinvc[:1])
+            for idcust, idinvc, datedue, amount in rows
+        ])])
+        expected = _sql_aging(rows, as_of, boundaries)
+        result = store.aging(as_of, boundaries)
+        self.assertEqual(result.codes, sorted(expected))
+        for i, code in enumerate(result.codes):
+            for col in AMOUNT_COLUMNS:
+                self.assertAlmostEqual(result.columns[col][i], expected[code][col], places=3,
+                                       msg="%s %s as of %s, boundaries %s" % (code, col, as_of, boundaries))
+        return result
+
+    def test_matches_bucket_case(self):
+        for as_of in AS_OF_DATES + (date.today(),):
+            result = self.assertSameAging(as_of, DEFAULT_BOUNDARIES)
+            row = result.row(result.codes.index("MIXED"))
+            self.assertAlmostEqual(row["current"], -45.5)
+            self.assertAlmostEqual(row["d90p"], -3.0)
+
+    def test_edges(self):
+        result = self.assertSameAging(AS_OF_DATES[0], DEFAULT_BOUNDARIES)
+        where = {code: next(col for col in BUCKET_KEYS if result.columns[col][i])
+                 for i, code in enumerate(result.codes) if code.startswith("AGE")}
+        self.assertEqual(where, {
+            "AGE000": "d0_30", "AGE001": "d0_30", "AGE029": "d0_30", "AGE030": "d0_30",
+            "AGE031": "d31_60", "AGE059": "d31_60", "AGE060": "d31_60",
+            "AGE061": "d61_90", "AGE089": "d61_90", "AGE090": "d61_90",
+            "AGE091": "d90p", "AGE400": "d90p",
+        })
+        self.assertNotIn("ZERO", result.codes)
+        future, nodue = (result.row(result.codes.index(code)) for code in ("FUTURE", "NODUE"))
+        self.assertAlmostEqual(future["current"], 23.75)
+        self.assertAlmostEqual(nodue["d90p"], 27.0)
+
+    def test_custom_boundaries(self):
+        for value in ("15,45,75", "7; 14; 21", [1, 2, 365]):
+            for as_of in AS_OF_DATES:
+                self.assertSameAging(as_of, parse_boundaries(value))
+
+    def test_json_round_trip(self):
+        as_of = AS_OF_DATES[0]
+        rows = _ledger(as_of, DEFAULT_BOUNDARIES)
+        store = InvoiceStore.from_parts([(None, [
+            (idcust, idcust, datedue, amount, idinvc[:1]) for idcust, idinvc, datedue, amount in rows
+        ])])
+        copy = InvoiceStore.coerce(store.to_json())
+        self.assertEqual(list(copy.aging(as_of, (15, 45, 75))), list(store.aging(as_of, (15, 45, 75))))
+
+    def test_parse_boundaries(self):
+        self.assertEqual(parse_boundaries(""), DEFAULT_BOUNDARIES)
+        self.assertEqual(parse_boundaries(None), DEFAULT_BOUNDARIES)
+        self.assertEqual(parse_boundaries("15, 45 ,75"), (15, 45, 75))
+        self.assertEqual(parse_boundaries("15;45;75"), (15, 45, 75))
+        self.assertEqual(parse_boundaries(["30", 60, 90]), (30, 60, 90))
+        for value in ("a,b,c", "30,60", "30,60,90,120", "0,30,60", "60,30,90", "30,30,90", "-5,30,60", "1.5,3,9"):
+            with self.assertRaises(ValueError, msg=value):
+                parse_boundaries(value)
+
+
+class TestStoreRefresh(FakeSageCase):
+
+    def test_refresh_kinds(self):
+        self.assertEqual(api._refresh_kind(" Store "), "store")
+        self.assertEqual(api._refresh_kind(None), "aging")
+        self.assertEqual(api._refresh_kind("bucket:d90p"), "bucket:d90p")
+        self.assertIsNone(api._refresh_kind("bucket:d120p"))
+        self.assertIsNone(api._refresh_kind("stores"))
+
+    def test_refresh_store(self):
+        # What the Refresh button rebuilds while the dashboard shows an as-of date
+        count = self.Bridge._refresh_kind("store")
+        self.assertEqual(dict(self.fake.kinds), {"store_items": 1})
+        self.assertEqual(count, len(self.ledger.allowed_customers()))
+        store = self.Bridge.get_store_snapshot(stale_ok=True)["store"]
+        live = self.Bridge.get_aging_by_customer()
+        self.assertEqual(store.aging(self.today).codes, live.codes)
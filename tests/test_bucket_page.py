@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo.addons.mssql_bridge.controllers import api
+from odoo.addons.mssql_bridge.models.aging_rules import BUCKET_KEYS
+
+from .common import FakeSageCase
+
+
+class TestBucketPage(FakeSageCase):
+
+    def setUp(self):
+        super().setUp()
+        # The row windows reuse the snapshots the page shell loaded
+        self.env["ir.config_parameter"].sudo().set_param("mssql.aging_cache_ttl", "300")
+
+    def render(self, bucket):
+        """What one page view costs: the shell, then the groups and first row window of recv_bucket.js."""
+        values = api._bucket_page_values(self.Bridge, bucket, force=True)
+        _snap, _inv_snap, index, _version = api._bucket_index(self.Bridge, bucket)
+        index.groups(index.full)
+        index.rows_at(index.full, 0)
+        return values, index
+
+    def customers(self, index):
+        return {group[1] for group in index.groups(index.full)}
+
+    def test_one_invoice_query_per_render(self):
+        for bucket in BUCKET_KEYS:
+            self.fake.kinds.clear()
+            values, _index = self.render(bucket)
+            # The aging (customers and card amounts) and every line of the bucket in one
+            # statement: no query per customer, however many customers the bucket has
+            self.assertEqual(dict(self.fake.kinds), {"aging": 1, "bucket_invoices": 1}, bucket)
+            self.assertGreater(values["customer_count"], 1, bucket)
+
+    def test_totals_match_the_cards(self):
+        cards = self.Bridge.get_aging_snapshot(force=True)["rows"].totals()
+        for bucket in BUCKET_KEYS:
+            values, _index = self.render(bucket)
+            self.assertAlmostEqual(values["total"], cards[bucket], places=2, msg=bucket)
+
+    def test_zero_net_customers_skipped(self):
+        today = self.today
+        # Nets to zero in d90p only: listed under current, not under 90+ days
+        self.add_customer("ZBUCKET")
+        self.add_doc("ZBUCKET", "I900000001", today - timedelta(days=120), "100.000")
+        self.add_doc("ZBUCKET", "D900000002", today - timedelta(days=150), "-100.000")
+        self.add_doc("ZBUCKET", "I900000003", today + timedelta(days=10), "50.000")
+        # Nets to zero overall: not a dashboard customer, on no bucket page
+        self.add_customer("ZTOTAL")
+        self.add_doc("ZTOTAL", "I900000004", today - timedelta(days=10), "70.000")
+        self.add_doc("ZTOTAL", "D900000005", today - timedelta(days=40), "-70.000")
+
+        self.assertNotIn("ZBUCKET", self.customers(self.render("d90p")[1]))
+        self.assertIn("ZBUCKET", self.customers(self.render("current")[1]))
+        for bucket in ("d0_30", "d31_60"):
+            self.assertNotIn("ZTOTAL", self.customers(self.render(bucket)[1]), bucket)
+
+    def test_lines_netting_to_zero_skipped(self):
+        # The card says 25.0 (aging computed before a credit was entered), the lines now net to 0
+        dash = [
+            {"customer_code": "A", "customer_name": "Alpha", "d0_30": 25.0, "total": 25.0},
+            {"customer_code": "B", "customer_name": "Beta", "d0_30": 40.0, "total": 40.0},
+            {"customer_code": "C", "customer_name": "Gamma", "d0_30": 0.0, "current": 5.0, "total": 5.0},
+        ]
+        invoices = [
+            {"customer_code": "A ", "IDINV": "I1", "AMTINVCHC": 25.0},
+            {"customer_code": "A ", "IDINV": "C2", "AMTINVCHC": -25.0},
+            {"customer_code": "B ", "IDINV": "I3", "AMTINVCHC": 40.0},
+            {"customer_code": "C ", "IDINV": "I4", "AMTINVCHC": 5.0},
+            {"customer_code": "X ", "IDINV": "I5", "AMTINVCHC": 9.0},
+        ]
+        rows = api._build_bucket_rows(dash, invoices, "d0_30")
+        self.assertEqual([(r["customer_code"], r["IDINV"]) for r in rows], [("B", "I3")])
+        self.assertEqual(rows[0]["customer_name"], "Beta")
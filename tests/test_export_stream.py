@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+from odoo.tests import BaseCase
+
+from odoo.addons.mssql_bridge.controllers import api
+from odoo.addons.mssql_bridge.models import mssql_pool
+from odoo.addons.mssql_bridge.models.aging_rules import BUCKET_KEYS
+
+from .common import FakeSageCase
+
+SMALL, LARGE = 50000, 300000
+LINES_PER_CUSTOMER = 40
+# Far below what LARGE rows take once materialised (hundreds of MB)
+PEAK_LIMIT = 32 * 1024 * 1024
+
+INVOICE_DATE = date(2025, 1, 31)
+
+
+def _invoice(n):
+    """Row ``n`` of a bucket_invoices_sql() result set, as pyodbc returns it."""
+    customer = n // LINES_PER_CUSTOMER
+    return (
+        "C%07d    " % customer, "Customer %07d" % customer, "I%09d" % n, INVOICE_DATE, INVOICE_DATE,
+        "ORD%08d" % n, "PO%08d" % n, "Invoice %d" % n, Decimal("%d.125" % (n % 5000 + 1)),
+        BUCKET_KEYS[n % len(BUCKET_KEYS)],
+    )
+
+
+def _export_tuples(count):
+    for n in range(count):
+        row = _invoice(n)
+        yield (row[0].strip(), row[1], row[9], row[2], row[3].isoformat(), row[5], row[6], row[7], float(row[8]))
+
+
+def _csv_size(rows):
+    return sum(len(chunk) for chunk in api._csv_chunks(api._export_rows(rows)))
+
+
+def _peak(consume, count):
+    """tracemalloc peak (bytes) of ``consume(count)``."""
+    tracemalloc.start()
+    try:
+        consume(count)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class BoundedMemoryMixin:
+
+    def assertBounded(self, consume):
+        small, large = _peak(consume, SMALL), _peak(consume, LARGE)
+        # Six times the rows, (about) the same peak: nothing is kept per row
+        msg = "peak %s bytes for %s rows, %s for %s" % (large, LARGE, small, SMALL)
+        self.assertLess(large, PEAK_LIMIT, msg)
+        self.assertLess(large, small * 1.5 + 256 * 1024, msg)
+
+
+class LazyCursor:
+    """Generates the rows on fetch: the fake server itself holds none."""
+
+    def __init__(self, count):
+        self._count = count
+        self._pos = 0
+        self._health = False
+        self.description = None
+
+    def execute(self, sql, *params):
+        self._health = sql.strip() == "SELECT 1"
+        self._pos = 0
+        return self
+
+    def fetchone(self):
+        return (1,) if self._health else None
+
+    def fetchmany(self, size=1):
+        end = min(self._pos + size, self._count)
+        rows = [_invoice(n) for n in range(self._pos, end)]
+        self._pos = end
+        return rows
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LazyPyodbc:
+    class Error(Exception):
+        pass
+
+    SQL_DECIMAL = 3
+    SQL_NUMERIC = 2
+    SQL_TYPE_DATE = 91
+
+    def __init__(self, count=0):
+        self.count = count
+
+    def connect(self, conn_str, timeout=0, autocommit=False, **kw):
+        return LazyConnection(self)
+
+
+class LazyConnection:
+    def __init__(self, server):
+        self._server = server
+        self.timeout = 0
+
+    def cursor(self):
+        return LazyCursor(self._server.count)
+
+    def add_output_converter(self, sqltype, func):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestExportStream(BoundedMemoryMixin, BaseCase):
+
+    def test_csv_export_memory_bounded(self):
+        def consume(count):
+            self.assertGreater(_csv_size(_export_tuples(count)), count * 40)
+
+        self.assertBounded(consume)
+
+    def test_export_rows_keeps_every_line(self):
+        self.assertEqual(sum(1 for _row in api._export_rows(_export_tuples(10000))), 10000)
+
+
+class TestExportQueryStream(BoundedMemoryMixin, FakeSageCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = LazyPyodbc()
+        self.patch(mssql_pool, "pyodbc", self.server)
+
+    def test_iter_invoices_memory_bounded(self):
+        # Cursor batches through the row decoding, the export rules and the CSV writer
+        def consume(count):
+            self.server.count = count
+            self.assertGreater(_csv_size(self.Bridge.iter_invoices_by_bucket(None)), count * 40)
+
+        self.assertBounded(consume)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from odoo.exceptions import UserError
+from odoo.tests import BaseCase
+
+from odoo.addons.mssql_bridge.models import bridge, mssql_pool, query_guard
+from odoo.addons.mssql_bridge.models.query_metrics import QuerySpan
+
+
+class ExhaustedPool:
+    def acquire(self):
+        raise mssql_pool.PoolExhausted("no free MSSQL connection after 5s")
+
+    def release(self, conn, discard=False):
+        raise AssertionError("nothing was acquired")
+
+
+def _borrow(pool, breaker):
+    with bridge._borrowed(pool, QuerySpan("test_guard"), breaker=breaker):
+        pass
+
+
+class TestCircuitBreaker(BaseCase):
+
+    def half_open_breaker(self):
+        breaker = query_guard.CircuitBreaker("test", threshold=1, cooldown=30)
+        breaker.failure("timeout")
+        self.assertEqual(breaker.state, query_guard.OPEN)
+        # Cooldown over: the next block is the half-open trial
+        breaker.opened_at -= breaker.cooldown + 1
+        return breaker
+
+    def test_half_open_trial_released_when_pool_exhausted(self):
+        breaker = self.half_open_breaker()
+        with self.assertRaises(UserError):
+            _borrow(ExhaustedPool(), breaker)
+        # No query ran: still half open, and the next block may try
+        self.assertEqual(breaker.state, query_guard.HALF_OPEN)
+        self.assertEqual(breaker.failures, 1)
+        breaker.before()
+        breaker.success()
+        self.assertEqual(breaker.state, query_guard.CLOSED)
+
+    def test_one_trial_at_a_time(self):
+        breaker = self.half_open_breaker()
+        breaker.before()
+        with self.assertRaises(query_guard.CircuitOpen):
+            breaker.before()
+        breaker.failure("timeout again")
+        self.assertEqual(breaker.state, query_guard.OPEN)
+        with self.assertRaises(query_guard.CircuitOpen):
+            breaker.check()
+
+    def test_exhausted_pool_does_not_open_the_circuit(self):
+        breaker = query_guard.CircuitBreaker("test", threshold=1, cooldown=30)
+        with self.assertRaises(UserError):
+            _borrow(ExhaustedPool(), breaker)
+        self.assertEqual(breaker.state, query_guard.CLOSED)
+        self.assertEqual(breaker.failures, 0)